@@ -0,0 +1,74 @@
+"""
+Checkpoint load time against the length of the checkpoint history.
+
+Writes runs of `--checkpoints-per-run` checkpoints, once all in a single thread as when every run reused
+`llm.thread_id`, and once in a thread per run as `CheckpointHistory` does, then times loading the latest
+checkpoint of the last run after each history length.
+
+    python benchmarks/checkpoint_load.py --mongo-url mongodb://localhost:27017 --runs 10 100 1000
+
+The benchmark uses its own database, dropped when done.
+"""
+import argparse
+import statistics
+import time
+import uuid
+
+from langgraph.checkpoint.base import empty_checkpoint, create_checkpoint
+from langgraph.checkpoint.mongodb import MongoDBSaver
+from pymongo import MongoClient
+
+
+def write_run(saver: MongoDBSaver, thread_id: str, checkpoints: int, payload: str):
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    checkpoint = empty_checkpoint()
+    for step in range(checkpoints):
+        checkpoint = create_checkpoint(checkpoint, None, step, id=str(uuid.uuid4()))
+        checkpoint["channel_values"] = {"messages": payload}
+        config = saver.put(config, checkpoint, {"step": step}, {})
+        saver.put_writes(config, [("messages", payload)], task_id=str(uuid.uuid4()))
+
+
+def time_load(saver: MongoDBSaver, thread_id: str, repeat: int) -> float:
+    """Median seconds to load the latest checkpoint of a thread."""
+    config = {"configurable": {"thread_id": thread_id}}
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        saver.get_tuple(config)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mongo-url", default="mongodb://localhost:27017")
+    parser.add_argument("--runs", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--checkpoints-per-run", type=int, default=20)
+    parser.add_argument("--payload-bytes", type=int, default=4096)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    client = MongoClient(args.mongo_url)
+    db_name = f"aegis_benchmark_{uuid.uuid4().hex[:8]}"
+    saver = MongoDBSaver(client, db_name=db_name)
+    payload = "x" * args.payload_bytes
+    try:
+        print(f"{'runs':>8} {'single thread (ms)':>20} {'thread per run (ms)':>20}")
+        written = 0
+        last_run_thread = ""
+        for runs in sorted(args.runs):
+            for _ in range(runs - written):
+                write_run(saver, "single", args.checkpoints_per_run, payload)
+                last_run_thread = f"run:{uuid.uuid4()}"
+                write_run(saver, last_run_thread, args.checkpoints_per_run, payload)
+            written = runs
+            single = time_load(saver, "single", args.repeat)
+            per_run = time_load(saver, last_run_thread, args.repeat)
+            print(f"{runs:>8} {single * 1000:>20.2f} {per_run * 1000:>20.2f}")
+    finally:
+        client.drop_database(db_name)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+"""
+Prompt size and latency of each prompt format on a generated book.
+
+Renders the instruments and a batch of users with `JsonPromptEncoder` and `CompactPromptEncoder`, the
+`agent.prompt_format` choices, and reports the estimated tokens and the encoding time of each:
+
+    python benchmarks/prompt_encoding.py --users 200 --positions 3 --instruments 40 --hours 168
+
+With `--model`, the prompts are also sent to the model, which reports the tokens it counted and the end-to-end
+latency of the call, encoding included. The model is given as for `llm.operator_model` and needs its API key.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from langchain_core.messages import HumanMessage
+
+from autofi_core.common.messages import HelperGetInvestment, HelperGetInstrument, HelperGetInstrumentData, Position
+from autofi_core.common.model import AegisUserModel, MandateModel, PositionMetaModel, PositionDataModel, \
+    AutoTransactionModel
+from autofi_agent.graph.misc import load_chat_model
+from autofi_agent.prompt.encoding import PROMPT_ENCODERS, PromptEncoder, estimate_tokens
+from autofi_agent.prompt.summary import summarize_instruments
+
+
+def address(rng: random.Random) -> str:
+    return "0x" + "".join(rng.choices("0123456789abcdef", k=40))
+
+
+def generate_instruments(rng: random.Random, count: int, hours: int) -> list[HelperGetInstrument]:
+    now = int(time.time())
+    assets = [(address(rng), symbol) for symbol in ("USDC", "USDT", "WETH", "DAI")]
+    instruments = []
+    for i in range(count):
+        asset, symbol = rng.choice(assets)
+        instruments.append(HelperGetInstrument(
+            instrument_id=str(i + 1),
+            chain_id=rng.choice(["1", "8453"]),
+            protocol_name=rng.choice(["aave", "morpho", "compound", "euler"]),
+            strategy_type=str(i % 3 + 1),
+            underlying_asset=asset,
+            symbol=symbol,
+            curator=rng.choice(["", "gauntlet", "steakhouse"]),
+            is_erc4626=True,
+            erc4626_vault_address=address(rng),
+            pool_address=address(rng),
+            update_at=now,
+            instrument_data=[HelperGetInstrumentData(
+                hourly_timestamp=now - h * 3600,
+                apy=f"{rng.uniform(0.01, 0.15):.6f}",
+                supply_amount=f"{rng.uniform(1e5, 1e8):.2f}",
+                supply_amount_usd=f"{rng.uniform(1e5, 1e8):.2f}",
+                borrow_amount=f"{rng.uniform(1e4, 1e7):.2f}",
+                utilization=f"{rng.uniform(0.3, 0.95):.4f}",
+            ) for h in range(hours)],
+        ))
+    return instruments
+
+
+def generate_investment(rng: random.Random, uid: str, positions: int) -> HelperGetInvestment:
+    now = int(time.time())
+    smart_address = address(rng)
+    strategy = str(rng.randint(1, 3))
+    data = []
+    for _ in range(positions):
+        chain_id = rng.choice(["1", "8453"])
+        instrument_id = rng.randint(1, 40)
+        asset = address(rng)
+        data.append(Position(
+            position_meta=PositionMetaModel(ID=rng.randint(1, 10 ** 6), chain_id=chain_id,
+                                            instrument_id=instrument_id, instrument_type="erc4626",
+                                            smart_address=smart_address, asset=asset),
+            position_data=PositionDataModel(chain_id=chain_id, instrument_id=instrument_id, instrument_type="erc4626",
+                                            daily_timestamp=now, hourly_timestamp=now, smart_address=smart_address,
+                                            asset=asset, asset_amount=f"{rng.uniform(10, 1e5):.6f}",
+                                            asset_amount_usd=f"{rng.uniform(10, 1e5):.2f}", shares="0",
+                                            pnl_usd=f"{rng.uniform(-100, 500):.2f}", roe_usd="0",
+                                            timestamp=now - rng.randint(0, 30 * 86400)),
+        ))
+    return HelperGetInvestment(
+        user=AegisUserModel(uid=uid, user_address=address(rng), agent_address=address(rng),
+                            smart_address=smart_address),
+        mandate=MandateModel(uid=uid, current_strategy=strategy, next_strategy=strategy),
+        positions=data,
+        last_transaction=AutoTransactionModel(
+            chain_id="8453", block_number=rng.randint(1, 10 ** 7), log_id="0", tx_hash=address(rng),
+            tx_time=now - rng.randint(0, 7 * 86400), uid=uid, agent_address=address(rng),
+            smart_address=smart_address, token0_address=address(rng), token0_volume="0",
+            token1_address=address(rng), token1_volume="0", instrument_id=1, type="deposit", sub_type=""),
+        uninvested_value=f"{rng.uniform(0, 1e4):.2f}",
+        blacklist_protocol_names=rng.sample(["aave", "euler"], k=rng.randint(0, 1)),
+    )
+
+
+def encode(encoder: PromptEncoder, instruments: list[HelperGetInstrument], investments: dict[str, HelperGetInvestment],
+           summarized: bool) -> tuple[str, str]:
+    summaries = summarize_instruments(instruments) if summarized else None
+    blocks = [encoder.user_investment(uid, investment) for uid, investment in investments.items()]
+    return encoder.instruments(instruments, summaries), encoder.user_investments(blocks)
+
+
+def time_encoding(encoder: PromptEncoder, instruments: list[HelperGetInstrument],
+                  investments: dict[str, HelperGetInvestment], summarized: bool, repeat: int) -> float:
+    """Median seconds to render the instruments and the users."""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        encode(encoder, instruments, investments, summarized)
+        timings.append(time.perf_counter() - start)
+    return statistics.median(timings)
+
+
+async def time_model(model, encoder: PromptEncoder, instruments: list[HelperGetInstrument],
+                     investments: dict[str, HelperGetInvestment], summarized: bool,
+                     repeat: int) -> tuple[float, int | None]:
+    """Median seconds from encoding to the model's answer, and the input tokens the model counted."""
+    timings = []
+    input_tokens = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        instruments_info, investments_info = encode(encoder, instruments, investments, summarized)
+        result = await model.ainvoke([HumanMessage(content=f"{instruments_info}\n\n{investments_info}\n\n"
+                                                           f"Reply with the number of users only.")])
+        timings.append(time.perf_counter() - start)
+        input_tokens = (result.usage_metadata or {}).get("input_tokens")
+    return statistics.median(timings), input_tokens
+
+
+async def run(args):
+    rng = random.Random(args.seed)
+    instruments = generate_instruments(rng, args.instruments, args.hours)
+    investments = {f"user-{i}": generate_investment(rng, f"user-{i}", args.positions) for i in range(args.users)}
+    model = load_chat_model(args.model, None) if args.model else None
+
+    print(f"{'format':>8} {'instruments':>12} {'users':>10} {'encode (ms)':>12} {'model tokens':>13} "
+          f"{'end-to-end (ms)':>16}")
+    for prompt_format, encoder_type in PROMPT_ENCODERS.items():
+        encoder = encoder_type()
+        instruments_info, investments_info = encode(encoder, instruments, investments, args.summarized)
+        encoding = time_encoding(encoder, instruments, investments, args.summarized, args.repeat)
+        model_tokens, latency = "", ""
+        if model is not None:
+            seconds, tokens = await time_model(model, encoder, instruments, investments, args.summarized,
+                                               args.model_repeat)
+            model_tokens, latency = str(tokens), f"{seconds * 1000:.0f}"
+        print(f"{prompt_format:>8} {estimate_tokens(instruments_info):>12} {estimate_tokens(investments_info):>10} "
+              f"{encoding * 1000:>12.2f} {model_tokens:>13} {latency:>16}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--positions", type=int, default=3, help="positions per user")
+    parser.add_argument("--instruments", type=int, default=40)
+    parser.add_argument("--hours", type=int, default=168, help="hourly data points per instrument")
+    parser.add_argument("--summarized", action="store_true", help="render instrument summaries, not hourly data")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--model", default=None, help="e.g. openai/gpt-4o-mini, no model call when unset")
+    parser.add_argument("--model-repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Per-call latency of a helper tool called through each tool transport.
+
+Calls the tool `--calls` times, one call at a time, as the agents would:
+
+- stdio: a helper process spawned for each call, `mcp.tool_transport = "stdio"` without the session pool
+- pooled: one helper session kept open by `McpSessionPool`, `mcp.session_pool_enabled`
+- in_process: the helper function called in this process, `mcp.tool_transport = "in_process"`
+
+    python benchmarks/tool_latency.py --server investment_expert_helper --tool get_instruments --calls 20
+
+The helpers are configured as for the agent, and the tool needs the services it requests over NATS. The default
+tool only reads, prefer it to tools with side effects such as create_intent_transaction.
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.client import MultiServerMCPClient
+
+from autofi_core import config, build_mcp_config, close_nats_connection
+from autofi_agent.mcp.pool import McpSessionPool
+from autofi_agent.mcp.in_process import get_in_process_tools
+
+
+def find_tool(tools: list[BaseTool], name: str) -> BaseTool:
+    for tool in tools:
+        if tool.name == name:
+            return tool
+    raise ValueError(f"Tool {name} not found")
+
+
+async def time_calls(tool: BaseTool, arguments: dict, calls: int) -> list[float]:
+    timings = []
+    for _ in range(calls):
+        start = time.perf_counter()
+        await tool.ainvoke(arguments)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+async def run(args):
+    arguments = json.loads(args.arguments)
+    results = {}
+
+    tools = await MultiServerMCPClient(build_mcp_config([args.server])).get_tools()
+    results["stdio"] = await time_calls(find_tool(tools, args.tool), arguments, args.calls)
+
+    pool = McpSessionPool(build_mcp_config([args.server]),
+                          health_check_interval=config.mcp.health_check_interval,
+                          health_check_timeout=config.mcp.health_check_timeout,
+                          start_timeout=config.mcp.start_timeout,
+                          restart_backoff=config.mcp.restart_backoff)
+    pool.start()
+    try:
+        tool = find_tool(await pool.get_tools(args.server), args.tool)
+        # the first call would otherwise include the helper start
+        await tool.ainvoke(arguments)
+        results["pooled"] = await time_calls(tool, arguments, args.calls)
+    finally:
+        await pool.close()
+
+    tool = find_tool(get_in_process_tools(args.server), args.tool)
+    await tool.ainvoke(arguments)
+    results["in_process"] = await time_calls(tool, arguments, args.calls)
+    await close_nats_connection()
+
+    print(f"{'transport':>12} {'median (ms)':>12} {'p95 (ms)':>12}")
+    for transport, timings in results.items():
+        p95 = statistics.quantiles(timings, n=20)[-1] if len(timings) > 1 else timings[0]
+        print(f"{transport:>12} {statistics.median(timings) * 1000:>12.2f} {p95 * 1000:>12.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--server", default="investment_expert_helper")
+    parser.add_argument("--tool", default="get_instruments")
+    parser.add_argument("--arguments", default="{}", help="JSON arguments of the tool")
+    parser.add_argument("--calls", type=int, default=20)
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
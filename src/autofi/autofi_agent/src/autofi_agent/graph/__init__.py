@@ -1,4 +1,7 @@
 from .graph import build_graph
+from .loader import shard_user_scope
+from .state import RUN_MODE_FULL, RUN_MODE_RECOMMEND, RUN_MODE_SHARD, RUN_MODE_TARGETED
 
 
-__all__ = ["build_graph"]
+__all__ = ["build_graph", "shard_user_scope", "RUN_MODE_FULL", "RUN_MODE_RECOMMEND", "RUN_MODE_SHARD",
+           "RUN_MODE_TARGETED"]
@@ -0,0 +1,81 @@
+import hashlib
+import time
+from typing import Any
+
+from langchain_core.messages import BaseMessage, ToolMessage
+
+from autofi_core import config as aegis_config
+from autofi_core.common.cache import TieredCache
+from autofi_core.common.stats import artifact_counter
+
+
+ARTIFACT_REF_PREFIX = "aegis-artifact:"
+
+
+class ArtifactMissing(Exception):
+    pass
+
+
+class ArtifactStore:
+    """
+    Content-addressed side-store for large texts, such as tool outputs and rendered user investments, so the
+    state and its checkpoints only carry a short reference to them.
+
+    Texts of at least `min_size` characters are kept in the tiered cache for `ttl` seconds under their sha256,
+    shared through Redis by the replicas. References are resolved back to the texts when prompts are rendered.
+    """
+
+    def __init__(self, enabled: bool, min_size: int, ttl: int):
+        self.enabled = enabled
+        self.min_size = min_size
+        self.ttl = ttl
+        self.cache: TieredCache[str] = TieredCache("artifacts", encode=lambda text: text, decode=lambda text: text,
+                                                  max_entries=256)
+
+    async def offload(self, text: str) -> str:
+        """Reference of `text` once stored, `text` itself when small or when the store is disabled."""
+        if not self.enabled or not isinstance(text, str) or len(text) < self.min_size:
+            return text
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        await self.cache.put(digest, text, expires_at=time.time() + self.ttl)
+        artifact_counter.labels("stored").inc()
+        return f"{ARTIFACT_REF_PREFIX}{digest}"
+
+    async def resolve(self, value: Any) -> Any:
+        """Text referenced by `value`, `value` itself when it is not a reference."""
+        if not isinstance(value, str) or not value.startswith(ARTIFACT_REF_PREFIX):
+            return value
+        digest = value[len(ARTIFACT_REF_PREFIX):]
+
+        async def missing() -> str:
+            artifact_counter.labels("missing").inc()
+            raise ArtifactMissing(f"Artifact {digest} expired or was never stored")
+
+        return await self.cache.get_or_load(digest, missing, expires_at=time.time() + self.ttl)
+
+    async def offload_messages(self, messages: list[BaseMessage] | None) -> list[BaseMessage]:
+        """Copies of the large tool messages with a reference as content, replacing them by id in the state."""
+        offloaded = []
+        for message in messages or []:
+            if isinstance(message, ToolMessage) and isinstance(message.content, str):
+                content = await self.offload(message.content)
+                if content is not message.content:
+                    offloaded.append(message.model_copy(update={"content": content}))
+        return offloaded
+
+    async def resolve_messages(self, messages: list[BaseMessage] | None) -> list[BaseMessage] | None:
+        """Copies of the tool messages whose content is a reference, with the referenced content."""
+        if not messages:
+            return messages
+        resolved = []
+        for message in messages:
+            if isinstance(message, ToolMessage) and isinstance(message.content, str) \
+                    and message.content.startswith(ARTIFACT_REF_PREFIX):
+                message = message.model_copy(update={"content": await self.resolve(message.content)})
+            resolved.append(message)
+        return resolved
+
+
+artifact_store = ArtifactStore(enabled=aegis_config.agent.artifact_offload_enabled,
+                               min_size=aegis_config.agent.artifact_min_size,
+                               ttl=aegis_config.agent.artifact_ttl)
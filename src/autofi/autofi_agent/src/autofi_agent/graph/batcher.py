@@ -0,0 +1,40 @@
+from autofi_agent.prompt.encoding import estimate_tokens
+from autofi_core import logger
+
+
+class TokenBudgetBatcher:
+    """
+    Packs users into operator batches by the estimated tokens of their rendered investment blocks.
+
+    The budget of an inclination is halved whenever one of its operator calls fails or is truncated, and
+    doubled back (up to the configured budget) after each successful call.
+    """
+
+    def __init__(self, token_budget: int, min_scale: float = 1 / 8):
+        self.token_budget = token_budget
+        self.min_scale = min_scale
+        self.scale: dict[str, float] = {}
+
+    def budget(self, inclination: str) -> int:
+        return int(self.token_budget * self.scale.get(inclination, 1.0))
+
+    def pack(self, inclination: str, blocks: dict[str, str]) -> list[str]:
+        """Return the uids, in order, whose blocks fit in the budget. At least one user is always packed."""
+        budget = self.budget(inclination)
+        packed = []
+        used = 0
+        for uid, block in blocks.items():
+            tokens = estimate_tokens(block)
+            if packed and used + tokens > budget:
+                break
+            packed.append(uid)
+            used += tokens
+        return packed
+
+    def record_success(self, inclination: str):
+        self.scale[inclination] = min(1.0, self.scale.get(inclination, 1.0) * 2)
+
+    def record_failure(self, inclination: str):
+        self.scale[inclination] = max(self.min_scale, self.scale.get(inclination, 1.0) / 2)
+        logger.warning(f"[TokenBudgetBatcher] Operator batch for inclination {inclination} failed, token budget "
+                       f"reduced to {self.budget(inclination)}")
@@ -0,0 +1,117 @@
+import asyncio
+import copy
+import functools
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Callable, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import Checkpoint, CheckpointMetadata, CheckpointTuple, ChannelVersions
+from langgraph.checkpoint.mongodb import MongoDBSaver
+from pymongo import MongoClient, UpdateOne
+
+from autofi_core.common.stats import checkpoint_time, checkpoint_writes_batch_summary
+
+
+CHECKPOINTER_DEFAULT = "default"
+CHECKPOINTER_OFFLOADED = "offloaded"
+
+
+class _WriteRecorder:
+    """Stands in for the writes collection, keeping the operations of a bulk write to run them later."""
+
+    def __init__(self):
+        self.operations: list[UpdateOne] = []
+
+    def bulk_write(self, operations: list[UpdateOne], *args, **kwargs):
+        self.operations.extend(operations)
+
+
+class OffloadedMongoDBSaver(MongoDBSaver):
+    """
+    MongoDBSaver running its async methods in a dedicated pool of `workers` threads, so checkpoints neither block
+    the event loop nor queue behind other work of the default executor.
+
+    Writes saved concurrently, e.g. by the tasks of a super-step, are grouped into one bulk write of the upserts
+    `put_writes` makes. Each caller still returns once its own writes are saved.
+    """
+
+    def __init__(self, client: MongoClient, db_name: str, workers: int, **kwargs):
+        super().__init__(client, db_name=db_name, **kwargs)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="checkpointer")
+        self.pending_writes: list[tuple[list[UpdateOne], asyncio.Future]] = []
+        self.flushing: asyncio.Task | None = None
+
+    async def _offload(self, operation: str, fn: Callable, *args) -> Any:
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, functools.partial(fn, *args))
+        finally:
+            checkpoint_time.labels(operation).observe(time.perf_counter() - start)
+
+    async def aget_tuple(self, config: RunnableConfig) -> CheckpointTuple | None:
+        return await self._offload("get", self.get_tuple, config)
+
+    async def alist(self, config: RunnableConfig | None, *, filter: dict[str, Any] | None = None,
+                    before: RunnableConfig | None = None, limit: int | None = None) -> AsyncIterator[CheckpointTuple]:
+        # loaded at once, as MongoDBSaver.alist does in the default executor
+        checkpoints = await self._offload(
+            "list", lambda: list(self.list(config, filter=filter, before=before, limit=limit)))
+        for checkpoint_tuple in checkpoints:
+            yield checkpoint_tuple
+
+    async def aput(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata,
+                   new_versions: ChannelVersions) -> RunnableConfig:
+        return await self._offload("put", self.put, config, checkpoint, metadata, new_versions)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        return await self._offload("delete_thread", self.delete_thread, thread_id)
+
+    async def aput_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                          task_path: str = "") -> None:
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            # serializing the values may take a while too
+            operations = await loop.run_in_executor(
+                self.executor, functools.partial(self.write_operations, config, writes, task_id, task_path))
+            saved = loop.create_future()
+            self.pending_writes.append((operations, saved))
+            if self.flushing is None or self.flushing.done():
+                self.flushing = asyncio.create_task(self._flush_writes())
+            await saved
+        finally:
+            checkpoint_time.labels("put_writes").observe(time.perf_counter() - start)
+
+    async def _flush_writes(self):
+        # let the other tasks of the step add their writes first
+        await asyncio.sleep(0)
+        loop = asyncio.get_running_loop()
+        while self.pending_writes:
+            batch, self.pending_writes = self.pending_writes, []
+            operations = [operation for operations, _ in batch for operation in operations]
+            try:
+                if operations:
+                    await loop.run_in_executor(
+                        self.executor, functools.partial(self.writes_collection.bulk_write, operations, ordered=False))
+                checkpoint_writes_batch_summary.observe(len(batch))
+                for _, saved in batch:
+                    if not saved.done():
+                        saved.set_result(None)
+            except Exception as e:
+                for _, saved in batch:
+                    if not saved.done():
+                        saved.set_exception(e)
+
+    def write_operations(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str,
+                         task_path: str) -> list[UpdateOne]:
+        """Upserts of `put_writes`, recorded instead of saved."""
+        recorder = _WriteRecorder()
+        saver = copy.copy(self)
+        saver.writes_collection = recorder
+        MongoDBSaver.put_writes(saver, config, writes, task_id, task_path)
+        return recorder.operations
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+        super().close()
@@ -0,0 +1,92 @@
+from typing import Tuple
+
+from .state import SelectedInstrumentByInclinationState
+from autofi_core import config as aegis_config
+from autofi_core.common.messages import HelperGetInvestment, UserInstrumentsIntent
+
+
+FAST_PATH_NO_ACTION = "no_action"
+FAST_PATH_OBVIOUS_MOVE = "obvious_move"
+FAST_PATH_NEEDS_REASONING = "needs_reasoning"
+
+
+def classify_user(
+    uid: str,
+    investment: HelperGetInvestment,
+    recommendations: list[SelectedInstrumentByInclinationState],
+) -> Tuple[str, UserInstrumentsIntent | None]:
+    """
+    Classify a user by the decision the operator would have to make.
+
+    - no_action: every position is in a highly recommended instrument, nothing is left uninvested and the
+      user did not change strategy.
+    - obvious_move: the user only holds uninvested value, or changed strategy while holding no highly
+      recommended instrument, and a single instrument clearly has the best recommendation score.
+    - needs_reasoning: anything else, left to the operator LLM.
+    """
+    min_score = aegis_config.agent.fast_path_min_score
+    blacklist = set(investment.blacklist_protocol_names or [])
+    allowed = sorted((r for r in recommendations if r["protocol_name"] not in blacklist),
+                     key=lambda r: r["recommendation_score"], reverse=True)
+    if not allowed:
+        return FAST_PATH_NEEDS_REASONING, None
+
+    try:
+        uninvested = float(investment.uninvested_value) if investment.uninvested_value else 0.0
+    except ValueError:
+        return FAST_PATH_NEEDS_REASONING, None
+    has_uninvested = uninvested >= aegis_config.agent.fast_path_min_uninvested_usd
+
+    strongly_recommended = {r["instrument_id"] for r in allowed if r["recommendation_score"] >= min_score}
+    held = {p.position_data.instrument_id for p in investment.positions or []}
+    strategy_changed = investment.mandate.current_strategy != investment.mandate.next_strategy
+
+    if held and held <= strongly_recommended and not has_uninvested and not strategy_changed:
+        return FAST_PATH_NO_ACTION, None
+
+    top = allowed[0]
+    clear_top = top["recommendation_score"] >= min_score and (
+        len(allowed) == 1 or top["recommendation_score"] > allowed[1]["recommendation_score"])
+    if not clear_top:
+        return FAST_PATH_NEEDS_REASONING, None
+
+    if not held and has_uninvested:
+        reason = (f"Investing the uninvested ${investment.uninvested_value} into instrument {top['instrument_id']} "
+                  f"({top['protocol_name']}, APY {top['current_apy']}), the top recommendation with score "
+                  f"{top['recommendation_score']}.")
+    elif held and strategy_changed and not held & strongly_recommended:
+        reason = (f"The user switched strategy, moving positions to instrument {top['instrument_id']} "
+                  f"({top['protocol_name']}, APY {top['current_apy']}), the top recommendation with score "
+                  f"{top['recommendation_score']} for the new strategy.")
+    else:
+        return FAST_PATH_NEEDS_REASONING, None
+
+    return FAST_PATH_OBVIOUS_MOVE, UserInstrumentsIntent(
+        uid=uid,
+        inclined_instrument_id=top["instrument_id"],
+        reason=reason,
+    )
+
+
+def triage_users(
+    investments: dict[str, HelperGetInvestment],
+    recommendations: list[SelectedInstrumentByInclinationState],
+) -> Tuple[dict[str, HelperGetInvestment], list[UserInstrumentsIntent], dict[str, HelperGetInvestment]]:
+    """
+    Split users into those needing no action, those with an obvious intent and those needing reasoning.
+
+    Returns:
+        (no_action, intents, needs_reasoning)
+    """
+    no_action = {}
+    intents = []
+    needs_reasoning = {}
+    for uid, investment in investments.items():
+        path, intent = classify_user(uid, investment, recommendations)
+        if path == FAST_PATH_NO_ACTION:
+            no_action[uid] = investment
+        elif path == FAST_PATH_OBVIOUS_MOVE:
+            intents.append(intent)
+        else:
+            needs_reasoning[uid] = investment
+    return no_action, intents, needs_reasoning
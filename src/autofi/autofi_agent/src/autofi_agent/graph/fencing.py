@@ -0,0 +1,22 @@
+from autofi_core import get_redis_connection, logger, third_party_error_counter
+from .state import FencingToken
+
+
+async def is_fencing_current(fencing: FencingToken | None) -> bool:
+    """
+    Whether no lock acquisition newer than the one a run was started under happened, so the run may still write.
+    Runs without a fencing token, and checks failing on Redis errors, are regarded as current.
+    """
+    if not fencing:
+        return True
+    try:
+        redis = await get_redis_connection()
+        current = await redis.redis_client.get(fencing["counter_key"])
+    except Exception as e:
+        third_party_error_counter.labels(service_name="redis").inc()
+        logger.warning(f"[is_fencing_current] Could not check fencing token: {e}")
+        return True
+    if current is not None and int(current) > fencing["token"]:
+        logger.error(f"[is_fencing_current] Fencing token {fencing['token']} is stale, current token is {int(current)}")
+        return False
+    return True
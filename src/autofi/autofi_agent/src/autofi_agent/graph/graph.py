@@ -1,34 +1,75 @@
-import json
+import asyncio
 import uuid
+from dataclasses import dataclass, field
 from datetime import datetime
 from typing import Tuple
 from langchain_core.runnables import RunnableConfig
-from langchain_core.messages import HumanMessage, RemoveMessage
+from langchain_core.runnables.config import merge_configs
+from langchain_core.messages import HumanMessage, RemoveMessage, AIMessage
 from langgraph.checkpoint.mongodb import MongoDBSaver
+from langchain_mcp_adapters.client import MultiServerMCPClient
 from pymongo import MongoClient
 from langgraph.graph import StateGraph, START, END
-from langgraph.types import Command
+from langgraph.types import Command, Send
 
-from .state import State, SelectedInstruments, OperatorWork
+from .state import (State, SelectedInstruments, OperatorWork, OperatorBranch, OperatorReport, FencingToken,
+                    RUN_MODE_FULL, RUN_MODE_RECOMMEND, RUN_MODE_SHARD, PRESET_RUN_MODES)
+from .fencing import is_fencing_current
 from .investment_expert_agent import build_investment_expert_agent
 from .operator_agent import build_operator_agent
-from .misc import get_human_readable_time
-from autofi_agent.mcp.operator_helper import send_intent_transaction, get_all_investments_with_offset
-from autofi_agent.mcp.investment_expert_helper import send_investment_recommendations, send_querier_immediate_query
+from .misc import ExecutableAgent, IntentReportCollector
+from .loader import InvestmentPageLoader, StreamingInvestments
+from .batcher import TokenBudgetBatcher
+from .checkpointer import OffloadedMongoDBSaver, CHECKPOINTER_OFFLOADED
+from .artifacts import artifact_store
+from .recommendations import RecommendationStore, recommendation_fingerprint, selection_of
+from .fast_path import triage_users, FAST_PATH_NO_ACTION, FAST_PATH_OBVIOUS_MOVE, FAST_PATH_NEEDS_REASONING
+from autofi_agent.mcp.operator_helper import send_intent_transaction
+from autofi_agent.mcp.pool import McpSessionPool
+from autofi_agent.mcp.in_process import get_in_process_tools, TOOL_TRANSPORT_IN_PROCESS
+from autofi_agent.prompt.encoding import get_prompt_encoder, estimate_tokens
+from autofi_agent.mcp.investment_expert_helper import (send_investment_recommendations, send_querier_immediate_query,
+                                                       get_instruments_response)
+from autofi_agent.prompt import INVESTMENT_EXPERT_SYSTEM_PROMPT
 from autofi_core import config as aegis_config
-from autofi_core import logger, build_mcp_config
-from autofi_core.common.messages import UserInstrumentsIntent, HelperGetInvestment
+from autofi_core import logger, build_mcp_config, request_time
+from autofi_core.common.messages import UserInstrumentsIntent, HelperGetInvestment, HelperGetInstrumentsRequest
+from autofi_core.common.stats import operator_fast_path_counter, prompt_tokens_summary, recommendation_reuse_counter
 from autofi_core.common.model import InvestmentExpertSelectedModel
 
 
-InvestmentsByInclination = dict[str, dict[str, HelperGetInvestment]]
-current_batch_data: InvestmentsByInclination = {}
+STRATEGY_TYPE_INCLINATION_CODES = {
+    "conservative": "1",
+    "balanced": "2",
+    "aggressive": "3",
+}
+
+OPERATOR_MAX_ATTEMPTS = 3
+
+
+@dataclass
+class BatchContext:
+    """Users of a running batch and the bookkeeping of the operator batches taken from them."""
+    investments: StreamingInvestments
+    batcher: TokenBudgetBatcher
+    triaged: set[str] = field(default_factory=set)  # uids which already went through the fast path
+    # uid -> (inclination code, investment) of users handed to an operator whose result is not known yet
+    in_flight: dict[str, Tuple[str, HelperGetInvestment]] = field(default_factory=dict)
+    failures: dict[str, int] = field(default_factory=dict)  # uid -> failed operator calls
+    fencing: FencingToken | None = None  # lock acquisition the batch runs under
+
+
+# batch_id -> context of the users being processed in that batch
+current_batches: dict[str, BatchContext] = {}
+
+# selections of the investment expert by fingerprint of its inputs, None when `agent.recommendation_reuse_enabled`
+# is off
+recommendation_store: RecommendationStore | None = None
 
 
 async def init_state(state: State, config: RunnableConfig):
-    global current_batch_data
-    current_batch_data = {}
-    batch_id = str(uuid.uuid4())
+    # the service names the run's checkpoint thread after its batch id
+    batch_id = state.get("batch_id") or str(uuid.uuid4())
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     inclinations = [
         "1",  # Conservative
@@ -46,19 +87,69 @@ async def init_state(state: State, config: RunnableConfig):
     placeholder = HumanMessage(content="Continue")
     logger.debug("[init_state] Initialized state with batch_id: %s, current_time: %s", batch_id, current_time)
 
+    # shard and targeted runs reuse instruments selected by an earlier run
+    run_mode = state.get("run_mode") or RUN_MODE_FULL
+    investment_recommendations = {inc: [] for inc in inclinations}
+    if run_mode in PRESET_RUN_MODES:
+        investment_recommendations = state.get("preset_recommendations") or investment_recommendations
+
     return {
         "messages": removal_operations + [placeholder],
+        "run_mode": run_mode,
+        "preset_recommendations": None,
+        "recommendation_fingerprint": None,
         "batch_id": batch_id,
         "current_time": current_time,
         "risk_reports": "No risk reports available now.",  # Placeholder for risk reports
-        "investment_recommendations": {inc: [] for inc in inclinations},
+        "investment_recommendations": investment_recommendations,
         "work_done": {inc: False for inc in inclinations},
         "structured_response": None,
         "message_delete_cursor": None,
         "user_investments": None,
+        "operator_batch_uids": None,
+        "operator_reports": None,
     }
 
 
+def route_after_init(state: State) -> str:
+    if state["run_mode"] in PRESET_RUN_MODES:
+        return "prepare_user_investments"
+    if recommendation_store is not None:
+        return "reuse_recommendations"
+    return "investment_expert"
+
+
+async def reuse_recommendations(state: State, config: RunnableConfig):
+    """Skip the investment expert when it recently selected instruments from the same inputs."""
+    try:
+        # the metadata only, the hourly data is not fingerprinted
+        instruments = await get_instruments_response(HelperGetInstrumentsRequest(req_id=str(uuid.uuid4())))
+        if instruments.error or not instruments.instruments:
+            # let the investment expert deal with it
+            return Command(goto="investment_expert")
+        fingerprint = recommendation_fingerprint(instruments, state["risk_reports"],
+                                                 aegis_config.llm.investment_expert_model,
+                                                 INVESTMENT_EXPERT_SYSTEM_PROMPT)
+        recommendations = await recommendation_store.get(fingerprint)
+    except Exception as e:
+        logger.error("[reuse_recommendations] Exception: %s", e)
+        return Command(goto="investment_expert")
+
+    if recommendations is None:
+        recommendation_reuse_counter.labels("miss").inc()
+        return Command(goto="investment_expert", update={"recommendation_fingerprint": fingerprint})
+
+    recommendation_reuse_counter.labels("hit").inc()
+    logger.info("[reuse_recommendations] Reusing instruments selected from fingerprint %s", fingerprint)
+    if not await is_fencing_current(state.get("fencing")):
+        return Command(goto=END)
+    await send_investment_recommendations(selection_of(recommendations))
+    return Command(
+        goto=END if state["run_mode"] == RUN_MODE_RECOMMEND else "prepare_user_investments",
+        update={"investment_recommendations": recommendations},
+    )
+
+
 async def after_investment_expert(state: State, config: RunnableConfig):
     try:
         selected: SelectedInstruments = state.get("structured_response")
@@ -72,12 +163,18 @@ async def after_investment_expert(state: State, config: RunnableConfig):
             selected_balanced_instrument_ids=selected_balanced_instrument_ids,
             selected_aggressive_instrument_ids=selected_aggressive_instrument_ids,
         )
+        if not await is_fencing_current(state.get("fencing")):
+            return Command(goto=END)
         await send_investment_recommendations(selection)
+        if recommendation_store is not None and state.get("recommendation_fingerprint"):
+            await recommendation_store.put(state["recommendation_fingerprint"], selected.to_state())
 
         return Command(
-            goto="prepare_user_investments",
+            goto=END if state["run_mode"] == RUN_MODE_RECOMMEND else "prepare_user_investments",
             update={"investment_recommendations": selected.to_state(),
-                    "structured_response": None},
+                    "structured_response": None,
+                    # the instruments listing is not needed in every checkpoint of the operators
+                    "messages": await artifact_store.offload_messages(state["messages"])},
         )
     except Exception as e:
         logger.error("[after_investment_expert] Exception: %s", e)
@@ -87,47 +184,26 @@ async def after_investment_expert(state: State, config: RunnableConfig):
 
 
 async def prepare_user_investments(state: State, config: RunnableConfig):
-    global current_batch_data
-    batch_data: dict = {}
-    offset = 0
-    while True:
-        resp = await get_all_investments_with_offset(offset)
-        if not resp or not resp.investments_by_inclination:
-            break
-        for inclination, users_investments in resp.investments_by_inclination.items():
-            if inclination not in batch_data:
-                batch_data[inclination] = {}
-            for uid, investments in users_investments.items():
-                batch_data[inclination][uid] = investments
-        if resp.has_more:
-            offset = resp.next_offset
-        else:
-            break
-    current_batch_data = batch_data
+    loader = InvestmentPageLoader(page_size=aegis_config.agent.investment_page_size,
+                                  prefetch=aegis_config.agent.investment_prefetch_pages,
+                                  scope=state.get("user_scope"))
+    investments = StreamingInvestments(loader)
+    investments.start()
+    current_batches[state["batch_id"]] = BatchContext(
+        investments=investments,
+        batcher=TokenBudgetBatcher(aegis_config.agent.operator_token_budget),
+        fencing=state.get("fencing"),
+    )
 
 
 async def withdraw_who_disable_strategy(state: State, config: RunnableConfig):
-    global current_batch_data
     message_delete_cursor = None
     try:
-        investments = current_batch_data.get("0")  # Users who have disabled strategy
-        if investments:
-            logger.debug("[withdraw_who_disable_strategy] Found investments to withdraw: %s", investments)
-            user_intents = []
-            for uid, investment in investments.items():
-                user_intent = UserInstrumentsIntent(
-                    uid=uid,
-                    inclined_instrument_id=0,
-                    reason="Strategy disabled",
-                )
-                user_intents.append(user_intent)
-            if user_intents:
-                resp = await send_intent_transaction(user_intents)
-                if resp.error:
-                    logger.info("[withdraw_who_disable_strategy] Error sending intent transaction: %s", resp.error)
-                if resp.intents:
-                    for intent in resp.intents:
-                        logger.debug("[withdraw_who_disable_strategy] Intent execution report: %s", intent)
+        # Users who have disabled strategy are withdrawn in the background while pages are still arriving
+        batch = current_batches[state["batch_id"]]
+        investments = batch.investments
+        investments.background_tasks.append(asyncio.create_task(withdraw_disabled_users(investments, batch.fencing)))
+
         # set message delete cursor for concentrating operator
         messages = state["messages"]
         if messages:
@@ -141,13 +217,83 @@ async def withdraw_who_disable_strategy(state: State, config: RunnableConfig):
         )
     except Exception as e:
         logger.error("[withdraw_who_disable_strategy] Exception: %s", e)
+        await close_batch(state["batch_id"])
         return Command(
             goto=END,
         )
 
 
+async def withdraw_disabled_users(investments: StreamingInvestments, fencing: FencingToken | None = None):
+    while True:
+        disabled = await investments.take("0", aegis_config.agent.investment_page_size)
+        if not disabled or not await is_fencing_current(fencing):
+            return
+        logger.debug("[withdraw_disabled_users] Found investments to withdraw: %s", disabled)
+        user_intents = [
+            UserInstrumentsIntent(
+                uid=uid,
+                inclined_instrument_id=0,
+                reason="Strategy disabled",
+            ) for uid in disabled
+        ]
+        try:
+            resp = await send_intent_transaction(user_intents)
+        except Exception as e:
+            logger.error("[withdraw_disabled_users] Exception: %s", e)
+            continue
+        if resp.error:
+            logger.info("[withdraw_disabled_users] Error sending intent transaction: %s", resp.error)
+        if resp.intents:
+            for intent in resp.intents:
+                logger.debug("[withdraw_disabled_users] Intent execution report: %s", intent)
+
+
+async def close_batch(batch_id: str):
+    batch = current_batches.pop(batch_id, None)
+    if batch:
+        await batch.investments.close()
+
+
+async def settle_operator_batch(batch_id: str, inclination_code: str, uids: list[str], failed: bool,
+                                sent_uids: set[str] | None = None):
+    """
+    Record the outcome of an operator call, failed batches are shrunk and their users taken again, except the
+    `sent_uids` whose intents the operator already sent before failing.
+    """
+    batch = current_batches.get(batch_id)
+    if not batch:
+        return
+    settled = {uid: batch.in_flight.pop(uid)[1] for uid in uids if uid in batch.in_flight}
+    if not failed:
+        batch.batcher.record_success(inclination_code)
+        return
+    batch.batcher.record_failure(inclination_code)
+    retry = {}
+    for uid, investment in settled.items():
+        if sent_uids and uid in sent_uids:
+            continue
+        batch.failures[uid] = batch.failures.get(uid, 0) + 1
+        if batch.failures[uid] < OPERATOR_MAX_ATTEMPTS:
+            retry[uid] = investment
+        else:
+            logger.error(f"[settle_operator_batch] Operator failed {OPERATOR_MAX_ATTEMPTS} times for user {uid}, "
+                         f"giving up")
+    if retry:
+        await batch.investments.put_back(inclination_code, retry)
+
+
+def is_truncated(result: dict) -> bool:
+    last_ai_message = next((m for m in reversed(result.get("messages") or []) if isinstance(m, AIMessage)), None)
+    return last_ai_message is not None and last_ai_message.response_metadata.get("finish_reason") == "length"
+
+
 async def before_operator(state: State, config: RunnableConfig):
     update = {}
+    if not await is_fencing_current(state.get("fencing")):
+        logger.warning("[before_operator] Lock acquired by another run, moving to clean up phase.")
+        return Command(
+            goto="clean_up_phase",
+        )
     message_delete_cursor = state.get("message_delete_cursor")
     if message_delete_cursor:
         messages = state["messages"]
@@ -155,6 +301,26 @@ async def before_operator(state: State, config: RunnableConfig):
             removal_operations = [RemoveMessage(id=m.id) for m in messages[message_delete_cursor:]]
             update["messages"] = removal_operations
 
+    if aegis_config.agent.parallel_operators:
+        try:
+            branches = await take_operator_branches(state)
+        except Exception as e:
+            # the book failed to load, fail the run rather than settle part of it
+            logger.error("[before_operator] Exception: %s", e)
+            await close_batch(state["batch_id"])
+            raise
+        if not branches:
+            logger.debug("[before_operator] No more investments to process, moving to clean up phase.")
+            return Command(
+                goto="clean_up_phase",
+                update=update
+            )
+        logger.debug(f"[before_operator] Dispatching {len(branches)} operator branches.")
+        return Command(
+            goto=[Send("operator_branch", branch) for branch in branches],
+            update=update
+        )
+
     # figure out which strategy_type phase are we in
     if not state.get("structured_response"):
         strategy_type = "conservative"
@@ -162,7 +328,12 @@ async def before_operator(state: State, config: RunnableConfig):
         operator_work: OperatorWork = state.get("structured_response")
         strategy_type = operator_work.strategy_type
 
-    result = get_some_investments(strategy_type)
+    try:
+        result = await get_some_investments(state["batch_id"], strategy_type, state["investment_recommendations"])
+    except Exception as e:
+        logger.error("[before_operator] Exception: %s", e)
+        await close_batch(state["batch_id"])
+        raise
     if not result:
         # all done
         logger.debug("[before_operator] No more investments to process, moving to clean up phase.")
@@ -170,10 +341,11 @@ async def before_operator(state: State, config: RunnableConfig):
             goto="clean_up_phase",
             update=update
         )
-    (investments_info, current_strategy_type) = result
+    (investments_info, uids, current_strategy_type) = result
     logger.debug(f"[before_operator] get user investments info: {investments_info} for strategy type "
                  f"{current_strategy_type}")
-    update["user_investments"] = investments_info
+    update["user_investments"] = await artifact_store.offload(investments_info)
+    update["operator_batch_uids"] = uids
     match current_strategy_type:
         case "conservative":
             goto = "conservative_operator"
@@ -190,14 +362,126 @@ async def before_operator(state: State, config: RunnableConfig):
     )
 
 
+async def take_operator_branches(state: State) -> list[OperatorBranch]:
+    """Take up to `operator_max_concurrency` user batches, round-robin over the inclinations."""
+    branches: list[OperatorBranch] = []
+    active = ["conservative", "balanced", "aggressive"]
+    while active and len(branches) < aegis_config.agent.operator_max_concurrency:
+        for strategy_type in list(active):
+            if len(branches) >= aegis_config.agent.operator_max_concurrency:
+                break
+            inclination_code = STRATEGY_TYPE_INCLINATION_CODES[strategy_type]
+            result = await _get_some_investments(state["batch_id"], inclination_code,
+                                                 state["investment_recommendations"][inclination_code])
+            if not result:
+                active.remove(strategy_type)
+                continue
+            investments_info, uids = result
+            branches.append(OperatorBranch(
+                batch_id=state["batch_id"],
+                strategy_type=strategy_type,
+                current_time=state["current_time"],
+                investment_recommendations=state["investment_recommendations"],
+                user_investments=await artifact_store.offload(investments_info),
+                uids=uids,
+            ))
+    return branches
+
+
+def build_operator_branch(operator_agents: dict[str, ExecutableAgent]):
+    async def operator_branch(branch: OperatorBranch, config: RunnableConfig):
+        strategy_type = branch["strategy_type"]
+        agent_state = {
+            "messages": [HumanMessage(content="Continue")],
+            "batch_id": branch["batch_id"],
+            "current_time": branch["current_time"],
+            "investment_recommendations": branch["investment_recommendations"],
+            "user_investments": branch["user_investments"],
+        }
+        report = OperatorReport(strategy_type=strategy_type, intent_reports=[], error=None)
+        collector = IntentReportCollector()
+        try:
+            with request_time.labels("autofi_agent", f"{strategy_type}_operator").time():
+                result = await operator_agents[strategy_type].a_call_agent(
+                    agent_state, merge_configs(config, {"callbacks": [collector]}))
+            if is_truncated(result):
+                report["error"] = "operator response truncated"
+        except Exception as e:
+            logger.error(f"[operator_branch] {strategy_type} operator failed: {e}")
+            report["error"] = str(e)
+        report["intent_reports"] = collector.reports
+        await settle_operator_batch(branch["batch_id"], STRATEGY_TYPE_INCLINATION_CODES[strategy_type],
+                                    branch["uids"], failed=report["error"] is not None,
+                                    sent_uids=collector.accepted_uids())
+        return {"operator_reports": [report]}
+
+    return operator_branch
+
+
+def build_operator_node(operator_agent: ExecutableAgent, strategy_type: str):
+    async def operator_node(state: State, config: RunnableConfig):
+        inclination_code = STRATEGY_TYPE_INCLINATION_CODES[strategy_type]
+        uids = state.get("operator_batch_uids") or []
+        collector = IntentReportCollector()
+        try:
+            with request_time.labels("autofi_agent", f"{strategy_type}_operator").time():
+                result = await operator_agent.a_call_agent(state, merge_configs(config, {"callbacks": [collector]}))
+        except Exception as e:
+            logger.error(f"[operator_node] {strategy_type} operator failed: {e}")
+            await settle_operator_batch(state["batch_id"], inclination_code, uids, failed=True,
+                                        sent_uids=collector.accepted_uids())
+            return {}
+        await settle_operator_batch(state["batch_id"], inclination_code, uids, failed=is_truncated(result),
+                                    sent_uids=collector.accepted_uids())
+        return result
+
+    return operator_node
+
+
 async def clean_up_phase(state: State, config: RunnableConfig):
-    await send_querier_immediate_query()
+    await close_batch(state["batch_id"])
+    if state.get("operator_reports"):
+        failed = [r for r in state["operator_reports"] if r["error"]]
+        logger.info(f"[clean_up_phase] {len(state['operator_reports'])} operator branches finished, "
+                    f"{len(failed)} failed")
+    # a sharded run queries once, when its last shard is done
+    if state["run_mode"] != RUN_MODE_SHARD:
+        await send_querier_immediate_query()
     return Command(
         goto=END,
     )
 
 
-def get_some_investments(strategy_type: str) -> Tuple[str, str] | None:
+async def handle_fast_path(investments: dict[str, HelperGetInvestment], recommendations: list,
+                           fencing: FencingToken | None = None) -> dict[str, HelperGetInvestment]:
+    """Act on the users whose decision is trivial and return the ones left to the operator LLM."""
+    no_action, intents, needs_reasoning = triage_users(investments, recommendations)
+    if intents and not await is_fencing_current(fencing):
+        # the run is stale, its users are left to the run holding the lock
+        return {}
+    if intents:
+        try:
+            resp = await send_intent_transaction(intents)
+            if resp.error:
+                logger.info("[handle_fast_path] Error sending intent transaction: %s", resp.error)
+            for intent in resp.intents:
+                logger.debug("[handle_fast_path] Intent execution report: %s", intent)
+        except Exception as e:
+            logger.error("[handle_fast_path] Exception, leaving users to the operator: %s", e)
+            for intent in intents:
+                needs_reasoning[intent.uid] = investments[intent.uid]
+            intents = []
+
+    operator_fast_path_counter.labels(path=FAST_PATH_NO_ACTION).inc(len(no_action))
+    operator_fast_path_counter.labels(path=FAST_PATH_OBVIOUS_MOVE).inc(len(intents))
+    operator_fast_path_counter.labels(path=FAST_PATH_NEEDS_REASONING).inc(len(needs_reasoning))
+    logger.debug(f"[handle_fast_path] {len(no_action)} user(s) need no action, {len(intents)} handled directly, "
+                 f"{len(needs_reasoning)} left to the operator")
+    return needs_reasoning
+
+
+async def get_some_investments(batch_id: str, strategy_type: str,
+                               investment_recommendations: dict) -> Tuple[str, list[str], str] | None:
     current_strategy_type = strategy_type
     match strategy_type:
         case "conservative":
@@ -210,7 +494,8 @@ def get_some_investments(strategy_type: str) -> Tuple[str, str] | None:
             inclination_code = 1
 
     while True:
-        result = _get_some_investments(str(inclination_code))
+        result = await _get_some_investments(batch_id, str(inclination_code),
+                                             investment_recommendations.get(str(inclination_code), []))
         if not result:
             inclination_code += 1
             if inclination_code > 3:
@@ -227,65 +512,47 @@ def get_some_investments(strategy_type: str) -> Tuple[str, str] | None:
         case 3:
             current_strategy_type = "aggressive"
 
-    return result, current_strategy_type
+    investments_info, uids = result
+    return investments_info, uids, current_strategy_type
 
 
-def _get_some_investments(inclination_code: str) -> str | None:
-    global current_batch_data
-    user_investments_should_be_returned = {}
-    returned = 0
-    max_return = 15
-    investments_dict = current_batch_data.get(inclination_code, {})
-    if not investments_dict:
+async def _get_some_investments(batch_id: str, inclination_code: str,
+                                recommendations: list) -> Tuple[str, list[str]] | None:
+    batch = current_batches.get(batch_id)
+    if not batch:
         return None
 
-    uids = list(investments_dict.keys())
-    for uid in uids[:max_return]:
-        user_investments_should_be_returned[uid] = investments_dict[uid]
-        del investments_dict[uid]
-        returned += 1
+    while True:
+        user_investments_should_be_returned = await batch.investments.take(
+            inclination_code, aegis_config.agent.operator_max_users_per_batch)
+        if not user_investments_should_be_returned:
+            return None
+        if aegis_config.agent.fast_path_enabled:
+            untriaged = {uid: i for uid, i in user_investments_should_be_returned.items() if uid not in batch.triaged}
+            batch.triaged.update(untriaged)
+            needs_reasoning = await handle_fast_path(untriaged, recommendations, batch.fencing) if untriaged else {}
+            user_investments_should_be_returned = {
+                uid: i for uid, i in user_investments_should_be_returned.items()
+                if uid not in untriaged or uid in needs_reasoning
+            }
+        if user_investments_should_be_returned:
+            break
 
-    if not investments_dict:
-        del current_batch_data[inclination_code]
+    # pack as many users as fit in the token budget, the rest go back for the next batch
+    encoder = get_prompt_encoder()
+    blocks = {uid: encoder.user_investment(uid, investment)
+              for uid, investment in user_investments_should_be_returned.items()}
+    uids = batch.batcher.pack(inclination_code, blocks)
+    overflow = {uid: i for uid, i in user_investments_should_be_returned.items() if uid not in uids}
+    if overflow:
+        await batch.investments.put_back(inclination_code, overflow)
+    for uid in uids:
+        batch.in_flight[uid] = (inclination_code, user_investments_should_be_returned[uid])
 
-    lines = [
-        f"Investment information for {returned} user(s) retrieved.",
-        "You may use these details to create intent transactions and help users discover "
-        "better investment opportunities.",
-        "Details for each user:",
-    ]
-    for uid, investment in user_investments_should_be_returned.items():
-        i: dict = {
-            "uid": uid,
-            "strategy_type_user_chosen": investment.mandate.next_strategy,
-            "existed_positions": []
-        }
-        if investment.blacklist_protocol_names:
-            i["blacklist_protocol_names"] = [b for b in investment.blacklist_protocol_names]
-
-        if investment.positions:
-            for position in investment.positions:
-                i["existed_positions"].append({
-                    "chain_id": position.position_data.chain_id,
-                    "instrument_id": position.position_data.instrument_id,
-                    "asset": position.position_data.asset,
-                    "asset_amount": position.position_data.asset_amount,
-                    "asset_amount_in_usd": f'${position.position_data.asset_amount_usd}',
-                    "pnl_in_usd": f'${position.position_data.pnl_usd}',
-                    "timestamp": get_human_readable_time(position.position_data.timestamp),
-                })
-        if investment.last_transaction:
-            i["last_transaction_dealt_by_you"] = get_human_readable_time(investment.last_transaction.tx_time)
-        if investment.uninvested_value:
-            i["uninvested_value_in_usd"] = f'${investment.uninvested_value}'
-        lines.append(json.dumps(i, ensure_ascii=False, indent=2))
-    lines.append("Strategy type codes:\n"
-                 "  '0' - DISABLED\n"
-                 "  '1' - CONSERVATIVE\n"
-                 "  '2' - BALANCED\n"
-                 "  '3' - AGGRESSIVE\n")
-
-    return "\n".join(lines)
+    investments_info = encoder.user_investments([blocks[uid] for uid in uids])
+    prompt_tokens_summary.labels("user_investments", aegis_config.agent.prompt_format).observe(
+        estimate_tokens(investments_info))
+    return investments_info, uids
 
 
 """
@@ -293,6 +560,9 @@ def _get_some_investments(inclination_code: str) -> str | None:
    |
    v
 init_state --> investment_expert --> after_investment_expert --> prepare_user_investments
+   |                                           |                           ^
+   |                                           +--> [END] ("recommend")    |
+   +-----------------------------------------------------------------------+ ("shard", "targeted")
    |
    v
 withdraw_who_disable_strategy
@@ -307,41 +577,95 @@ before_operator
    +--------> aggressive_operator --------+
    |
    +--------> clean_up_phase --> [END]
+
+The `run_mode` input splits a run across replicas (see service/sharding.py): a "recommend" run only selects the
+instruments, then "shard" runs with those `preset_recommendations` handle the users in their `user_scope` hash range.
+"targeted" runs likewise handle the `user_scope` uids which requested immediate scheduling, or whose positions or
+strategy changed (see service/scheduling.py).
+
+With `agent.parallel_operators` enabled, before_operator instead fans out up to `agent.operator_max_concurrency`
+user batches of any inclination to concurrent "operator_branch" nodes, whose reports are merged into
+`operator_reports` before returning to before_operator.
+
+With `agent.artifact_offload_enabled`, the rendered user investments, and the investment expert's large tool outputs
+once it is done, are kept in the artifact store (see artifacts.py). The state only carries references to them,
+resolved when the prompts are rendered.
+
+With `agent.recommendation_reuse_enabled`, init_state first goes to reuse_recommendations, which goes on to
+prepare_user_investments with the selection stored for the same instruments and risk reports (see
+recommendations.py), or to investment_expert when there is none younger than `agent.recommendation_max_age`.
+
+With `agent.fast_path_enabled`, users whose decision is trivial are handled by rules (see fast_path.py) while batches
+are taken, and only the remaining users are handed to the operators.
+
+The agents' tools call the MCP helpers through `mcp_pool` when given (see mcp/pool.py), so the helpers stay up between
+calls and the three operators share one helper; otherwise each tool call spawns its helper. With
+`mcp.tool_transport = "in_process"`, the helper functions are called in the agent process instead (see
+mcp/in_process.py).
+
+Operator batches are packed by estimated prompt tokens (`agent.operator_token_budget`); a failed or truncated operator
+call halves the budget of its inclination and puts the batch's users back to be retried in smaller batches, up to
+OPERATOR_MAX_ATTEMPTS times per user.
 """
 
 
-async def build_graph():
+async def build_graph(mcp_pool: McpSessionPool | None = None):
     # build memory checkpoint
-    mongo_client = MongoClient(aegis_config.mongo.url)
-    memory = MongoDBSaver(mongo_client, db_name="aegis")
+    mongo_client = MongoClient(aegis_config.mongo.url, maxPoolSize=aegis_config.mongo.max_pool_size,
+                               minPoolSize=aegis_config.mongo.min_pool_size)
+    if aegis_config.mongo.checkpointer == CHECKPOINTER_OFFLOADED:
+        memory = OffloadedMongoDBSaver(mongo_client, db_name="aegis", workers=aegis_config.mongo.checkpointer_workers)
+    else:
+        memory = MongoDBSaver(mongo_client, db_name="aegis")
+    if aegis_config.agent.recommendation_reuse_enabled:
+        global recommendation_store
+        recommendation_store = RecommendationStore(mongo_client["aegis"]["investment_recommendations"],
+                                                   max_age=aegis_config.agent.recommendation_max_age)
+        recommendation_store.ensure_indexes()
 
     # build agents
-    invest_helper_config = build_mcp_config(["investment_expert_helper"])
-    operator_helper_config = build_mcp_config(["operator_helper"])
-    investment_expert_agent = await build_investment_expert_agent(memory, invest_helper_config)
-    conservative_operator_agent = await build_operator_agent(memory, operator_helper_config, "1")
-    balanced_operator_agent = await build_operator_agent(memory, operator_helper_config, "2")
-    aggressive_operator_agent = await build_operator_agent(memory, operator_helper_config, "3")
+    if aegis_config.mcp.tool_transport == TOOL_TRANSPORT_IN_PROCESS:
+        invest_tools = get_in_process_tools("investment_expert_helper")
+        operator_tools = get_in_process_tools("operator_helper")
+    elif mcp_pool is not None:
+        invest_tools = await mcp_pool.get_tools("investment_expert_helper")
+        # the operators share the session of their helper
+        operator_tools = await mcp_pool.get_tools("operator_helper")
+    else:
+        invest_tools = await MultiServerMCPClient(build_mcp_config(["investment_expert_helper"])).get_tools()
+        operator_tools = await MultiServerMCPClient(build_mcp_config(["operator_helper"])).get_tools()
+    investment_expert_agent = await build_investment_expert_agent(memory, invest_tools)
+    conservative_operator_agent = await build_operator_agent(memory, operator_tools, "1")
+    balanced_operator_agent = await build_operator_agent(memory, operator_tools, "2")
+    aggressive_operator_agent = await build_operator_agent(memory, operator_tools, "3")
 
     # build state graph
     builder = StateGraph(State, config_schema=RunnableConfig)
     builder.add_node(init_state)
+    builder.add_node(reuse_recommendations)
     builder.add_node("investment_expert", investment_expert_agent.a_call_agent)
     builder.add_node(after_investment_expert)
     builder.add_node(prepare_user_investments)
     builder.add_node(withdraw_who_disable_strategy)
     builder.add_node(before_operator)
     builder.add_node(clean_up_phase)
-    builder.add_node("conservative_operator", conservative_operator_agent.a_call_agent)
-    builder.add_node("balanced_operator", balanced_operator_agent.a_call_agent)
-    builder.add_node("aggressive_operator", aggressive_operator_agent.a_call_agent)
+    builder.add_node("conservative_operator", build_operator_node(conservative_operator_agent, "conservative"))
+    builder.add_node("balanced_operator", build_operator_node(balanced_operator_agent, "balanced"))
+    builder.add_node("aggressive_operator", build_operator_node(aggressive_operator_agent, "aggressive"))
+    builder.add_node("operator_branch", build_operator_branch({
+        "conservative": conservative_operator_agent,
+        "balanced": balanced_operator_agent,
+        "aggressive": aggressive_operator_agent,
+    }))
 
     builder.add_edge(START, "init_state")
-    builder.add_edge("init_state", "investment_expert")
+    builder.add_conditional_edges("init_state", route_after_init,
+                                  ["reuse_recommendations", "investment_expert", "prepare_user_investments"])
     builder.add_edge("investment_expert", "after_investment_expert")
     builder.add_edge("prepare_user_investments", "withdraw_who_disable_strategy")
     builder.add_edge("conservative_operator", "before_operator")
     builder.add_edge("balanced_operator", "before_operator")
     builder.add_edge("aggressive_operator", "before_operator")
+    builder.add_edge("operator_branch", "before_operator")
 
     return builder.compile(checkpointer=memory)
@@ -1,17 +1,17 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts.base import PromptValue
+from langchain_core.tools import BaseTool
 from langgraph.prebuilt import create_react_agent
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_mcp_adapters.sessions import StdioConnection
 from langgraph.checkpoint.mongodb import MongoDBSaver
 
 from .state import State, SelectedInstruments
 from .misc import load_chat_model, ExecutableAgent
+from .artifacts import artifact_store
 from autofi_agent.prompt import INVESTMENT_EXPERT_SYSTEM_PROMPT
 from autofi_core import config as aegis_config
 
 
-def prepare_investment_expert_messages(state: State) -> PromptValue:
+async def prepare_investment_expert_messages(state: State) -> PromptValue:
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", INVESTMENT_EXPERT_SYSTEM_PROMPT),
@@ -19,17 +19,15 @@ def prepare_investment_expert_messages(state: State) -> PromptValue:
         ]
     )
 
-    return prompt.invoke({
-        "messages": state.get("messages"),
+    return await prompt.ainvoke({
+        "messages": await artifact_store.resolve_messages(state.get("messages")),
         "risk_reports": state.get("risk_reports"),
         "current_time": state.get("current_time"),
     })
 
 
-async def build_investment_expert_agent(memory: MongoDBSaver, mcp_config: dict[str, StdioConnection]):
+async def build_investment_expert_agent(memory: MongoDBSaver, tools: list[BaseTool]):
     llm = load_chat_model(aegis_config.llm.investment_expert_model, 0.0)
-    client = MultiServerMCPClient(mcp_config)
-    tools = await client.get_tools()
 
     agent = create_react_agent(
         tools=tools,
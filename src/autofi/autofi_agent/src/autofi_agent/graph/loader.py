@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Tuple
+
+from autofi_agent.mcp.operator_helper import get_all_investments_with_offset
+from autofi_core import logger
+from autofi_core.common.messages import HelperGetInvestment, HelperGetAllUsersInvestmentsResponse
+from .state import UserScope
+
+
+InvestmentsByInclination = dict[str, dict[str, HelperGetInvestment]]
+PageFetcher = Callable[[int, int], Awaitable[HelperGetAllUsersInvestmentsResponse | None]]
+
+UID_HASH_SPACE = 2 ** 32
+
+
+def uid_hash(uid: str) -> int:
+    """Stable hash of a uid in [0, UID_HASH_SPACE), the same in every process."""
+    return int.from_bytes(hashlib.sha1(uid.encode("utf-8")).digest()[:4], "big")
+
+
+def shard_user_scope(shard: int, shards: int) -> UserScope:
+    """Hash range of the users of a shard, the shards together cover every user once."""
+    return UserScope(start=UID_HASH_SPACE * shard // shards, end=UID_HASH_SPACE * (shard + 1) // shards)
+
+
+def in_user_scope(uid: str, scope: UserScope | None) -> bool:
+    if scope is None:
+        return True
+    if "uids" in scope:
+        return uid in scope["uids"]
+    return scope["start"] <= uid_hash(uid) < scope["end"]
+
+
+class InvestmentPageLoader:
+    """
+    Loads all users' investments page by page, keeping up to `prefetch` page requests in flight.
+
+    Pages are requested speculatively at `offset + n * page_size`. If the server reports a `next_offset`
+    which does not match the speculation, the speculative requests are dropped and loading continues
+    from the reported offset.
+
+    Iterating over the loader yields `(inclination, uid, investment)` as soon as each page arrives, skipping
+    the users out of `scope`, `page_users` yields them a page at a time. A scope listing uids stops loading once
+    all of them were found.
+    """
+
+    def __init__(self, page_size: int, prefetch: int, fetch: PageFetcher = get_all_investments_with_offset,
+                 scope: UserScope | None = None):
+        self.page_size = page_size
+        self.prefetch = max(prefetch, 1)
+        self.fetch = fetch
+        self.scope = scope
+        self.in_flight: deque[Tuple[int, asyncio.Task]] = deque()
+
+    def has_ready_page(self) -> bool:
+        """Whether the next page arrived already, so more users follow without waiting."""
+        return bool(self.in_flight) and self.in_flight[0][1].done()
+
+    async def pages(self) -> AsyncIterator[HelperGetAllUsersInvestmentsResponse]:
+        in_flight = self.in_flight
+        next_offset = 0
+
+        def schedule():
+            nonlocal next_offset
+            while len(in_flight) < self.prefetch:
+                task = asyncio.create_task(self.fetch(next_offset, self.page_size))
+                in_flight.append((next_offset, task))
+                next_offset += self.page_size
+
+        def cancel_in_flight():
+            while in_flight:
+                _, task = in_flight.popleft()
+                task.cancel()
+
+        schedule()
+        try:
+            while in_flight:
+                offset, task = in_flight.popleft()
+                resp = await task
+                if not resp or not resp.investments_by_inclination:
+                    return
+                yield resp
+                if not resp.has_more:
+                    return
+                if resp.next_offset != offset + self.page_size:
+                    logger.debug(f"[InvestmentPageLoader] next offset {resp.next_offset} differs from "
+                                 f"{offset + self.page_size}, dropping speculative pages")
+                    cancel_in_flight()
+                    next_offset = resp.next_offset
+                schedule()
+        finally:
+            cancel_in_flight()
+
+    async def page_users(self) -> AsyncIterator[list[Tuple[str, str, HelperGetInvestment]]]:
+        missing = set(self.scope["uids"]) if self.scope and "uids" in self.scope else None
+        async for resp in self.pages():
+            users = []
+            for inclination, users_investments in resp.investments_by_inclination.items():
+                for uid, investment in users_investments.items():
+                    if missing is not None:
+                        if uid not in missing:
+                            continue
+                        missing.discard(uid)
+                    elif not in_user_scope(uid, self.scope):
+                        continue
+                    users.append((inclination, uid, investment))
+            yield users
+            if missing is not None and not missing:
+                return
+
+    async def __aiter__(self) -> AsyncIterator[Tuple[str, str, HelperGetInvestment]]:
+        async for users in self.page_users():
+            for user in users:
+                yield user
+
+
+class StreamingInvestments:
+    """
+    Buffers the users yielded by an `InvestmentPageLoader` by inclination, so they can be taken in
+    batches while later pages are still being loaded.
+
+    A page failing to load fails the takes once the users loaded before it were taken, rather than leaving
+    the run with a partial book.
+    """
+
+    def __init__(self, loader: InvestmentPageLoader):
+        self.loader = loader
+        self.investments: InvestmentsByInclination = {}
+        self.loaded = False
+        self.waiting_for_page = False
+        self.error: Exception | None = None
+        self.background_tasks: list[asyncio.Task] = []
+        self._changed = asyncio.Condition()
+        self._task: asyncio.Task | None = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._consume())
+
+    async def _consume(self):
+        try:
+            async for users in self.loader.page_users():
+                async with self._changed:
+                    for inclination, uid, investment in users:
+                        self.investments.setdefault(inclination, {})[uid] = investment
+                    self.waiting_for_page = not self.loader.has_ready_page()
+                    self._changed.notify_all()
+        except Exception as e:
+            logger.error(f"[StreamingInvestments] Error loading user investments: {e}")
+            self.error = e
+        finally:
+            async with self._changed:
+                self.loaded = True
+                self._changed.notify_all()
+
+    async def take(self, inclination: str, max_count: int) -> dict[str, HelperGetInvestment]:
+        """
+        Take up to `max_count` users of the inclination, waiting until that many have arrived, or some have and
+        the next page has not, or loading has finished. An empty result means the inclination is exhausted.
+
+        Raises the loading error once the users loaded before it are taken.
+        """
+        def available() -> bool:
+            count = len(self.investments.get(inclination, {}))
+            return self.loaded or count >= max_count or (count > 0 and self.waiting_for_page)
+
+        async with self._changed:
+            await self._changed.wait_for(available)
+            investments = self.investments.get(inclination, {})
+            if not investments and self.error is not None:
+                raise self.error
+            taken = {}
+            for uid in list(investments.keys())[:max_count]:
+                taken[uid] = investments.pop(uid)
+            if not investments:
+                self.investments.pop(inclination, None)
+            return taken
+
+    async def put_back(self, inclination: str, investments: dict[str, HelperGetInvestment]):
+        """Return users to the front of the inclination, e.g. when they did not fit in a batch."""
+        async with self._changed:
+            self.investments[inclination] = {**investments, **self.investments.get(inclination, {})}
+            self._changed.notify_all()
+
+    async def close(self):
+        if self._task and not self._task.done():
+            self._task.cancel()
+        for task in [self._task, *self.background_tasks]:
+            if task is None:
+                continue
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+            except Exception as e:
+                logger.error(f"[StreamingInvestments] Background task failed: {e}")
@@ -1,8 +1,11 @@
-from datetime import datetime
+import json
+from typing import Any
+from uuid import UUID
 from langchain.chat_models import init_chat_model
+from langchain_core.callbacks import AsyncCallbackHandler
 from langchain_core.language_models import BaseChatModel
 from langchain_core.runnables import RunnableConfig
-from langchain_core.messages import AIMessage
+from langchain_core.messages import AIMessage, ToolMessage
 
 from .state import State
 from abc import ABC, abstractmethod
@@ -37,6 +40,53 @@ class ExecutableAgent(CallableAgent):
         return self.graph.name
 
 
+def tool_output_text(output: Any) -> str:
+    """Text of a tool output, a tool message or MCP content blocks included."""
+    if isinstance(output, ToolMessage):
+        output = output.content
+    if isinstance(output, list):
+        return "\n".join(block.get("text", "") if isinstance(block, dict) else str(block) for block in output)
+    return output if isinstance(output, str) else str(output)
+
+
+def accepted_intent_uids(report: str) -> set[str]:
+    """Users whose intent a `create_intent_transaction` report shows accepted, i.e. without error."""
+    decoder = json.JSONDecoder()
+    uids = set()
+    position = report.find("{")
+    while position != -1:
+        try:
+            intent, end = decoder.raw_decode(report, position)
+        except ValueError:
+            end = position + 1
+        else:
+            if isinstance(intent, dict) and intent.get("uid") and intent.get("error") in (None, "None"):
+                uids.add(intent["uid"])
+        position = report.find("{", end)
+    return uids
+
+
+class IntentReportCollector(AsyncCallbackHandler):
+    """
+    Collects the outputs of the `create_intent_transaction` tool during an agent call, also when the call fails
+    or is truncated afterwards, so the users whose intents were already sent are not sent again.
+    """
+
+    def __init__(self):
+        self.tool_names: dict[UUID, str] = {}
+        self.reports: list[str] = []
+
+    async def on_tool_start(self, serialized: dict[str, Any], input_str: str, *, run_id: UUID, **kwargs) -> None:
+        self.tool_names[run_id] = (serialized or {}).get("name") or kwargs.get("name") or ""
+
+    async def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs) -> None:
+        if self.tool_names.pop(run_id, None) == "create_intent_transaction":
+            self.reports.append(tool_output_text(output))
+
+    def accepted_uids(self) -> set[str]:
+        return {uid for report in self.reports for uid in accepted_intent_uids(report)}
+
+
 def load_chat_model(fully_specified_name: str, temperature: float | None) -> BaseChatModel:
     """Load a chat model from a fully specified name.
 
@@ -53,11 +103,3 @@ def load_chat_model(fully_specified_name: str, temperature: float | None) -> Bas
     if not temperature:
         return init_chat_model(model, model_provider=provider)
     return init_chat_model(model, model_provider=provider, temperature=temperature)
-
-
-def get_human_readable_time(timestamp: int) -> str:
-    try:
-        dt = datetime.fromtimestamp(timestamp)
-        return dt.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception:
-        return str(timestamp)
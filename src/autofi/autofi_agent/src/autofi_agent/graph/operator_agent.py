@@ -1,17 +1,17 @@
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.prompts.base import PromptValue
+from langchain_core.tools import BaseTool
 from langgraph.prebuilt import create_react_agent
-from langchain_mcp_adapters.client import MultiServerMCPClient
-from langchain_mcp_adapters.sessions import StdioConnection
 from langgraph.checkpoint.mongodb import MongoDBSaver
 
 from .state import State, OperatorWork
 from .misc import load_chat_model, ExecutableAgent
+from .artifacts import artifact_store
 from autofi_agent.prompt import AEGIS_OPERATOR_SYSTEM_PROMPT
 from autofi_core import config as aegis_config
 
 
-def prepare_conservative_operator_messages(state: State) -> PromptValue:
+async def prepare_conservative_operator_messages(state: State) -> PromptValue:
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", AEGIS_OPERATOR_SYSTEM_PROMPT),
@@ -19,16 +19,16 @@ def prepare_conservative_operator_messages(state: State) -> PromptValue:
         ]
     )
 
-    return prompt.invoke({
-        "messages": state.get("messages"),
+    return await prompt.ainvoke({
+        "messages": await artifact_store.resolve_messages(state.get("messages")),
         "strategy_type": "conservative",
         "investment_recommendations": state.get("investment_recommendations")["1"],
-        "user_investments": state.get("user_investments"),
+        "user_investments": await artifact_store.resolve(state.get("user_investments")),
         "current_time": state.get("current_time"),
     })
 
 
-def prepare_balanced_operator_messages(state: State) -> PromptValue:
+async def prepare_balanced_operator_messages(state: State) -> PromptValue:
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", AEGIS_OPERATOR_SYSTEM_PROMPT),
@@ -36,16 +36,16 @@ def prepare_balanced_operator_messages(state: State) -> PromptValue:
         ]
     )
 
-    return prompt.invoke({
-        "messages": state.get("messages"),
+    return await prompt.ainvoke({
+        "messages": await artifact_store.resolve_messages(state.get("messages")),
         "strategy_type": "balanced",
         "investment_recommendations": state.get("investment_recommendations")["2"],
-        "user_investments": state.get("user_investments"),
+        "user_investments": await artifact_store.resolve(state.get("user_investments")),
         "current_time": state.get("current_time"),
     })
 
 
-def prepare_aggressive_operator_messages(state: State) -> PromptValue:
+async def prepare_aggressive_operator_messages(state: State) -> PromptValue:
     prompt = ChatPromptTemplate.from_messages(
         [
             ("system", AEGIS_OPERATOR_SYSTEM_PROMPT),
@@ -53,19 +53,17 @@ def prepare_aggressive_operator_messages(state: State) -> PromptValue:
         ]
     )
 
-    return prompt.invoke({
-        "messages": state.get("messages"),
+    return await prompt.ainvoke({
+        "messages": await artifact_store.resolve_messages(state.get("messages")),
         "strategy_type": "aggressive",
         "investment_recommendations": state.get("investment_recommendations")["3"],
-        "user_investments": state.get("user_investments"),
+        "user_investments": await artifact_store.resolve(state.get("user_investments")),
         "current_time": state.get("current_time"),
     })
 
 
-async def build_operator_agent(memory: MongoDBSaver, mcp_config: dict[str, StdioConnection], strategy_type: str):
+async def build_operator_agent(memory: MongoDBSaver, tools: list[BaseTool], strategy_type: str):
     llm = load_chat_model(aegis_config.llm.operator_model, 0.0)
-    client = MultiServerMCPClient(mcp_config)
-    tools = await client.get_tools()
 
     if strategy_type == "1":
         name = "ConservativeOperatorAgent"
@@ -0,0 +1,81 @@
+import asyncio
+import hashlib
+import json
+from datetime import datetime, timedelta, timezone
+
+from pymongo import ASCENDING
+from pymongo.collection import Collection
+
+from autofi_core import logger
+from autofi_core.common.messages import HelperGetInstrumentsResponse
+from autofi_core.common.model import InvestmentExpertSelectedModel
+from autofi_core.common.stats import third_party_error_counter
+
+
+def recommendation_fingerprint(instruments: HelperGetInstrumentsResponse, risk_reports: str, model: str,
+                               prompt: str) -> str:
+    """
+    Fingerprint of what the investment expert selects instruments from: the instruments on offer, the risk
+    reports, the model and its prompt. The hourly market data and the update times of the instruments change on
+    every run and are left out, the selection is refreshed for them after `agent.recommendation_max_age`.
+    """
+    payload = {
+        "instruments": sorted((instrument.model_dump(mode="json", exclude={"update_at", "instrument_data"})
+                               for instrument in instruments.instruments),
+                              key=lambda instrument: (instrument["chain_id"], instrument["instrument_id"])),
+        "risk_reports": risk_reports,
+        "model": model,
+        "prompt": prompt,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def selection_of(recommendations: dict) -> InvestmentExpertSelectedModel:
+    """Instrument ids of `State.investment_recommendations`, as sent to the helper."""
+    return InvestmentExpertSelectedModel(
+        selected_conservative_instrument_ids=[i["instrument_id"] for i in recommendations.get("1", [])],
+        selected_balanced_instrument_ids=[i["instrument_id"] for i in recommendations.get("2", [])],
+        selected_aggressive_instrument_ids=[i["instrument_id"] for i in recommendations.get("3", [])],
+    )
+
+
+class RecommendationStore:
+    """
+    Instruments selected by the investment expert, keyed by the fingerprint of its inputs, kept in Mongo next
+    to the checkpoints.
+
+    A selection is reused for `max_age` seconds at most, then the investment expert runs again even if its
+    inputs did not change. Older selections are removed by a TTL index. Mongo errors are logged and regarded as
+    misses, so the investment expert runs as without the store.
+    """
+
+    def __init__(self, collection: Collection, max_age: int):
+        self.collection = collection
+        self.max_age = max_age
+
+    def ensure_indexes(self):
+        self.collection.create_index([("expires_at", ASCENDING)], expireAfterSeconds=0)
+
+    async def get(self, fingerprint: str) -> dict | None:
+        try:
+            document = await asyncio.to_thread(self.collection.find_one, {
+                "_id": fingerprint,
+                "created_at": {"$gte": datetime.now(timezone.utc) - timedelta(seconds=self.max_age)},
+            })
+        except Exception as e:
+            third_party_error_counter.labels(service_name='mongo').inc()
+            logger.warning(f"[RecommendationStore - get] Could not read recommendations: {e}")
+            return None
+        return document["investment_recommendations"] if document else None
+
+    async def put(self, fingerprint: str, recommendations: dict):
+        now = datetime.now(timezone.utc)
+        try:
+            await asyncio.to_thread(self.collection.replace_one, {"_id": fingerprint}, {
+                "investment_recommendations": recommendations,
+                "created_at": now,
+                "expires_at": now + timedelta(seconds=self.max_age),
+            }, upsert=True)
+        except Exception as e:
+            third_party_error_counter.labels(service_name='mongo').inc()
+            logger.warning(f"[RecommendationStore - put] Could not save recommendations: {e}")
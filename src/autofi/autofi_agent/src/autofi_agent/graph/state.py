@@ -1,6 +1,6 @@
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from pydantic import BaseModel, Field, ConfigDict
-from typing import TypedDict, Literal, Any
+from typing import TypedDict, Literal, Any, Annotated
 
 
 class UserInstrumentsIntent(BaseModel):
@@ -128,9 +128,59 @@ class OperatorWork(BaseModel):
     model_config = ConfigDict(extra="forbid")
 
 
+RUN_MODE_FULL = "full"  # select the instruments, then run the operators for the users
+RUN_MODE_RECOMMEND = "recommend"  # only select the instruments
+RUN_MODE_SHARD = "shard"  # run the operators for the users in scope with preset recommendations
+RUN_MODE_TARGETED = "targeted"  # like "shard", for users scheduled immediately or whose positions changed
+PRESET_RUN_MODES = (RUN_MODE_SHARD, RUN_MODE_TARGETED)
+
+
+class UserScope(TypedDict, total=False):
+    """Users in `uids` when given, else users whose uid hash is in [start, end), see `loader.uid_hash`."""
+    start: int
+    end: int
+    uids: list[str]
+
+
+class FencingToken(TypedDict):
+    """Token of the lock acquisition a run was started under, stale once `counter_key` exceeds it."""
+    counter_key: str
+    token: int
+
+
+class OperatorBranch(TypedDict):
+    """Input of one operator branch when operators run in parallel."""
+    batch_id: str
+    strategy_type: Literal["conservative", "balanced", "aggressive"]
+    current_time: str
+    investment_recommendations: dict[str, list[SelectedInstrumentByInclinationState]]
+    user_investments: str
+    uids: list[str]  # users rendered in user_investments
+
+
+class OperatorReport(TypedDict):
+    strategy_type: str
+    intent_reports: list[str]  # outputs of the create_intent_transaction tool
+    error: str | None
+
+
+def merge_operator_reports(left: list[OperatorReport] | None,
+                           right: list[OperatorReport] | None) -> list[OperatorReport]:
+    """Append the reports of finished operator branches, a `None` update clears them."""
+    if right is None:
+        return []
+    return (left or []) + right
+
+
 # States
 class State(AgentState):
-    batch_id: str
+    run_mode: Literal["full", "recommend", "shard", "targeted"] | None  # input, defaults to "full"
+    # input of "shard" and "targeted" runs
+    preset_recommendations: dict[str, list[SelectedInstrumentByInclinationState]] | None
+    user_scope: UserScope | None  # input, users processed by the run, all of them when None
+    recommendation_fingerprint: str | None  # of the investment expert inputs, its selection is stored under it
+    fencing: FencingToken | None  # input, the run stops writing once its lock was acquired again elsewhere
+    batch_id: str  # may be given as input, generated otherwise
     current_time: str
     risk_reports: str
     investment_recommendations: dict[str, list[SelectedInstrumentByInclinationState]]
@@ -138,3 +188,5 @@ class State(AgentState):
     structured_response: dict[str, Any] | None
     message_delete_cursor: int | None
     user_investments: str | None
+    operator_batch_uids: list[str] | None
+    operator_reports: Annotated[list[OperatorReport], merge_operator_reports]
@@ -0,0 +1,69 @@
+import inspect
+import time
+from typing import Any, Callable, Awaitable
+
+from fastmcp import Context
+from langchain_core.tools import BaseTool, StructuredTool
+from pydantic import create_model
+
+from autofi_core import logger
+from autofi_core.common.stats import mcp_tool_call_time
+from .investment_expert_helper import get_instruments
+from .operator_helper import create_intent_transaction
+
+
+TOOL_TRANSPORT_STDIO = "stdio"
+TOOL_TRANSPORT_IN_PROCESS = "in_process"
+
+HELPER_TOOLS: dict[str, list[Callable[..., Awaitable[str]]]] = {
+    "investment_expert_helper": [get_instruments],
+    "operator_helper": [create_intent_transaction],
+}
+
+
+class InProcessContext:
+    """Stand-in for the fastmcp `Context` of a tool called in the agent process, logging what it reports."""
+
+    def __init__(self, tool: str):
+        self.tool = tool
+
+    async def debug(self, message: str, *args, **kwargs):
+        logger.debug(f"[InProcessContext - {self.tool}] {message}")
+
+    async def info(self, message: str, *args, **kwargs):
+        logger.info(f"[InProcessContext - {self.tool}] {message}")
+
+    async def warning(self, message: str, *args, **kwargs):
+        logger.warning(f"[InProcessContext - {self.tool}] {message}")
+
+    async def error(self, message: str, *args, **kwargs):
+        logger.error(f"[InProcessContext - {self.tool}] {message}")
+
+
+def to_langchain_tool(server: str, fn: Callable[..., Awaitable[str]]) -> BaseTool:
+    """The helper function `fn` as a LangChain tool with the arguments and description its MCP tool has."""
+    fields: dict[str, Any] = {}
+    context_param = None
+    for name, param in inspect.signature(fn).parameters.items():
+        if param.annotation is Context:
+            context_param = name
+            continue
+        fields[name] = (param.annotation, ... if param.default is inspect.Parameter.empty else param.default)
+    args_schema = create_model(f"{fn.__name__}_args", **fields)
+
+    async def call(**kwargs) -> str:
+        if context_param:
+            kwargs[context_param] = InProcessContext(fn.__name__)
+        start = time.perf_counter()
+        try:
+            return await fn(**kwargs)
+        finally:
+            mcp_tool_call_time.labels(server, fn.__name__, "handler").observe(time.perf_counter() - start)
+
+    return StructuredTool.from_function(coroutine=call, name=fn.__name__, description=inspect.getdoc(fn) or "",
+                                        args_schema=args_schema)
+
+
+def get_in_process_tools(server: str) -> list[BaseTool]:
+    """Tools of the helper `server` run in the agent process, sharing its NATS connection, without MCP."""
+    return [to_langchain_tool(server, fn) for fn in HELPER_TOOLS[server]]
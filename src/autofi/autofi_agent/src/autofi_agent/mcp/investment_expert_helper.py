@@ -3,8 +3,6 @@ from fastmcp import FastMCP, Context
 from contextlib import asynccontextmanager
 from typing import AsyncIterator, Any, Dict
 import nats.errors as nats_errors
-import json
-from datetime import datetime
 import logging
 from fastmcp.utilities.logging import get_logger
 
@@ -15,6 +13,11 @@ from autofi_core.common.messages import (HelperGetInstrumentsRequest, HelperGetI
                                          HelperGetInvestment, HelperIngressInvestmentRecommendationRequest,
                                          QuerierIngressQuerierImmediatelyQueryRequest)
 from autofi_core.common.model import InvestmentExpertSelectedModel
+from autofi_core.common.cache import TieredCache, get_cache_key, next_hour_boundary
+from autofi_core.common.stats import prompt_tokens_summary
+from autofi_agent.prompt.encoding import get_prompt_encoder, estimate_tokens
+from autofi_agent.prompt.summary import summarize_instruments, INSTRUMENT_HISTORY_SUMMARY
+from autofi_agent.mcp.timing import HandlerTimingMiddleware
 
 
 previous_batch_id = ""
@@ -24,6 +27,12 @@ UserInvestmentsBatch = Dict[str, InvestmentsByInclination]
 user_investments_batch: UserInvestmentsBatch = {}
 logger = get_logger(__name__)
 logger.setLevel(logging.WARNING)
+instruments_cache: TieredCache[HelperGetInstrumentsResponse] = TieredCache(
+    "instruments",
+    encode=lambda resp: resp.model_dump_json(),
+    decode=HelperGetInstrumentsResponse.model_validate_json,
+    max_entries=16,
+)
 
 
 @asynccontextmanager
@@ -56,9 +65,9 @@ mcp = FastMCP(
         """,
     lifespan=server_lifespan,  # Use the lifespan context manager
 )
+mcp.add_middleware(HandlerTimingMiddleware())
 
 
-@mcp.tool()
 async def get_instruments(ctx: Context) -> str:
     """
     Get all instruments that are pools in which AutoFi can help users invest (such as Morpho’s Vaults, Aave’s Pools, etc.).
@@ -68,19 +77,13 @@ async def get_instruments(ctx: Context) -> str:
         str: Instruments with their details.
     """
     try:
-        nats = await get_nats_connection(config.nats.url, config.nats.timeout)
         req_id = str(uuid.uuid4())
         await ctx.debug(f"Created request ID {req_id} for get instruments")
         req = HelperGetInstrumentsRequest(
             req_id=req_id,
             with_data=True
         )
-        response = await nats.client.request(
-            subject=SUBJECTS_HELPER_INGRESS_GET_INSTRUMENTS,
-            payload=req.model_dump_json().encode("utf-8"),
-            timeout=5
-        )
-        resp = HelperGetInstrumentsResponse.model_validate_json(response.data)
+        resp = await get_instruments_response(req)
         if resp.error:
             await ctx.error(f"Error in response: {resp.error}")
             content = f"error occurred when requesting get_instruments tool: {resp.error}"
@@ -88,33 +91,13 @@ async def get_instruments(ctx: Context) -> str:
         if len(resp.instruments) == 0:
             content = "no instruments found"
             return content
-        lines = [
-            f"{len(resp.instruments)} investment pools found.",
-            "Each pool includes: basic information, strategy category (CONSERVATIVE, BALANCED, AGGRESSIVE), "
-            "APY, and current liquidity.",
-        ]
-        for instrument in resp.instruments:
-            i: dict = {
-                "instrument_id": instrument.instrument_id,
-                "chain_id": instrument.chain_id,
-                "protocol_name": instrument.protocol_name,
-                "strategy_type": get_human_readable_strategy_inclination(instrument.strategy_type),
-                "underlying_asset": instrument.underlying_asset,
-                "underlying_asset_token_symbol": instrument.symbol,
-                "curator": instrument.curator,
-            }
-            if instrument.instrument_data:
-                i["instrument_data"] = [
-                    {
-                        "hourly_timestamp": get_human_readable_time(data.hourly_timestamp),
-                        "apy": data.apy,
-                        "supply_amount": data.supply_amount,
-                        "supply_amount_in_usd": data.supply_amount_usd,
-                        "utilization": data.utilization
-                    } for data in instrument.instrument_data
-                ]
-            lines.append(json.dumps(i, ensure_ascii=False, indent=2))
-        return "\n".join(lines)
+        summaries = None
+        if config.agent.instrument_history_mode == INSTRUMENT_HISTORY_SUMMARY:
+            summaries = summarize_instruments(resp.instruments, config.agent.instrument_daily_series)
+        instruments_info = get_prompt_encoder().instruments(resp.instruments, summaries)
+        prompt_tokens_summary.labels("instruments", config.agent.prompt_format).observe(
+            estimate_tokens(instruments_info))
+        return instruments_info
     except nats_errors.Error as e:
         await ctx.error("NATS request error: " + str(e))
         return "internal error when requesting get_instruments tool"
@@ -123,6 +106,43 @@ async def get_instruments(ctx: Context) -> str:
         return f"error when requesting get_instruments tool {e}"
 
 
+# registered without decorating, the function stays callable by the in-process tools
+mcp.tool()(get_instruments)
+
+
+async def request_instruments(req: HelperGetInstrumentsRequest) -> HelperGetInstrumentsResponse:
+    nats = await get_nats_connection(config.nats.url, config.nats.timeout)
+    response = await nats.client.request(
+        subject=SUBJECTS_HELPER_INGRESS_GET_INSTRUMENTS,
+        payload=req.model_dump_json().encode("utf-8"),
+        timeout=5
+    )
+    return HelperGetInstrumentsResponse.model_validate_json(response.data)
+
+
+async def get_instruments_response(req: HelperGetInstrumentsRequest) -> HelperGetInstrumentsResponse:
+    """
+    Get instruments through the instruments cache. Instrument data is hourly, so cached results expire at the
+    next hourly boundary, plus a delay for the new hour's data to land. A helper spawned for a single tool call
+    only hits the Redis tier, the in-process tier needs the session pool or the in-process transport.
+    """
+    if not config.agent.instruments_cache_enabled:
+        return await request_instruments(req)
+    key = get_cache_key(
+        chain_ids=req.chain_ids,
+        instrument_ids=req.instrument_ids,
+        protocol_name=req.protocol_name,
+        underlying_assets=req.underlying_assets,
+        with_data=req.with_data,
+    )
+    return await instruments_cache.get_or_load(
+        key,
+        lambda: request_instruments(req),
+        expires_at=next_hour_boundary(config.agent.instruments_cache_delay),
+        should_cache=lambda resp: not resp.error,
+    )
+
+
 async def send_investment_recommendations(selection: InvestmentExpertSelectedModel):
     try:
         nats = await get_nats_connection(config.nats.url, config.nats.timeout)
@@ -167,30 +187,6 @@ def get_all_queriers() -> list[str]:
     return queriers
 
 
-def get_human_readable_time(timestamp: int) -> str:
-    try:
-        dt = datetime.fromtimestamp(timestamp)
-        return dt.strftime('%Y-%m-%d %H:%M:%S')
-    except Exception:
-        return str(timestamp)
-
-
-def get_human_readable_strategy_inclination(strategy_type: str) -> str:
-    """
-    Convert strategy type code to human-readable string.
-    """
-    if strategy_type == "0":
-        return "DISABLED"
-    elif strategy_type == "1":
-        return "CONSERVATIVE"
-    elif strategy_type == "2":
-        return "BALANCED"
-    elif strategy_type == "3":
-        return "AGGRESSIVE"
-    else:
-        return "UNKNOWN"
-
-
 # Run the server
 if __name__ == "__main__":
     print("Starting MCP server with stdio transport")
@@ -11,11 +11,11 @@ from fastmcp.utilities.logging import get_logger
 
 from autofi_core import (get_nats_connection, close_nats_connection, NATSError, config,
                          SUBJECTS_HELPER_INGRESS_GET_ALL_USERS_INVESTMENTS,
-                         SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION,
-                         SUBJECTS_PROCESSED_HELPER)
+                         SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION)
 from autofi_core.common.messages import (HelperGetAllUsersInvestmentsRequest, HelperGetAllUsersInvestmentsResponse,
                                          UserInstrumentsIntent, HelperInstrumentsIntentRequest,
                                          HelperInstrumentsIntentResponse, HelperResponse)
+from autofi_agent.mcp.timing import HandlerTimingMiddleware
 
 
 logger = get_logger(__name__)
@@ -52,9 +52,9 @@ mcp = FastMCP(
         """,
     lifespan=server_lifespan,  # Use the lifespan context manager
 )
+mcp.add_middleware(HandlerTimingMiddleware())
 
 
-@mcp.tool()
 async def create_intent_transaction(ctx: Context,
                                     intents: list[UserInstrumentsIntent] = Field(
                                         description="A list of user intents for which to create transactions"),
@@ -96,89 +96,52 @@ async def create_intent_transaction(ctx: Context,
         return f"error when requesting create_intent_transaction tool {e}"
 
 
+# registered without decorating, the function stays callable by the in-process tools
+mcp.tool()(create_intent_transaction)
+
+
 async def send_intent_transaction(intents: list[UserInstrumentsIntent]) -> HelperInstrumentsIntentResponse:
     nats = await get_nats_connection(config.nats.url, config.nats.timeout)
     req_id = str(uuid.uuid4())
-    reply_subject = f"{SUBJECTS_PROCESSED_HELPER}.{req_id}"
     logger.debug(f"Created request ID {req_id} for create_intent_transaction")
 
-    loop = asyncio.get_running_loop()
-    future = loop.create_future()
-
-    async def message_handler(msg):
-        try:
-            async_resp = HelperInstrumentsIntentResponse.model_validate_json(msg.data)
-            future.set_result(async_resp)
-        except Exception as e:
-            future.set_exception(e)
-
-    sid = await nats.client.subscribe(reply_subject, cb=message_handler)
-    try:
-        req = HelperInstrumentsIntentRequest(
-            req_id=req_id,
-            intents=intents
-        )
-        response = await nats.client.request(
-            subject=SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION,
-            payload=req.model_dump_json().encode("utf-8"),
-            timeout=50
-        )
-
-        resp = HelperResponse.model_validate_json(response.data)
-        if resp.error:
-            raise NATSError(f"Error in response: {resp.error}")
-
-        r = await asyncio.wait_for(future, timeout=config.nats.async_response_timeout)
-
-        return r
-    except Exception as e:
-        raise e
-    finally:
-        await sid.unsubscribe()
+    req = HelperInstrumentsIntentRequest(
+        req_id=req_id,
+        intents=intents
+    )
+    return await nats.call(
+        SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION,
+        req,
+        HelperResponse,
+        HelperInstrumentsIntentResponse,
+        ack_timeout=50,
+        timeout=config.nats.async_response_timeout
+    )
 
 
-async def get_all_investments_with_offset(offset: int) -> HelperGetAllUsersInvestmentsResponse | None:
+async def get_all_investments_with_offset(offset: int, limit: int = 100) -> HelperGetAllUsersInvestmentsResponse | None:
     nats = await get_nats_connection(config.nats.url, config.nats.timeout)
     req_id = str(uuid.uuid4())
-    reply_subject = f"{SUBJECTS_PROCESSED_HELPER}.{req_id}"
-
-    # Create a future to wait for the asynchronous response
-    loop = asyncio.get_running_loop()
-    future = loop.create_future()
-
-    async def message_handler(msg):
-        try:
-            async_resp = HelperGetAllUsersInvestmentsResponse.model_validate_json(msg.data)
-            if async_resp.error:
-                future.set_exception(NATSError(f"Error in response: {async_resp.error}"))
-            else:
-                future.set_result(async_resp)
-        except Exception as e:
-            future.set_exception(e)
-
-    sid = await nats.client.subscribe(reply_subject, cb=message_handler)
 
     req = HelperGetAllUsersInvestmentsRequest(
         req_id=req_id,
         offset=offset,
-        limit=100
-    )
-    response = await nats.client.request(
-        subject=SUBJECTS_HELPER_INGRESS_GET_ALL_USERS_INVESTMENTS,
-        payload=req.model_dump_json().encode("utf-8"),
-        timeout=100
+        limit=limit
     )
-    resp = HelperResponse.model_validate_json(response.data)
-    if resp.error:
-        raise NATSError(f"Error in response: {resp.error}")
-
     try:
-        r = await asyncio.wait_for(future, timeout=config.nats.async_response_timeout)
-        return r
+        r = await nats.call(
+            SUBJECTS_HELPER_INGRESS_GET_ALL_USERS_INVESTMENTS,
+            req,
+            HelperResponse,
+            HelperGetAllUsersInvestmentsResponse,
+            ack_timeout=100,
+            timeout=config.nats.async_response_timeout
+        )
     except asyncio.TimeoutError:
         raise NATSError(f"Timeout waiting for async response for req_id {req_id}")
-    finally:
-        await sid.unsubscribe()
+    if r.error:
+        raise NATSError(f"Error in response: {r.error}")
+    return r
 
 
 # Run the server
@@ -0,0 +1,153 @@
+import asyncio
+import time
+from typing import Any
+
+from langchain_core.tools import BaseTool
+from langchain_mcp_adapters.sessions import Connection, create_session
+from langchain_mcp_adapters.tools import load_mcp_tools
+from mcp import ClientSession
+
+from autofi_core import logger
+from autofi_core.common.stats import mcp_tool_call_time, mcp_session_start_time, mcp_session_restart_counter
+from .timing import HANDLER_TIME_META_KEY
+
+
+MAX_RESTART_BACKOFF = 60.0
+
+
+class McpSessionUnavailable(Exception):
+    pass
+
+
+class PooledSession:
+    """
+    Stand-in for the session of a pooled helper, forwarding each request to its current session so the tools
+    loaded from it outlive restarts of the helper.
+    """
+
+    def __init__(self, pool: "McpSessionPool", server: str):
+        self.pool = pool
+        self.server = server
+
+    async def call_tool(self, name: str, arguments: dict[str, Any] | None = None, *args, **kwargs):
+        start = time.perf_counter()
+        session = await self.pool.session(self.server)
+        sent = time.perf_counter()
+        try:
+            result = await session.call_tool(name, arguments, *args, **kwargs)
+        except Exception:
+            # the helper may be gone, check it now rather than at the next health check
+            self.pool.check(self.server)
+            raise
+        elapsed = time.perf_counter() - sent
+        mcp_tool_call_time.labels(self.server, name, "spawn").observe(sent - start)
+        handler = (result.meta or {}).get(HANDLER_TIME_META_KEY)
+        if isinstance(handler, (int, float)):
+            mcp_tool_call_time.labels(self.server, name, "handler").observe(handler)
+            mcp_tool_call_time.labels(self.server, name, "transport").observe(max(elapsed - handler, 0.0))
+        else:
+            # helpers without HandlerTimingMiddleware
+            mcp_tool_call_time.labels(self.server, name, "call").observe(elapsed)
+        return result
+
+    def __getattr__(self, item: str):
+        async def forward(*args, **kwargs):
+            session = await self.pool.session(self.server)
+            return await getattr(session, item)(*args, **kwargs)
+
+        return forward
+
+
+class McpSessionPool:
+    """
+    One long-lived session per MCP helper, shared by all the agents using its tools, instead of a helper
+    process spawned for each tool call.
+
+    Each session is held open by a supervisor task, which pings the helper every `health_check_interval` seconds
+    and restarts it, with an exponential backoff from `restart_backoff` seconds, once it does not answer within
+    `health_check_timeout` seconds. Requests wait up to `start_timeout` seconds for a helper being (re)started,
+    this wait is reported as the spawn time of tool calls.
+    """
+
+    def __init__(self, connections: dict[str, Connection], health_check_interval: float,
+                 health_check_timeout: float, start_timeout: float, restart_backoff: float):
+        self.connections = connections
+        self.health_check_interval = health_check_interval
+        self.health_check_timeout = health_check_timeout
+        self.start_timeout = start_timeout
+        self.restart_backoff = restart_backoff
+        self.sessions: dict[str, ClientSession | None] = {name: None for name in connections}
+        self.ready = {name: asyncio.Event() for name in connections}
+        self.wake = {name: asyncio.Event() for name in connections}
+        self.supervisors: dict[str, asyncio.Task] = {}
+        self.closed = False
+
+    def start(self):
+        for name in self.connections:
+            if name not in self.supervisors:
+                self.supervisors[name] = asyncio.create_task(self._supervise(name), name=f"mcp-{name}")
+
+    async def session(self, name: str) -> ClientSession:
+        if self.closed:
+            raise McpSessionUnavailable(f"Session pool closed, helper {name} unavailable")
+        try:
+            await asyncio.wait_for(self.ready[name].wait(), self.start_timeout)
+        except asyncio.TimeoutError:
+            raise McpSessionUnavailable(f"Helper {name} not started within {self.start_timeout}s")
+        return self.sessions[name]
+
+    async def get_tools(self, name: str) -> list[BaseTool]:
+        return await load_mcp_tools(PooledSession(self, name))
+
+    def check(self, name: str):
+        """Health check of the helper at once."""
+        self.wake[name].set()
+
+    async def _supervise(self, name: str):
+        failures = 0
+        while not self.closed:
+            start = time.perf_counter()
+            try:
+                async with create_session(self.connections[name]) as session:
+                    await asyncio.wait_for(session.initialize(), self.start_timeout)
+                    mcp_session_start_time.labels(name).observe(time.perf_counter() - start)
+                    logger.info(f"[McpSessionPool - _supervise] helper {name} started")
+                    self.sessions[name] = session
+                    self.ready[name].set()
+                    failures = 0
+                    await self._watch(name, session)
+            except Exception as e:
+                logger.warning(f"[McpSessionPool - _supervise] helper {name} failed: {e}")
+            finally:
+                self.ready[name].clear()
+                self.sessions[name] = None
+            if self.closed:
+                break
+            mcp_session_restart_counter.labels(name).inc()
+            await asyncio.sleep(min(self.restart_backoff * 2 ** failures, MAX_RESTART_BACKOFF))
+            failures += 1
+
+    async def _watch(self, name: str, session: ClientSession):
+        wake = self.wake[name]
+        while not self.closed:
+            try:
+                await asyncio.wait_for(wake.wait(), self.health_check_interval)
+            except asyncio.TimeoutError:
+                pass
+            wake.clear()
+            if self.closed:
+                return
+            # a failed or late answer ends the session, the helper is then restarted
+            await asyncio.wait_for(session.send_ping(), self.health_check_timeout)
+
+    async def close(self):
+        self.closed = True
+        for name in self.connections:
+            self.wake[name].set()
+        supervisors = list(self.supervisors.values())
+        if supervisors:
+            _, pending = await asyncio.wait(supervisors, timeout=self.health_check_timeout)
+            for task in pending:
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        self.supervisors.clear()
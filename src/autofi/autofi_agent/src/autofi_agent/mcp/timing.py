@@ -0,0 +1,19 @@
+import time
+
+from fastmcp.server.middleware import Middleware, MiddlewareContext, CallNext
+from fastmcp.tools.tool import ToolResult
+import mcp.types as mt
+
+
+HANDLER_TIME_META_KEY = "aegis/handler_seconds"
+
+
+class HandlerTimingMiddleware(Middleware):
+    """Reports the time spent in the tool handler in the `_meta` of its result, read by `McpSessionPool`."""
+
+    async def on_call_tool(self, context: MiddlewareContext[mt.CallToolRequestParams],
+                           call_next: CallNext[mt.CallToolRequestParams, ToolResult]) -> ToolResult:
+        start = time.perf_counter()
+        result = await call_next(context)
+        result.meta = {**(result.meta or {}), HANDLER_TIME_META_KEY: time.perf_counter() - start}
+        return result
@@ -0,0 +1,339 @@
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+from datetime import datetime
+
+from autofi_core import config as aegis_config
+from autofi_core.common.messages import HelperGetInvestment, HelperGetInstrument
+from .summary import InstrumentSummary
+
+
+PROMPT_FORMAT_JSON = "json"
+PROMPT_FORMAT_COMPACT = "compact"
+
+STRATEGY_TYPE_NAMES = {
+    "0": "DISABLED",
+    "1": "CONSERVATIVE",
+    "2": "BALANCED",
+    "3": "AGGRESSIVE",
+}
+
+STRATEGY_TYPE_CODES_LEGEND = ("Strategy type codes:\n"
+                              "  '0' - DISABLED\n"
+                              "  '1' - CONSERVATIVE\n"
+                              "  '2' - BALANCED\n"
+                              "  '3' - AGGRESSIVE\n")
+
+
+def get_human_readable_time(timestamp: int) -> str:
+    try:
+        dt = datetime.fromtimestamp(timestamp)
+        return dt.strftime('%Y-%m-%d %H:%M:%S')
+    except Exception:
+        return str(timestamp)
+
+
+def get_human_readable_strategy_inclination(strategy_type: str) -> str:
+    """
+    Convert strategy type code to human-readable string.
+    """
+    return STRATEGY_TYPE_NAMES.get(strategy_type, "UNKNOWN")
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count of a prompt fragment, about 4 characters per token."""
+    return len(text) // 4 + 1
+
+
+def format_number(value: float) -> float | None:
+    """Round a statistic for the prompt, None when it is not available."""
+    return None if math.isnan(value) else float(f"{value:.6g}")
+
+
+def get_relative_time(timestamp: int, now: float | None = None) -> str:
+    """Age of a timestamp relative to now, e.g. '-3h' or '-5d'."""
+    seconds = (now or time.time()) - timestamp
+    if seconds < 3600:
+        return f"-{max(int(seconds // 60), 0)}m"
+    if seconds < 48 * 3600:
+        return f"-{int(seconds // 3600)}h"
+    return f"-{int(seconds // 86400)}d"
+
+
+class PromptEncoder(ABC):
+    """Renders the records handed to the agents' prompts."""
+
+    @abstractmethod
+    def user_investment(self, uid: str, investment: HelperGetInvestment) -> str:
+        """Render one user's investment block, blocks are rendered separately so they can be packed in batches."""
+
+    @abstractmethod
+    def user_investments(self, blocks: list[str]) -> str:
+        """Assemble user investment blocks into the operator prompt section."""
+
+    @abstractmethod
+    def instruments(self, instruments: list[HelperGetInstrument],
+                    summaries: dict[str, InstrumentSummary] | None = None) -> str:
+        """Render instruments with their hourly data, or with the summaries of it when given."""
+
+
+class JsonPromptEncoder(PromptEncoder):
+    """One indented JSON object per record, with human readable times."""
+
+    def user_investment(self, uid: str, investment: HelperGetInvestment) -> str:
+        i: dict = {
+            "uid": uid,
+            "strategy_type_user_chosen": investment.mandate.next_strategy,
+            "existed_positions": []
+        }
+        if investment.blacklist_protocol_names:
+            i["blacklist_protocol_names"] = [b for b in investment.blacklist_protocol_names]
+
+        if investment.positions:
+            for position in investment.positions:
+                i["existed_positions"].append({
+                    "chain_id": position.position_data.chain_id,
+                    "instrument_id": position.position_data.instrument_id,
+                    "asset": position.position_data.asset,
+                    "asset_amount": position.position_data.asset_amount,
+                    "asset_amount_in_usd": f'${position.position_data.asset_amount_usd}',
+                    "pnl_in_usd": f'${position.position_data.pnl_usd}',
+                    "timestamp": get_human_readable_time(position.position_data.timestamp),
+                })
+        if investment.last_transaction:
+            i["last_transaction_dealt_by_you"] = get_human_readable_time(investment.last_transaction.tx_time)
+        if investment.uninvested_value:
+            i["uninvested_value_in_usd"] = f'${investment.uninvested_value}'
+        return json.dumps(i, ensure_ascii=False, indent=2)
+
+    def user_investments(self, blocks: list[str]) -> str:
+        lines = [
+            f"Investment information for {len(blocks)} user(s) retrieved.",
+            "You may use these details to create intent transactions and help users discover "
+            "better investment opportunities.",
+            "Details for each user:",
+        ]
+        lines.extend(blocks)
+        lines.append(STRATEGY_TYPE_CODES_LEGEND)
+        return "\n".join(lines)
+
+    def instruments(self, instruments: list[HelperGetInstrument],
+                    summaries: dict[str, InstrumentSummary] | None = None) -> str:
+        lines = [
+            f"{len(instruments)} investment pools found.",
+            "Each pool includes: basic information, strategy category (CONSERVATIVE, BALANCED, AGGRESSIVE), "
+            "APY, and current liquidity.",
+        ]
+        for instrument in instruments:
+            i: dict = {
+                "instrument_id": instrument.instrument_id,
+                "chain_id": instrument.chain_id,
+                "protocol_name": instrument.protocol_name,
+                "strategy_type": get_human_readable_strategy_inclination(instrument.strategy_type),
+                "underlying_asset": instrument.underlying_asset,
+                "underlying_asset_token_symbol": instrument.symbol,
+                "curator": instrument.curator,
+            }
+            if summaries is not None:
+                if instrument.instrument_id in summaries:
+                    i.update(self.summary(summaries[instrument.instrument_id]))
+            elif instrument.instrument_data:
+                i["instrument_data"] = [
+                    {
+                        "hourly_timestamp": get_human_readable_time(data.hourly_timestamp),
+                        "apy": data.apy,
+                        "supply_amount": data.supply_amount,
+                        "supply_amount_in_usd": data.supply_amount_usd,
+                        "utilization": data.utilization
+                    } for data in instrument.instrument_data
+                ]
+            lines.append(json.dumps(i, ensure_ascii=False, indent=2))
+        return "\n".join(lines)
+
+    @staticmethod
+    def summary(summary: InstrumentSummary) -> dict:
+        s: dict = {
+            "apy_summary": {
+                "hourly_points": summary.points,
+                "latest": format_number(summary.latest_apy),
+                "mean": format_number(summary.mean_apy),
+                "min": format_number(summary.min_apy),
+                "max": format_number(summary.max_apy),
+                "change_24h": format_number(summary.apy_change_24h),
+                "change_7d": format_number(summary.apy_change_7d),
+                "volatility": format_number(summary.apy_volatility),
+            },
+            "utilization_summary": {
+                "latest": format_number(summary.latest_utilization),
+                "p90": format_number(summary.utilization_p90),
+            },
+            "supply_summary": {
+                "latest_in_usd": format_number(summary.supply_amount_usd),
+                "change_7d_ratio": format_number(summary.supply_change_7d),
+            },
+        }
+        if summary.daily:
+            s["daily_data"] = [
+                {
+                    "days_ago": d.age_days,
+                    "apy": format_number(d.apy),
+                    "utilization": format_number(d.utilization),
+                    "supply_amount_in_usd": format_number(d.supply_amount_usd),
+                } for d in summary.daily
+            ]
+        return s
+
+
+class CompactPromptEncoder(PromptEncoder):
+    """
+    Tabular rendering: a header row naming the columns once, then one '|' separated row per record.
+    Times are ages relative to now and repeated asset addresses are listed once.
+    """
+
+    separator = "|"
+
+    def row(self, *values) -> str:
+        return self.separator.join("" if v is None else str(v) for v in values)
+
+    def user_investment(self, uid: str, investment: HelperGetInvestment) -> str:
+        now = time.time()
+        lines = [self.row(
+            "U",
+            uid,
+            investment.mandate.next_strategy,
+            f"${investment.uninvested_value}" if investment.uninvested_value else "",
+            get_relative_time(investment.last_transaction.tx_time, now) if investment.last_transaction else "",
+            ",".join(investment.blacklist_protocol_names or []),
+        )]
+        for position in investment.positions or []:
+            data = position.position_data
+            lines.append(self.row(
+                "P",
+                data.chain_id,
+                data.instrument_id,
+                data.asset,
+                data.asset_amount,
+                f"${data.asset_amount_usd}",
+                f"${data.pnl_usd}",
+                get_relative_time(data.timestamp, now),
+            ))
+        return "\n".join(lines)
+
+    def user_investments(self, blocks: list[str]) -> str:
+        lines = [
+            f"Investment information for {len(blocks)} user(s) retrieved.",
+            "You may use these details to create intent transactions and help users discover "
+            "better investment opportunities.",
+            "Each user is a U row followed by a P row for each of their existing positions. Ages are relative "
+            "to the current time.",
+            self.row("U", "uid", "strategy_type_user_chosen", "uninvested_value_in_usd",
+                     "last_transaction_dealt_by_you_age", "blacklist_protocol_names"),
+            self.row("P", "chain_id", "instrument_id", "asset", "asset_amount", "asset_amount_in_usd", "pnl_in_usd",
+                     "age"),
+        ]
+        lines.extend(blocks)
+        lines.append(STRATEGY_TYPE_CODES_LEGEND)
+        return "\n".join(lines)
+
+    def instruments(self, instruments: list[HelperGetInstrument],
+                    summaries: dict[str, InstrumentSummary] | None = None) -> str:
+        now = time.time()
+        assets: dict[tuple[str, str], str] = {}
+        asset_lines = []
+        instrument_lines = []
+        data_lines = []
+        summary_lines = []
+        daily_lines = []
+        for instrument in instruments:
+            key = (instrument.chain_id, instrument.underlying_asset)
+            if key not in assets:
+                assets[key] = f"A{len(assets) + 1}"
+                asset_lines.append(self.row(assets[key], instrument.chain_id, instrument.underlying_asset,
+                                            instrument.symbol))
+            instrument_lines.append(self.row(
+                instrument.instrument_id,
+                instrument.chain_id,
+                instrument.protocol_name,
+                get_human_readable_strategy_inclination(instrument.strategy_type),
+                assets[key],
+                instrument.curator,
+            ))
+            if summaries is not None:
+                summary = summaries.get(instrument.instrument_id)
+                if summary:
+                    summary_lines.append(self.row(
+                        instrument.instrument_id,
+                        summary.points,
+                        *(format_number(v) for v in (
+                            summary.latest_apy, summary.mean_apy, summary.min_apy, summary.max_apy,
+                            summary.apy_change_24h, summary.apy_change_7d, summary.apy_volatility,
+                            summary.latest_utilization, summary.utilization_p90,
+                            summary.supply_amount_usd, summary.supply_change_7d)),
+                    ))
+                    for d in summary.daily:
+                        daily_lines.append(self.row(
+                            instrument.instrument_id,
+                            f"-{d.age_days}d",
+                            format_number(d.apy),
+                            format_number(d.utilization),
+                            format_number(d.supply_amount_usd),
+                        ))
+                continue
+            for data in instrument.instrument_data or []:
+                data_lines.append(self.row(
+                    instrument.instrument_id,
+                    get_relative_time(data.hourly_timestamp, now),
+                    data.apy,
+                    data.supply_amount,
+                    data.supply_amount_usd,
+                    data.utilization,
+                ))
+
+        lines = [
+            f"{len(instruments)} investment pools found.",
+            "Each pool includes: basic information, strategy category (CONSERVATIVE, BALANCED, AGGRESSIVE), "
+            "APY, and current liquidity.",
+            "Underlying assets:",
+            self.row("asset_ref", "chain_id", "address", "symbol"),
+            *asset_lines,
+            "Pools:",
+            self.row("instrument_id", "chain_id", "protocol_name", "strategy_type", "asset_ref", "curator"),
+            *instrument_lines,
+        ]
+        if data_lines:
+            lines.extend([
+                "Hourly data, ages are relative to the current time:",
+                self.row("instrument_id", "age", "apy", "supply_amount", "supply_amount_in_usd", "utilization"),
+                *data_lines,
+            ])
+        if summary_lines:
+            lines.extend([
+                "Hourly data summary, changes are absolute for APY and relative for supply:",
+                self.row("instrument_id", "hourly_points", "latest_apy", "mean_apy", "min_apy", "max_apy",
+                         "apy_change_24h", "apy_change_7d", "apy_volatility", "latest_utilization",
+                         "utilization_p90", "supply_amount_in_usd", "supply_change_7d"),
+                *summary_lines,
+            ])
+        if daily_lines:
+            lines.extend([
+                "Daily averages, ages are relative to the latest hourly data:",
+                self.row("instrument_id", "age", "apy", "utilization", "supply_amount_in_usd"),
+                *daily_lines,
+            ])
+        return "\n".join(lines)
+
+
+PROMPT_ENCODERS: dict[str, type[PromptEncoder]] = {
+    PROMPT_FORMAT_JSON: JsonPromptEncoder,
+    PROMPT_FORMAT_COMPACT: CompactPromptEncoder,
+}
+
+
+def get_prompt_encoder(prompt_format: str | None = None) -> PromptEncoder:
+    """Return the encoder of the given format, defaulting to `agent.prompt_format`."""
+    prompt_format = prompt_format or aegis_config.agent.prompt_format
+    try:
+        return PROMPT_ENCODERS[prompt_format]()
+    except KeyError:
+        raise ValueError(f"Unknown prompt format: {prompt_format}")
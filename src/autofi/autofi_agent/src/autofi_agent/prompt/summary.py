@@ -0,0 +1,111 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+
+from autofi_core.common.messages import HelperGetInstrument
+
+
+INSTRUMENT_HISTORY_RAW = "raw"
+INSTRUMENT_HISTORY_SUMMARY = "summary"
+
+HOUR = 3600
+DAY = 24 * HOUR
+
+
+@dataclass
+class DailyPoint:
+    age_days: int
+    apy: float
+    utilization: float
+    supply_amount_usd: float
+
+
+@dataclass
+class InstrumentSummary:
+    """Statistics of an instrument's hourly series, NaN where the series is too short."""
+    points: int
+    latest_apy: float
+    mean_apy: float
+    min_apy: float
+    max_apy: float
+    apy_change_24h: float
+    apy_change_7d: float
+    apy_volatility: float
+    latest_utilization: float
+    utilization_p90: float
+    supply_amount_usd: float
+    supply_change_7d: float
+    daily: list[DailyPoint] = field(default_factory=list)
+
+
+def to_float_array(values: list[str]) -> np.ndarray:
+    """Parse the decimal strings of the hourly series, unparsable values become NaN."""
+    result = np.full(len(values), np.nan)
+    for i, v in enumerate(values):
+        try:
+            result[i] = float(v)
+        except (TypeError, ValueError):
+            pass
+    return result
+
+
+def value_before(timestamps: np.ndarray, values: np.ndarray, at: float) -> float:
+    """The value of the latest point at or before `at`, NaN if the series starts after it."""
+    i = np.searchsorted(timestamps, at, side="right") - 1
+    return float(values[i]) if i >= 0 else np.nan
+
+
+def nan_stat(func, values: np.ndarray) -> float:
+    return float(func(values)) if np.any(~np.isnan(values)) else np.nan
+
+
+def summarize_instrument(instrument: HelperGetInstrument, with_daily: bool = False) -> InstrumentSummary | None:
+    """Summarize the hourly series of an instrument, None if it has no data."""
+    if not instrument.instrument_data:
+        return None
+
+    data = sorted(instrument.instrument_data, key=lambda d: d.hourly_timestamp)
+    timestamps = np.array([d.hourly_timestamp for d in data], dtype=np.int64)
+    apy = to_float_array([d.apy for d in data])
+    utilization = to_float_array([d.utilization for d in data])
+    supply = to_float_array([d.supply_amount_usd for d in data])
+    latest = timestamps[-1]
+
+    supply_7d_ago = value_before(timestamps, supply, latest - 7 * DAY)
+    summary = InstrumentSummary(
+        points=len(data),
+        latest_apy=float(apy[-1]),
+        mean_apy=nan_stat(np.nanmean, apy),
+        min_apy=nan_stat(np.nanmin, apy),
+        max_apy=nan_stat(np.nanmax, apy),
+        apy_change_24h=float(apy[-1] - value_before(timestamps, apy, latest - DAY)),
+        apy_change_7d=float(apy[-1] - value_before(timestamps, apy, latest - 7 * DAY)),
+        apy_volatility=nan_stat(np.nanstd, apy),
+        latest_utilization=float(utilization[-1]),
+        utilization_p90=nan_stat(lambda v: np.nanpercentile(v, 90), utilization),
+        supply_amount_usd=float(supply[-1]),
+        supply_change_7d=float((supply[-1] - supply_7d_ago) / supply_7d_ago) if supply_7d_ago else np.nan,
+    )
+
+    if with_daily:
+        # bucket the points by whole days before the latest point, oldest first
+        days = (latest - timestamps) // DAY
+        for age in np.unique(days)[::-1]:
+            in_day = days == age
+            summary.daily.append(DailyPoint(
+                age_days=int(age),
+                apy=nan_stat(np.nanmean, apy[in_day]),
+                utilization=nan_stat(np.nanmean, utilization[in_day]),
+                supply_amount_usd=nan_stat(np.nanmean, supply[in_day]),
+            ))
+    return summary
+
+
+def summarize_instruments(instruments: list[HelperGetInstrument],
+                          with_daily: bool = False) -> dict[str, InstrumentSummary]:
+    summaries = {}
+    for instrument in instruments:
+        summary = summarize_instrument(instrument, with_daily)
+        if summary:
+            summaries[instrument.instrument_id] = summary
+    return summaries
@@ -0,0 +1,100 @@
+import asyncio
+import uuid
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.mongodb import MongoDBSaver
+from pymongo import ASCENDING, DESCENDING
+
+from autofi_core import logger
+from autofi_core.common.stats import checkpoint_runs_removed_counter
+
+
+RUNS_COLLECTION = "agent_runs"
+# unfinished runs older than this are regarded as abandoned by a replica which stopped
+RUN_STALE_AFTER = timedelta(days=1)
+
+
+class CheckpointHistory:
+    """
+    Gives every graph run its own checkpoint thread, and keeps the threads of the last `keep_runs` runs of each
+    kind.
+
+    Runs are registered in the `agent_runs` collection next to the checkpoints. Every `interval` seconds, the
+    checkpoints and writes of older runs which finished, or started more than RUN_STALE_AFTER ago, are removed.
+    Loading a checkpoint then only reads the thread of its own run, whatever the number of runs before.
+    """
+
+    def __init__(self, saver: MongoDBSaver, thread_id: str, keep_runs: int, interval: int):
+        self.saver = saver
+        self.runs = saver.db[RUNS_COLLECTION]
+        self.thread_id = thread_id
+        self.keep_runs = keep_runs
+        self.interval = interval
+        self.task: asyncio.Task | None = None
+
+    def ensure_indexes(self):
+        self.runs.create_index([("kind", ASCENDING), ("started_at", DESCENDING)])
+
+    @asynccontextmanager
+    async def run(self, kind: str) -> AsyncIterator[tuple[RunnableConfig, str]]:
+        """Register a run of `kind` while it lasts, yielding its config and batch id."""
+        batch_id = str(uuid.uuid4())
+        thread_id = f"{self.thread_id}:{kind}:{batch_id}"
+        await asyncio.to_thread(self.runs.insert_one, {
+            "_id": thread_id,
+            "kind": kind,
+            "started_at": datetime.now(timezone.utc),
+            "finished_at": None,
+        })
+        try:
+            yield RunnableConfig(configurable={"thread_id": thread_id}), batch_id
+        finally:
+            try:
+                await asyncio.to_thread(self.runs.update_one, {"_id": thread_id},
+                                        {"$set": {"finished_at": datetime.now(timezone.utc)}})
+            except Exception as e:
+                # compacted once stale
+                logger.warning(f"[CheckpointHistory - run] Could not mark run {thread_id} finished: {e}")
+
+    def start(self):
+        if self.keep_runs > 0:
+            self.task = asyncio.create_task(self._compact_periodically())
+
+    async def _compact_periodically(self):
+        while True:
+            try:
+                removed = await self.compact()
+                if removed:
+                    logger.info(f"[CheckpointHistory - _compact_periodically] Removed checkpoints of {removed} runs")
+            except Exception as e:
+                logger.error(f"[CheckpointHistory - _compact_periodically] Error compacting checkpoints: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def compact(self) -> int:
+        return await asyncio.to_thread(self._compact)
+
+    def _compact(self) -> int:
+        stale_before = datetime.now(timezone.utc) - RUN_STALE_AFTER
+        removed = 0
+        for kind in self.runs.distinct("kind"):
+            old_runs = list(self.runs.find({"kind": kind}, sort=[("started_at", DESCENDING)], skip=self.keep_runs))
+            for run in old_runs:
+                started_at = run["started_at"].replace(tzinfo=timezone.utc)
+                if run.get("finished_at") is None and started_at > stale_before:
+                    continue
+                self.saver.delete_thread(run["_id"])
+                self.runs.delete_one({"_id": run["_id"]})
+                checkpoint_runs_removed_counter.labels(kind).inc()
+                removed += 1
+        return removed
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
@@ -1,37 +1,146 @@
+import asyncio
+import time
 import uuid
 
+from autofi_core import logger
+from autofi_core.common.stats import lock_acquire_counter, lock_held_time
+
+
+ACQUIRE_SCRIPT = """
+if redis.call("set", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    return redis.call("incr", KEYS[2])
+end
+return 0
+"""
+
+RENEW_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+else
+    return 0
+end
+"""
+
+RELEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("del", KEYS[1])
+    redis.call("publish", KEYS[2], ARGV[1])
+    return 1
+else
+    return 0
+end
+"""
+
+
+class LockNotAcquired(Exception):
+    pass
+
 
 class RedisLock:
-    def __init__(self, redis_conn, key: str, ttl: int = 1800):
+    """
+    Redis lock held while renewed by a watchdog every `ttl / 3` seconds, so it expires `ttl` seconds after its
+    holder stops rather than after a fixed run time.
+
+    Each acquisition gets a fencing token, increasing with every acquisition of the key, which writers can check
+    to reject a holder whose lock expired meanwhile. `lost` is set when the watchdog finds the lock expired.
+
+    Acquiring waits up to `wait_timeout` seconds for the holder to release the lock, woken up by the release
+    message instead of polling. It fails at once with the default of 0.
+    """
+
+    def __init__(self, redis_conn, key: str, ttl: int = 60, wait_timeout: float = 0.0):
         self.redis = redis_conn
         self.key = key
         self.ttl = ttl
+        self.wait_timeout = wait_timeout
+        self.fencing_key = f"{key}:fencing"
+        self.released_channel = f"{key}:released"
         self.lock_value = str(uuid.uuid4())
+        self.token: int | None = None
+        self.lost = asyncio.Event()
+        self.acquired_at: float | None = None
+        self.watchdog: asyncio.Task | None = None
+
+    async def _try_acquire(self) -> bool:
+        lock_value = str(uuid.uuid4())
+        token = await self.redis.eval(ACQUIRE_SCRIPT, 2, self.key, self.fencing_key, lock_value,
+                                      int(self.ttl * 1000))
+        if not token:
+            return False
+        self.lock_value = lock_value
+        self.token = int(token)
+        self.lost.clear()
+        self.acquired_at = time.monotonic()
+        self.watchdog = asyncio.create_task(self._renew())
+        return True
 
-    async def acquire(self) -> bool:
-        return await self.redis.set(
-            self.key, self.lock_value, nx=True, ex=self.ttl
-        )
+    async def acquire(self, wait_timeout: float | None = None) -> bool:
+        wait_timeout = self.wait_timeout if wait_timeout is None else wait_timeout
+        if await self._try_acquire():
+            lock_acquire_counter.labels(self.key, "acquired").inc()
+            return True
+        if wait_timeout <= 0:
+            lock_acquire_counter.labels(self.key, "contended").inc()
+            return False
+
+        deadline = time.monotonic() + wait_timeout
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(self.released_channel)
+        try:
+            while True:
+                # retried once subscribed, a release in between is not missed
+                if await self._try_acquire():
+                    lock_acquire_counter.labels(self.key, "acquired_after_wait").inc()
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    lock_acquire_counter.labels(self.key, "contended").inc()
+                    return False
+                # expiries are not published, retry at least every third of the ttl
+                await pubsub.get_message(ignore_subscribe_messages=True, timeout=min(remaining, self.ttl / 3))
+        finally:
+            await pubsub.unsubscribe(self.released_channel)
+            await pubsub.aclose()
+
+    async def _renew(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            try:
+                renewed = await self.redis.eval(RENEW_SCRIPT, 1, self.key, self.lock_value, int(self.ttl * 1000))
+            except Exception as e:
+                # the lock is still held until its ttl, the next renewal may succeed
+                logger.warning(f"[RedisLock - _renew] Could not renew lock {self.key}: {e}")
+                continue
+            if renewed != 1:
+                logger.error(f"[RedisLock - _renew] Lock {self.key} expired, fencing token {self.token} is stale")
+                lock_acquire_counter.labels(self.key, "lost").inc()
+                self.lost.set()
+                return
 
     async def release(self) -> bool:
-        lua = """
-        if redis.call("get", KEYS[1]) == ARGV[1] then
-            return redis.call("del", KEYS[1])
-        else
-            return 0
-        end
-        """
-        result = await self.redis.eval(lua, 1, self.key, self.lock_value)
+        if self.watchdog:
+            self.watchdog.cancel()
+            self.watchdog = None
+        if self.acquired_at is not None:
+            lock_held_time.labels(self.key).observe(time.monotonic() - self.acquired_at)
+            self.acquired_at = None
+        result = await self.redis.eval(RELEASE_SCRIPT, 2, self.key, self.released_channel, self.lock_value)
         return result == 1
 
     async def locked(self) -> bool:
         value = await self.redis.get(self.key)
         return value is not None
 
+    def fencing(self) -> dict | None:
+        """Fencing token of the current acquisition, as `State.fencing`."""
+        if self.token is None:
+            return None
+        return {"counter_key": self.fencing_key, "token": self.token}
+
     async def __aenter__(self):
         ok = await self.acquire()
         if not ok:
-            raise Exception("Lock already acquired")
+            raise LockNotAcquired(f"Lock {self.key} already acquired")
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
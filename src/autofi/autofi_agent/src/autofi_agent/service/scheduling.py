@@ -0,0 +1,120 @@
+import asyncio
+import json
+import time
+from typing import Awaitable, Callable
+
+from autofi_core import logger
+from autofi_core.common.stats import user_scheduling_counter
+
+
+IMMEDIATE_UIDS_KEY = "aegis_agent:immediate_uids"
+DIRTY_UIDS_KEY = "aegis_agent:dirty_uids"
+LAST_RECOMMENDATIONS_KEY = "aegis_agent:last_recommendations"
+
+
+async def save_last_recommendations(redis_client, recommendations: dict, ttl: int):
+    """Keep the instruments selected by the last run for targeted runs, for `ttl` seconds."""
+    await redis_client.set(LAST_RECOMMENDATIONS_KEY, json.dumps(recommendations), ex=ttl)
+
+
+async def load_last_recommendations(redis_client) -> dict | None:
+    data = await redis_client.get(LAST_RECOMMENDATIONS_KEY)
+    return json.loads(data) if data else None
+
+
+class UserScheduler:
+    """
+    Coalesces triggers for single users, e.g. immediately scheduling requests, into targeted runs.
+
+    The uids of the triggers are remembered in the Redis set `key`, shared by the replicas and kept across
+    restarts. Once no trigger arrived for `debounce` seconds, or `max_delay` seconds after the first one, `run`
+    is called once with every remembered uid. When `run` returns False, e.g. while another run holds the graph
+    lock, the uids are remembered again and retried after `max_delay` seconds.
+
+    With `debounce` equal to `max_delay`, triggered users are run in periodic passes of `max_delay` seconds.
+    """
+
+    def __init__(self, redis_client, run: Callable[[list[str]], Awaitable[bool]], debounce: float,
+                 max_delay: float, key: str = IMMEDIATE_UIDS_KEY, name: str = "immediate"):
+        self.redis = redis_client
+        self.run = run
+        self.key = key
+        self.name = name
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.first_trigger: float | None = None
+        self.last_trigger: float | None = None
+        self.task: asyncio.Task | None = None
+
+    async def trigger(self, uid: str):
+        await self.redis.sadd(self.key, uid)
+        user_scheduling_counter.labels(self.name, "triggered").inc()
+        self.schedule()
+
+    async def recover(self):
+        """Schedule a run for the uids left by a previous process."""
+        if await self.redis.scard(self.key):
+            self.schedule()
+
+    def schedule(self, delay: float | None = None):
+        now = time.monotonic()
+        self.last_trigger = now
+        if self.first_trigger is None:
+            self.first_trigger = now
+        if delay is not None:
+            # a retry, the next trigger may still bring it forward
+            self.first_trigger = now + delay - self.max_delay
+            self.last_trigger = now + delay - self.debounce
+        if self.task is None or self.task.done():
+            self.task = asyncio.create_task(self._flush_later())
+
+    async def pending(self) -> set[str]:
+        return {uid.decode("utf-8") if isinstance(uid, bytes) else uid for uid in await self.redis.smembers(self.key)}
+
+    async def discard(self, uids: set[str]):
+        """Forget users processed meanwhile by a full run."""
+        if uids:
+            await self.redis.srem(self.key, *uids)
+
+    async def _flush_later(self):
+        # triggers and retries arriving while flushing schedule the next flush of this same task
+        while self.first_trigger is not None:
+            deadline = min(self.last_trigger + self.debounce, self.first_trigger + self.max_delay)
+            delay = deadline - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            self.first_trigger = None
+            self.last_trigger = None
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"[UserScheduler - _flush_later] Error running {self.name} scheduled users: {e}")
+
+    async def flush(self):
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.smembers(self.key)
+            pipe.delete(self.key)
+            members, _ = await pipe.execute()
+        uids = sorted(uid.decode("utf-8") if isinstance(uid, bytes) else uid for uid in members)
+        if not uids:
+            return
+        logger.info(f"[UserScheduler - flush] Running {len(uids)} {self.name} scheduled users")
+        done = False
+        try:
+            done = await self.run(uids)
+        finally:
+            if not done:
+                user_scheduling_counter.labels(self.name, "deferred").inc(len(uids))
+                await self.redis.sadd(self.key, *uids)
+                self.schedule(delay=self.max_delay)
+        if done:
+            user_scheduling_counter.labels(self.name, "run").inc(len(uids))
+
+    async def close(self):
+        if self.task:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
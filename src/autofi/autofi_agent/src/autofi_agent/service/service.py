@@ -1,14 +1,28 @@
 from __future__ import annotations
 import asyncio
+import time
+import uuid
 from langchain_core.runnables import RunnableConfig
 from langchain_core.messages import HumanMessage
 from nats.aio.subscription import Subscription
 
-from autofi_core import (get_nats_connection, close_nats_connection, config, logger,
-                         SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING, get_redis_connection)
-from autofi_core.common.messages import HelperEgressImmediatelySchedulingRequest
-from autofi_agent.graph import build_graph
-from .distributed_lock import RedisLock
+from autofi_core import (get_nats_connection, close_nats_connection, config, logger, build_mcp_config,
+                         SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING, SUBJECTS_HELPER_EGRESS_POSITION_CHANGED,
+                         SUBJECTS_HELPER_EGRESS_STRATEGY_CHANGED, get_redis_connection)
+from autofi_core.common.messages import (HelperEgressImmediatelySchedulingRequest, HelperEgressPositionChangedRequest,
+                                         HelperEgressStrategyChangedRequest)
+from autofi_core.common.nats import WorkQueueSubscription
+from autofi_core.common.stats import agent_shard_counter
+from autofi_agent.graph import (build_graph, shard_user_scope, RUN_MODE_FULL, RUN_MODE_RECOMMEND, RUN_MODE_SHARD,
+                                RUN_MODE_TARGETED)
+from autofi_agent.graph.checkpointer import OffloadedMongoDBSaver
+from autofi_agent.mcp.investment_expert_helper import send_querier_immediate_query
+from autofi_agent.mcp.pool import McpSessionPool
+from autofi_agent.mcp.in_process import TOOL_TRANSPORT_STDIO
+from .distributed_lock import RedisLock, LockNotAcquired
+from .sharding import ShardCoordinator, ShardedRun
+from .checkpoints import CheckpointHistory
+from .scheduling import UserScheduler, DIRTY_UIDS_KEY, save_last_recommendations, load_last_recommendations
 
 
 lock_name = "autofi_invoke_graph"
@@ -21,9 +35,16 @@ class AgentService:
         self.graph = None
         self.thread_id = config.llm.thread_id
         self.initialized = False
-        self.sid: Subscription | None = None
+        self.sid: Subscription | WorkQueueSubscription | None = None
+        self.event_sids: list[Subscription] = []
         self._stop_event = asyncio.Event()
         self.lock = None
+        self.coordinator = None
+        self.scheduler = None
+        self.dirty_users = None
+        self.redis = None
+        self.history = None
+        self.mcp_pool = None
         self.cron_task = None
         self.listen_task = None
 
@@ -31,10 +52,45 @@ class AgentService:
     async def construct(cls) -> AgentService:
         agent_service = cls()
         agent_service.nats_conn = await get_nats_connection(config.nats.url, config.nats.timeout)
-        agent_service.graph = await build_graph()
+        if config.mcp.session_pool_enabled and config.mcp.tool_transport == TOOL_TRANSPORT_STDIO:
+            agent_service.mcp_pool = McpSessionPool(
+                build_mcp_config(["investment_expert_helper", "operator_helper"]),
+                health_check_interval=config.mcp.health_check_interval,
+                health_check_timeout=config.mcp.health_check_timeout,
+                start_timeout=config.mcp.start_timeout,
+                restart_backoff=config.mcp.restart_backoff)
+            # the helpers are started now, graph building lists their tools
+            agent_service.mcp_pool.start()
+        agent_service.graph = await build_graph(agent_service.mcp_pool)
+        agent_service.history = CheckpointHistory(agent_service.graph.checkpointer, agent_service.thread_id,
+                                                  keep_runs=config.agent.checkpoint_keep_runs,
+                                                  interval=config.agent.checkpoint_compaction_interval)
+        await asyncio.to_thread(agent_service.history.ensure_indexes)
         agent_service.initialized = True
         redis_conn = await get_redis_connection()
-        agent_service.lock = RedisLock(redis_conn=redis_conn.redis_client, key=lock_name, ttl=1200)
+        agent_service.redis = redis_conn.redis_client
+        agent_service.lock = RedisLock(redis_conn=redis_conn.redis_client, key=lock_name, ttl=config.agent.lock_ttl,
+                                       wait_timeout=config.agent.lock_wait_timeout)
+        agent_service.coordinator = ShardCoordinator(
+            redis_conn.redis_client,
+            owner=str(uuid.uuid4()),
+            lease_ttl=config.agent.shard_lease_ttl,
+            run_ttl=max(2 * config.llm.cron_interval, 86400),
+            max_attempts=config.agent.shard_max_attempts)
+        agent_service.scheduler = UserScheduler(
+            redis_conn.redis_client,
+            run=agent_service.invoke_targeted_run,
+            debounce=config.agent.immediate_debounce,
+            max_delay=config.agent.immediate_max_delay)
+        if config.agent.incremental_enabled:
+            # periodic passes over the users whose positions or strategy changed
+            agent_service.dirty_users = UserScheduler(
+                redis_conn.redis_client,
+                run=agent_service.invoke_targeted_run,
+                debounce=config.agent.incremental_interval,
+                max_delay=config.agent.incremental_interval,
+                key=DIRTY_UIDS_KEY,
+                name="incremental")
 
         return agent_service
 
@@ -44,19 +100,30 @@ class AgentService:
         loop = asyncio.get_running_loop()
         self.listen_task = loop.create_task(self.listen())
         self.cron_task = loop.create_task(self.cron())
+        self.history.start()
+        # users triggered before a restart
+        for scheduler in self.schedulers():
+            await scheduler.recover()
         logger.debug("[AgentService - start] AgentService started")
 
     async def cron(self):
         while not self._stop_event.is_set():
             logger.info("[AgentService - cron] Cron job running, invoking graph...")
+            ran = False
             try:
-                await self.invoke_graph()
+                ran = await self.invoke_graph()
             except Exception as e:
                 logger.error(f"[AgentService - cron] Error invoking graph: {e}")
-            logger.info("[AgentService - cron] Cron job completed, waiting for next interval")
+            if ran:
+                logger.info("[AgentService - cron] Cron job completed, waiting for next interval")
+                interval = config.llm.cron_interval
+            else:
+                # e.g. a targeted run held the lock, the sweep of the interval must not be skipped
+                logger.info(f"[AgentService - cron] Graph did not run, retrying in {config.agent.cron_retry_delay}s")
+                interval = config.agent.cron_retry_delay
 
             try:
-                await asyncio.wait_for(self._stop_event.wait(), timeout=config.llm.cron_interval)
+                await asyncio.wait_for(self._stop_event.wait(), timeout=interval)
                 break
             except asyncio.TimeoutError:
                 continue
@@ -68,33 +135,286 @@ class AgentService:
                 logger.info(f"[AgentService - message_handler] process immediately scheduling request {request.req_id}, "
                             f"from user {request.uid}")
 
-                await self.invoke_graph()
+                await self.scheduler.trigger(request.uid)
             except Exception as e:
                 logger.error(f"[AgentService - message_handler] Error processing message: {e}")
 
         # Start listening for messages
-        self.sid = await self.nats_conn.client.subscribe(SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING, cb=message_handler)
+        self.sid = await self.nats_conn.subscribe_work_queue(SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING,
+                                                             durable="autofi_agent", cb=message_handler,
+                                                             settings=config.nats)
         logger.debug(f"[AgentService - message_handler] subscribed to subject {SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING}")
+        if self.dirty_users:
+            await self.listen_changes()
 
-    async def invoke_graph(self):
+    async def listen_changes(self):
+        async def position_changed_handler(msg):
+            try:
+                request = HelperEgressPositionChangedRequest.model_validate_json(msg.data)
+                logger.debug(f"[AgentService - position_changed_handler] positions of user {request.uid} changed by "
+                             f"{request.transaction_type} {request.transaction_hash}")
+                await self.dirty_users.trigger(request.uid)
+            except Exception as e:
+                logger.error(f"[AgentService - position_changed_handler] Error processing message: {e}")
+
+        async def strategy_changed_handler(msg):
+            try:
+                request = HelperEgressStrategyChangedRequest.model_validate_json(msg.data)
+                logger.debug(f"[AgentService - strategy_changed_handler] strategy of user {request.uid} changed to "
+                             f"{request.strategy}")
+                await self.dirty_users.trigger(request.uid)
+            except Exception as e:
+                logger.error(f"[AgentService - strategy_changed_handler] Error processing message: {e}")
+
+        # plain queue subscriptions, the events are also consumed by other services; the dirty set is shared
+        # through Redis, so one replica receiving each event is enough
+        self.event_sids = [
+            await self.nats_conn.client.subscribe(f"{SUBJECTS_HELPER_EGRESS_POSITION_CHANGED}.*",
+                                                  queue="autofi_agent", cb=position_changed_handler),
+            await self.nats_conn.client.subscribe(SUBJECTS_HELPER_EGRESS_STRATEGY_CHANGED,
+                                                  queue="autofi_agent", cb=strategy_changed_handler),
+        ]
+        logger.debug("[AgentService - listen_changes] subscribed to position and strategy changes")
+
+    def schedulers(self) -> list[UserScheduler]:
+        return [scheduler for scheduler in (self.scheduler, self.dirty_users) if scheduler]
+
+    async def invoke_graph(self) -> bool:
+        """
+        Run the graph for all users. Returns False when it did not run, the graph lock being held, or in sharded
+        mode when no sharded run could be started or joined.
+        """
+        if config.agent.sharding_enabled:
+            return await self.invoke_sharded_run() is not None
         try:
-            async with self.lock:
-                cfg = RunnableConfig(
-                    configurable={
-                        "thread_id": self.thread_id,
-                    }
-                )
+            async with self.lock, self.history.run(RUN_MODE_FULL) as (cfg, batch_id):
                 user_messages = {
-                    "messages": [HumanMessage(content="Continue")]
+                    "messages": [HumanMessage(content="Continue")],
+                    "batch_id": batch_id,
+                    "run_mode": RUN_MODE_FULL,
+                    "user_scope": None,
+                    "fencing": self.lock.fencing(),
                 }
                 try:
-                    await self.graph.ainvoke(config=cfg, input=user_messages)
+                    # users scheduled before the run are processed by it
+                    scheduled = [await scheduler.pending() for scheduler in self.schedulers()]
+                    result = await self.invoke_while_locked(cfg, user_messages)
+                    if result is not None:
+                        await self.save_recommendations(result.get("investment_recommendations"))
+                        for scheduler, uids in zip(self.schedulers(), scheduled):
+                            await scheduler.discard(uids)
                 except Exception as e:
                     logger.error(f"[AgentService - invoke_graph] Error invoking graph: {e}")
-        except Exception as e:
+            return True
+        except LockNotAcquired as e:
             logger.warning(
                 f"[AgentService - invoke_graph] Service is already processing a request. Skipping invocation. {e}")
+            return False
+
+    async def invoke_targeted_run(self, uids: list[str]) -> bool:
+        """
+        Run the operators for the given users only, with the instruments selected by the last run. Returns False
+        when the graph lock is held by another run, or a sharded run is in progress, so the users are retried later.
+        """
+        if config.agent.sharding_enabled:
+            # the shards may be processing the same users, which must not be sent intents twice
+            run = await self.coordinator.current_run()
+            if run is not None and not await self.coordinator.is_done(run):
+                logger.info(f"[AgentService - invoke_targeted_run] Sharded run {run.run_id} in progress, deferring "
+                            f"{len(uids)} users")
+                return False
+        recommendations = await load_last_recommendations(self.redis)
+        if not recommendations:
+            logger.info("[AgentService - invoke_targeted_run] No recent instruments selection, invoking a full run")
+            if config.agent.sharding_enabled:
+                # only a run started after the users were scheduled covers them
+                joined = await self.invoke_sharded_run()
+                return joined is not None and (run is None or joined.run_id != run.run_id)
+            return await self.invoke_graph()
+        try:
+            async with self.lock, self.history.run(RUN_MODE_TARGETED) as (cfg, batch_id):
+                try:
+                    await self.invoke_while_locked(cfg, {
+                        "messages": [HumanMessage(content="Continue")],
+                        "batch_id": batch_id,
+                        "run_mode": RUN_MODE_TARGETED,
+                        "preset_recommendations": recommendations,
+                        "user_scope": {"uids": uids},
+                        "fencing": self.lock.fencing(),
+                    })
+                except Exception as e:
+                    logger.error(f"[AgentService - invoke_targeted_run] Error invoking graph: {e}")
+            return True
+        except LockNotAcquired:
+            logger.info(f"[AgentService - invoke_targeted_run] Graph is locked, deferring {len(uids)} users")
+            return False
+
+    async def save_recommendations(self, recommendations: dict | None):
+        if not recommendations or not any(recommendations.values()):
             return
+        await save_last_recommendations(self.redis, recommendations, ttl=max(2 * config.llm.cron_interval, 3600))
+
+    async def invoke_while_locked(self, cfg: RunnableConfig, graph_input: dict) -> dict | None:
+        """Invoke the graph, cancelling the run if the lock expires under it. Returns None when cancelled."""
+        task = asyncio.create_task(self.graph.ainvoke(config=cfg, input=graph_input))
+        lost = asyncio.create_task(self.lock.lost.wait())
+        try:
+            done, _ = await asyncio.wait({task, lost}, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            task.cancel()
+            lost.cancel()
+            raise
+        lost.cancel()
+        if task not in done:
+            logger.error("[AgentService - invoke_while_locked] Graph lock lost, run cancelled")
+            task.cancel()
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+            return None
+        return task.result()
+
+    async def invoke_sharded_run(self) -> ShardedRun | None:
+        """
+        Process the shards of the current sharded run, starting a new run first when one is due. The replica
+        starting the run selects the instruments while the others wait for the run to be published.
+
+        Returns the run processed, done already when it is not due, or None when none could be started or joined.
+        """
+        run = await self.coordinator.current_run()
+        if await self.coordinator.is_due(run, config.llm.cron_interval):
+            if await self.lock.acquire():
+                try:
+                    # another replica may have started the run while the lock was taken
+                    run = await self.coordinator.current_run()
+                    if await self.coordinator.is_due(run, config.llm.cron_interval):
+                        run = await self.start_sharded_run()
+                finally:
+                    await self.lock.release()
+            else:
+                run = await self.wait_for_sharded_run(run.run_id if run else None)
+        if run is None:
+            return None
+        await self.process_shards(run)
+        return run
+
+    async def start_sharded_run(self) -> ShardedRun | None:
+        scheduled = [await scheduler.pending() for scheduler in self.schedulers()]
+        try:
+            async with self.history.run(RUN_MODE_RECOMMEND) as (cfg, batch_id):
+                result = await self.invoke_while_locked(cfg, {
+                    "messages": [HumanMessage(content="Continue")],
+                    "batch_id": batch_id,
+                    "run_mode": RUN_MODE_RECOMMEND,
+                    "user_scope": None,
+                    "fencing": self.lock.fencing(),
+                })
+        except Exception as e:
+            logger.error(f"[AgentService - start_sharded_run] Error selecting instruments: {e}")
+            return None
+        if result is None:
+            return None
+        recommendations = result.get("investment_recommendations") or {}
+        if not any(recommendations.values()):
+            logger.error("[AgentService - start_sharded_run] No instruments selected, sharded run not started")
+            return None
+        await self.save_recommendations(recommendations)
+        run = ShardedRun(run_id=str(uuid.uuid4()), started_at=time.time(), shards=config.agent.shard_count,
+                         investment_recommendations=recommendations)
+        await self.coordinator.publish_run(run)
+        # the shards process every user, including those scheduled before the run
+        for scheduler, uids in zip(self.schedulers(), scheduled):
+            await scheduler.discard(uids)
+        logger.info(f"[AgentService - start_sharded_run] Sharded run {run.run_id} started with {run.shards} shards")
+        return run
+
+    async def wait_for_sharded_run(self, previous_run_id: str | None) -> ShardedRun | None:
+        """
+        Wait for the replica holding the lock to publish the next run, for as long as the lock is held, which
+        selecting the instruments may take, and at least a shard lease. None when the lock was released without
+        a new run, e.g. it was held by a targeted run, cron then retries soon.
+        """
+        deadline = time.time() + config.agent.shard_lease_ttl
+        while not self._stop_event.is_set():
+            # the run is published before the lock is released, so it is read after the lock
+            locked = await self.lock.locked()
+            run = await self.coordinator.current_run()
+            if run is not None and run.run_id != previous_run_id:
+                return run
+            if time.time() >= deadline and not locked:
+                break
+            try:
+                await asyncio.wait_for(self._stop_event.wait(), timeout=min(5.0, config.agent.shard_lease_ttl / 3))
+            except asyncio.TimeoutError:
+                pass
+        return None
+
+    async def process_shards(self, run: ShardedRun):
+        """Lease and process shards until the run is done, taking over the shards of replicas which died."""
+        while not self._stop_event.is_set():
+            lease = await self.coordinator.lease(run)
+            if lease is None:
+                if await self.coordinator.is_done(run):
+                    return
+                # the other shards are leased, wait for them to be done or for their leases to expire
+                try:
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=config.agent.shard_lease_ttl / 3)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            shard, fencing = lease
+            await self.process_shard(run, shard, fencing)
+
+    async def process_shard(self, run: ShardedRun, shard: int, fencing: dict):
+        logger.info(f"[AgentService - process_shard] Processing shard {shard} of run {run.run_id}")
+        async with self.history.run(RUN_MODE_SHARD) as (cfg, batch_id):
+            task = asyncio.create_task(self.graph.ainvoke(config=cfg, input={
+                "messages": [HumanMessage(content="Continue")],
+                "batch_id": batch_id,
+                "run_mode": RUN_MODE_SHARD,
+                "preset_recommendations": run.investment_recommendations,
+                "user_scope": shard_user_scope(shard, run.shards),
+                # stale once another replica leased the shard
+                "fencing": fencing,
+            }))
+            renewed_at = time.monotonic()
+            while True:
+                done, _ = await asyncio.wait({task}, timeout=config.agent.shard_lease_ttl / 3)
+                if done:
+                    break
+                attempted_at = time.monotonic()
+                try:
+                    renewed = await self.coordinator.renew(run, shard)
+                except Exception as e:
+                    # the lease holds until its ttl, give up before the next renewal could come too late
+                    logger.warning(f"[AgentService - process_shard] Could not renew lease of shard {shard}: {e}")
+                    renewed = attempted_at - renewed_at < config.agent.shard_lease_ttl * 2 / 3
+                else:
+                    if renewed:
+                        renewed_at = attempted_at
+                if not renewed:
+                    # another replica took the shard over, stop sending intents for its users
+                    logger.warning(f"[AgentService - process_shard] Lease of shard {shard} of run {run.run_id} lost")
+                    agent_shard_counter.labels("lost").inc()
+                    task.cancel()
+                    try:
+                        await task
+                    except (asyncio.CancelledError, Exception):
+                        pass
+                    return
+
+            try:
+                task.result()
+                agent_shard_counter.labels("completed").inc()
+                last = await self.coordinator.complete(run, shard)
+            except Exception as e:
+                logger.error(f"[AgentService - process_shard] Shard {shard} of run {run.run_id} failed: {e}")
+                agent_shard_counter.labels("failed").inc()
+                last = await self.coordinator.fail(run, shard)
+            if last:
+                logger.info(f"[AgentService - process_shard] Sharded run {run.run_id} done")
+                await send_querier_immediate_query()
 
     async def close(self):
         if not self.initialized:
@@ -112,7 +432,18 @@ class AgentService:
                     pass
             if self.sid:
                 await self.sid.unsubscribe()
+            for sid in self.event_sids:
+                await sid.unsubscribe()
+            for scheduler in self.schedulers():
+                await scheduler.close()
+            await self.history.close()
+            if self.mcp_pool:
+                await self.mcp_pool.close()
             await close_nats_connection()
-            self.lock.release()
+            # only deletes the lock if this replica still holds it
+            await self.lock.release()
+            if isinstance(self.graph.checkpointer, OffloadedMongoDBSaver):
+                # waits for the checkpoints in flight, off the event loop
+                await asyncio.to_thread(self.graph.checkpointer.close)
         except Exception as e:
             logger.error(f"[AgentService - close] Error closing NATS connection: {e}")
@@ -0,0 +1,138 @@
+import random
+import time
+from typing import Any
+
+from pydantic import BaseModel
+
+
+SHARDED_RUN_KEY = "aegis_agent:sharded_run"
+SHARD_LEASE_KEY = "aegis_agent:sharded_run:{run_id}:lease:{shard}"
+SHARDS_DONE_KEY = "aegis_agent:sharded_run:{run_id}:done"
+SHARD_ATTEMPTS_KEY = "aegis_agent:sharded_run:{run_id}:attempts"
+SHARD_FENCING_KEY = "aegis_agent:sharded_run:{run_id}:fencing:{shard}"
+
+LEASE_SCRIPT = """
+if redis.call("set", KEYS[1], ARGV[1], "NX", "PX", ARGV[2]) then
+    local token = redis.call("incr", KEYS[2])
+    redis.call("expire", KEYS[2], ARGV[3])
+    return token
+end
+return 0
+"""
+
+RENEW_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("pexpire", KEYS[1], ARGV[2])
+else
+    return 0
+end
+"""
+
+RELEASE_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+else
+    return 0
+end
+"""
+
+
+class ShardedRun(BaseModel):
+    run_id: str
+    started_at: float
+    shards: int
+    investment_recommendations: dict[str, list[dict[str, Any]]]  # selected instruments by inclination
+
+
+class ShardCoordinator:
+    """
+    Shares the users of a run between replicas through Redis.
+
+    The replica starting a run selects the instruments once and publishes them with the run. The users are split
+    into `shards` uid hash ranges, which any replica leases, processes with its own operators and marks done.
+    Leases expire after `lease_ttl` seconds unless renewed, so the shard of a dead replica is taken over by
+    another one. A shard failing `max_attempts` times is given up on.
+
+    Each lease of a shard gets a fencing token, increasing with every lease of the shard, so a replica whose
+    lease lapsed stops writing once the shard was leased again.
+    """
+
+    def __init__(self, redis_client, owner: str, lease_ttl: int, run_ttl: int, max_attempts: int):
+        self.redis = redis_client
+        self.owner = owner
+        self.lease_ttl = lease_ttl
+        self.run_ttl = run_ttl
+        self.max_attempts = max_attempts
+
+    async def current_run(self) -> ShardedRun | None:
+        data = await self.redis.get(SHARDED_RUN_KEY)
+        return ShardedRun.model_validate_json(data) if data else None
+
+    async def publish_run(self, run: ShardedRun):
+        await self.redis.set(SHARDED_RUN_KEY, run.model_dump_json(), ex=self.run_ttl)
+
+    async def is_done(self, run: ShardedRun) -> bool:
+        return await self.redis.scard(SHARDS_DONE_KEY.format(run_id=run.run_id)) >= run.shards
+
+    async def is_due(self, run: ShardedRun | None, interval: int) -> bool:
+        """Whether a new run should start: the last one is done and started at least `interval` seconds ago."""
+        return run is None or (time.time() - run.started_at >= interval and await self.is_done(run))
+
+    async def lease(self, run: ShardedRun) -> tuple[int, dict] | None:
+        """
+        Lease a shard which is neither done nor leased, with the fencing token of the lease as `State.fencing`.
+        None when there is none at the moment.
+        """
+        done_key = SHARDS_DONE_KEY.format(run_id=run.run_id)
+        done = {int(shard) for shard in await self.redis.smembers(done_key)}
+        # start at a random shard, so replicas do not all race for the same leases
+        offset = random.randrange(run.shards)
+        for i in range(run.shards):
+            shard = (offset + i) % run.shards
+            if shard in done:
+                continue
+            lease_key = SHARD_LEASE_KEY.format(run_id=run.run_id, shard=shard)
+            fencing_key = SHARD_FENCING_KEY.format(run_id=run.run_id, shard=shard)
+            token = await self.redis.eval(LEASE_SCRIPT, 2, lease_key, fencing_key, self.owner,
+                                          int(self.lease_ttl * 1000), self.run_ttl)
+            if not token:
+                continue
+            # the shard may have been done and released since the done set was read
+            if await self.redis.sismember(done_key, shard):
+                await self.redis.eval(RELEASE_LEASE_SCRIPT, 1, lease_key, self.owner)
+                continue
+            return shard, {"counter_key": fencing_key, "token": int(token)}
+        return None
+
+    async def renew(self, run: ShardedRun, shard: int) -> bool:
+        """Extend the lease of a shard, False when it expired and may have been taken over."""
+        lease_key = SHARD_LEASE_KEY.format(run_id=run.run_id, shard=shard)
+        return await self.redis.eval(RENEW_LEASE_SCRIPT, 1, lease_key, self.owner, int(self.lease_ttl * 1000)) == 1
+
+    async def complete(self, run: ShardedRun, shard: int) -> bool:
+        """Mark a shard done, True when it was the last shard of the run."""
+        done_key = SHARDS_DONE_KEY.format(run_id=run.run_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(done_key, shard)
+            pipe.scard(done_key)
+            pipe.expire(done_key, self.run_ttl)
+            added, done, _ = await pipe.execute()
+        await self.redis.eval(RELEASE_LEASE_SCRIPT, 1, SHARD_LEASE_KEY.format(run_id=run.run_id, shard=shard),
+                              self.owner)
+        return added == 1 and done >= run.shards
+
+    async def fail(self, run: ShardedRun, shard: int) -> bool:
+        """
+        Release a shard which failed so it is leased again, or mark it done once it failed `max_attempts`
+        times. Returns whether that was the last shard of the run.
+        """
+        attempts_key = SHARD_ATTEMPTS_KEY.format(run_id=run.run_id)
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hincrby(attempts_key, shard, 1)
+            pipe.expire(attempts_key, self.run_ttl)
+            attempts, _ = await pipe.execute()
+        if attempts >= self.max_attempts:
+            return await self.complete(run, shard)
+        await self.redis.eval(RELEASE_LEASE_SCRIPT, 1, SHARD_LEASE_KEY.format(run_id=run.run_id, shard=shard),
+                              self.owner)
+        return False
@@ -18,10 +18,13 @@ from autofi_core.common import (
     SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION,
     SUBJECTS_HELPER_INGRESS_INVESTMENT_RECOMMENDATION,
     SUBJECTS_HELPER_EGRESS_POSITION_CHANGED,
+    SUBJECTS_HELPER_EGRESS_STRATEGY_CHANGED,
     SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING,
     SUBJECTS_QUERIER_INGRESS_IMMEDIATELY_QUERY,
     VaultGrpcClient,
+    AsyncVaultGrpcClient,
     VaultAccount,
+    AsyncVaultAccount,
     CdpSendUserOperationRequest,
     CdpSendUserOperationResponse,
     CdpSendGetSmartAddressRequest,
@@ -58,10 +61,13 @@ __all__ = [
     "SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION",
     "SUBJECTS_HELPER_INGRESS_INVESTMENT_RECOMMENDATION",
     "SUBJECTS_HELPER_EGRESS_POSITION_CHANGED",
+    "SUBJECTS_HELPER_EGRESS_STRATEGY_CHANGED",
     "SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING",
     "SUBJECTS_QUERIER_INGRESS_IMMEDIATELY_QUERY",
     "VaultGrpcClient",
+    "AsyncVaultGrpcClient",
     "VaultAccount",
+    "AsyncVaultAccount",
     "CdpSendUserOperationRequest",
     "CdpSendUserOperationResponse",
     "CdpSendGetSmartAddressRequest",
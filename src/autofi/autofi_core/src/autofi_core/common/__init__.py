@@ -1,7 +1,7 @@
 from .nats import NatsConnection, get_nats_connection, close_nats_connection
 from .const import *
-from .vault_client import VaultGrpcClient
-from .vault_account import VaultAccount
+from .vault_client import VaultGrpcClient, AsyncVaultGrpcClient
+from .vault_account import VaultAccount, AsyncVaultAccount
 from .messages import (CdpSendUserOperationRequest, CdpSendUserOperationResponse,
                        CdpSendGetSmartAddressRequest, CdpSendGetSmartAddressResponse)
 from .logger import logger
@@ -32,10 +32,13 @@ __all__ = [
     "SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION",
     "SUBJECTS_HELPER_INGRESS_INVESTMENT_RECOMMENDATION",
     "SUBJECTS_HELPER_EGRESS_POSITION_CHANGED",
+    "SUBJECTS_HELPER_EGRESS_STRATEGY_CHANGED",
     "SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING",
     "SUBJECTS_QUERIER_INGRESS_IMMEDIATELY_QUERY",
     "VaultGrpcClient",
+    "AsyncVaultGrpcClient",
     "VaultAccount",
+    "AsyncVaultAccount",
     "CdpSendUserOperationRequest",
     "CdpSendUserOperationResponse",
     "CdpSendGetSmartAddressRequest",
@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from .logger import logger
+from .redis import get_redis_connection
+from .stats import cache_request_counter, cache_get_time, third_party_error_counter
+
+
+T = TypeVar("T")
+
+CACHE_MEMORY_HIT = "memory_hit"
+CACHE_REDIS_HIT = "redis_hit"
+CACHE_SHARED_LOAD = "shared_load"
+CACHE_MISS = "miss"
+
+
+def get_cache_key(**filters) -> str:
+    """Stable key of request filters, list filters are order insensitive."""
+    normalized = {k: sorted(v) if isinstance(v, list) else v for k, v in filters.items()}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def next_hour_boundary(delay: int = 0) -> float:
+    """Timestamp of the next hourly boundary plus `delay` seconds."""
+    now = time.time()
+    boundary = now - now % 3600 + 3600 + delay
+    # still inside the delay after the previous boundary
+    if boundary - 3600 > now:
+        boundary -= 3600
+    return boundary
+
+
+class TieredCache(Generic[T]):
+    """
+    Two-tier cache: an in-process LRU in front of Redis, shared by every process using the same name.
+
+    Concurrent misses of a key in one process share a single load. Loaded values rejected by `should_cache`,
+    e.g. error responses, are returned without being cached.
+    Redis errors are logged and the cache degrades to the in-process tier.
+    """
+
+    def __init__(self, name: str, encode: Callable[[T], str], decode: Callable[[str], T], max_entries: int = 128):
+        self.name = name
+        self.encode = encode
+        self.decode = decode
+        self.max_entries = max_entries
+        self.entries: OrderedDict[str, tuple[float, T]] = OrderedDict()
+        self.loading: dict[str, asyncio.Future] = {}
+
+    def redis_key(self, key: str) -> str:
+        return f"aegis_cache:{self.name}:{key}"
+
+    def get_local(self, key: str) -> T | None:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at <= time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return value
+
+    def put_local(self, key: str, value: T, expires_at: float):
+        self.entries[key] = (expires_at, value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def get_or_load(self, key: str, load: Callable[[], Awaitable[T]], expires_at: float,
+                          should_cache: Callable[[T], bool] = lambda _: True) -> T:
+        start = time.perf_counter()
+        result = CACHE_MEMORY_HIT
+        try:
+            value = self.get_local(key)
+            if value is not None:
+                return value
+
+            # single flight, wait for the load already in progress
+            future = self.loading.get(key)
+            if future is not None:
+                result = CACHE_SHARED_LOAD
+                return await asyncio.shield(future)
+
+            future = asyncio.get_running_loop().create_future()
+            self.loading[key] = future
+            try:
+                value, result = await self._load(key, load, expires_at, should_cache)
+                future.set_result(value)
+                return value
+            except Exception as e:
+                future.set_exception(e)
+                # mark retrieved, the waiters got the exception already
+                future.exception()
+                raise
+            finally:
+                del self.loading[key]
+        finally:
+            cache_request_counter.labels(self.name, result).inc()
+            cache_get_time.labels(self.name, result).observe(time.perf_counter() - start)
+
+    async def _load(self, key: str, load: Callable[[], Awaitable[T]], expires_at: float,
+                    should_cache: Callable[[T], bool]) -> tuple[T, str]:
+        redis_key = self.redis_key(key)
+        try:
+            redis = await get_redis_connection()
+            async with redis.redis_client.pipeline(transaction=False) as pipe:
+                pipe.get(redis_key)
+                pipe.pttl(redis_key)
+                cached, ttl = await pipe.execute()
+            if cached is not None:
+                value = self.decode(cached.decode("utf-8"))
+                self.put_local(key, value, time.time() + ttl / 1000 if ttl > 0 else expires_at)
+                return value, CACHE_REDIS_HIT
+        except Exception as e:
+            third_party_error_counter.labels(service_name='redis').inc()
+            logger.warning(f"[TieredCache - _load] {self.name} redis get failed: {e}")
+
+        value = await load()
+        if should_cache(value):
+            await self.put(key, value, expires_at)
+        return value, CACHE_MISS
+
+    async def put(self, key: str, value: T, expires_at: float):
+        ttl = expires_at - time.time()
+        if ttl <= 0:
+            return
+        self.put_local(key, value, expires_at)
+        try:
+            redis = await get_redis_connection()
+            await redis.redis_client.set(self.redis_key(key), self.encode(value), px=int(ttl * 1000))
+        except Exception as e:
+            third_party_error_counter.labels(service_name='redis').inc()
+            logger.warning(f"[TieredCache - put] {self.name} redis set failed: {e}")
+
+    async def invalidate(self, key: str):
+        self.entries.pop(key, None)
+        try:
+            redis = await get_redis_connection()
+            await redis.redis_client.delete(self.redis_key(key))
+        except Exception as e:
+            third_party_error_counter.labels(service_name='redis').inc()
+            logger.warning(f"[TieredCache - invalidate] {self.name} redis delete failed: {e}")
+
+    def clear(self):
+        self.entries.clear()
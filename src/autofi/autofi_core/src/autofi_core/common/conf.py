@@ -1,3 +1,4 @@
+from pydantic import Field
 from pydantic_settings import BaseSettings
 import tomli
 from langchain_mcp_adapters.sessions import StdioConnection
@@ -13,6 +14,13 @@ class NatsConfig(BaseSettings):
     url: str
     timeout: int
     async_response_timeout: int
+    jetstream_enabled: bool = False  # consume work subjects from durable JetStream pull consumers
+    jetstream_stream: str = "AEGIS_WORK"  # work queue stream capturing the consumed subjects
+    jetstream_max_in_flight: int = 64  # messages of a consumer handled at the same time by a process
+    jetstream_max_ack_pending: int = 1000  # messages of a consumer delivered and not acknowledged, all replicas
+    jetstream_ack_wait: float = 30.0  # seconds before a message not kept in progress is redelivered
+    jetstream_max_deliver: int = 5  # deliveries of a message before it is given up on
+    jetstream_backoff: list[float] = [1.0, 5.0, 30.0]  # seconds before redelivering a failed message, by attempt
 
 
 class RedisConfig(BaseSettings):
@@ -22,17 +30,61 @@ class RedisConfig(BaseSettings):
 
 class VaultConfig(BaseSettings):
     url: str
+    pool_size: int = 4  # grpc channels used by the async vault client
+    timeout: float = 5.0  # deadline of each vault call in seconds
+    retries: int = 3  # retries of vault calls failing with UNAVAILABLE
 
 
 class LLMConfig(BaseSettings):
     investment_expert_model: str
     operator_model: str
-    thread_id: str
+    thread_id: str  # prefix of the checkpoint threads, each run gets its own
     cron_interval: int
 
 
+class AgentConfig(BaseSettings):
+    investment_page_size: int = 100  # users requested per get_all_investments page
+    investment_prefetch_pages: int = 4  # pages requested ahead of the operators
+    parallel_operators: bool = False  # run operator batches as concurrent graph branches
+    operator_max_concurrency: int = 3  # operator branches running at the same time
+    fast_path_enabled: bool = False  # decide trivial users by rules instead of the operator LLM
+    fast_path_min_score: int = 90  # recommendation score regarded as a strong recommendation
+    fast_path_min_uninvested_usd: float = 10.0  # uninvested value below this is ignored by the fast path
+    operator_token_budget: int = 8000  # estimated tokens of user investments per operator call
+    operator_max_users_per_batch: int = 50  # users per operator call, whatever the token budget
+    prompt_format: str = "json"  # records rendered into prompts as "json" or "compact" tables
+    instrument_history_mode: str = "raw"  # instrument hourly data in prompts: "raw" points or a "summary"
+    instrument_daily_series: bool = False  # add daily averages to the instrument summaries
+    # cache get_instruments results in redis and in process, the in-process tier only outlives a tool call with
+    # mcp.session_pool_enabled or mcp.tool_transport = "in_process", each stdio helper otherwise starts empty
+    instruments_cache_enabled: bool = False
+    instruments_cache_delay: int = 120  # seconds after the hourly boundary the cached instruments expire
+    lock_ttl: int = 60  # seconds the graph lock outlives a replica which stopped renewing it
+    lock_wait_timeout: float = 0.0  # seconds to wait for the graph lock held by another replica, 0 fails fast
+    cron_retry_delay: float = 30.0  # seconds before retrying a full run which did not run, e.g. the lock was held
+    sharding_enabled: bool = False  # split each run's users into shards processed by every replica
+    shard_count: int = 8  # uid hash ranges the users of a sharded run are split into
+    shard_lease_ttl: int = 300  # seconds a shard lease lasts unless renewed by the replica processing it
+    shard_max_attempts: int = 3  # failed attempts of a shard before it is given up on
+    immediate_debounce: float = 10.0  # seconds without immediately scheduling triggers before running their users
+    immediate_max_delay: float = 60.0  # seconds after the first trigger its users run at the latest
+    incremental_enabled: bool = False  # rerun users whose positions or strategy changed between full runs
+    incremental_interval: float = 900.0  # seconds between passes over the users whose positions or strategy changed
+    recommendation_reuse_enabled: bool = False  # reuse the selection made from unchanged instruments and risk reports
+    recommendation_max_age: int = 21600  # seconds a selection is reused at most, market data is not fingerprinted
+    checkpoint_keep_runs: int = 20  # runs of each kind whose checkpoints are kept, 0 keeps all of them
+    checkpoint_compaction_interval: int = 3600  # seconds between removals of the checkpoints of older runs
+    artifact_offload_enabled: bool = False  # keep large texts out of the state, referenced from the artifact store
+    artifact_min_size: int = 4096  # characters from which texts are moved to the artifact store
+    artifact_ttl: int = 86400  # seconds artifacts are kept, checkpoints older than this can no longer be resumed
+
+
 class MongoConfig(BaseSettings):
     url: str
+    max_pool_size: int = 100  # connections per client
+    min_pool_size: int = 0  # connections kept open while idle
+    checkpointer: str = "default"  # "default" saver, or "offloaded" to its own threads with grouped writes
+    checkpointer_workers: int = 8  # threads of the "offloaded" checkpointer
 
 
 class HelperConfig(BaseSettings):
@@ -45,10 +97,30 @@ class HelperConfig(BaseSettings):
 class MCPConfig(BaseSettings):
     investment_expert_helper: HelperConfig
     operator_helper: HelperConfig
+    tool_transport: str = "stdio"  # "in_process" runs the helper tools in the agent process, without MCP
+    session_pool_enabled: bool = False  # keep one session per helper open instead of spawning it for each tool call
+    health_check_interval: float = 30.0  # seconds between pings of the pooled helpers
+    health_check_timeout: float = 5.0  # seconds a pooled helper has to answer a ping before it is restarted
+    start_timeout: float = 60.0  # seconds to wait for a pooled helper to start
+    restart_backoff: float = 1.0  # seconds before restarting a pooled helper, doubled on each failure in a row
 
 
 class CDPConfig(BaseSettings):
     paymaster_url: str
+    dispatch_workers: int = 8  # user operations processed at the same time, one per smart account at most
+    dispatch_max_pending: int = 1000  # user operations queued or running before the subscription is paused
+    coalesce_window: float = 0.0  # seconds to wait for more requests of a smart account to merge, 0 disables
+    coalesce_max_requests: int = 1  # requests merged into one user operation, 1 disables coalescing
+    resolution_cache_ttl: int = 2592000  # seconds smart account resolutions are cached
+    resolution_cache_size: int = 10000  # smart account resolutions kept in process
+    resolution_snapshot_path: str | None = None  # file loading resolutions at startup and saving them on close
+    receipt_poll_interval: float = 2.0  # seconds between status checks of the submitted user operations
+    receipt_poll_concurrency: int = 16  # user operation status checks running at the same time
+    receipt_timeout: int = 600  # seconds a submitted user operation is tracked before it is reported failed
+    receipt_owner_ttl: int = 30  # seconds without heartbeat before the operations of a replica are taken over
+    receipt_req_id_ttl: int = 86400  # seconds the user operation hash of a request is kept in redis
+    idempotency_ttl: int = 86400  # seconds the response of a request is kept to answer duplicates
+    idempotency_in_progress_ttl: int = 900  # seconds a request blocks its duplicates, above receipt_timeout
 
 
 class AppConfig(BaseSettings):
@@ -57,6 +129,7 @@ class AppConfig(BaseSettings):
     redis: RedisConfig
     vault: VaultConfig
     llm: LLMConfig
+    agent: AgentConfig = Field(default_factory=AgentConfig)
     mongo: MongoConfig
     mcp: MCPConfig
     cdp: CDPConfig
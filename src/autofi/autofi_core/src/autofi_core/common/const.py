@@ -22,6 +22,7 @@ SUBJECTS_HELPER_INGRESS_INTENT_TRANSACTION = "helper_ingress.transaction.intent_
 SUBJECTS_HELPER_EGRESS = "helper_egress"
 SUBJECTS_HELPER_EGRESS_IMMEDIATELY_SCHEDULING = "helper_egress.immediately_scheduling"
 SUBJECTS_HELPER_EGRESS_POSITION_CHANGED = "helper_egress.position_changed"
+SUBJECTS_HELPER_EGRESS_STRATEGY_CHANGED = "helper_egress.strategy_changed"
 SUBJECTS_AUTOFI_AGENT_INGRESS = "autofi_agent_ingress"
 SUBJECTS_AUTOFI_AGENT_INGRESS_SCHEDULE_STRATEGY = "autofi_agent_ingress.schedule_strategy"
 SUBJECTS_TRANSACTOR_INGRESS = "transactor_ingress"
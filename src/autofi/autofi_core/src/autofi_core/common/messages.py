@@ -285,6 +285,20 @@ class HelperEgressImmediatelySchedulingRequest(BaseModel):
     uid: str
 
 
+class HelperEgressPositionChangedRequest(BaseModel):
+    req_id: str
+    uid: str
+    transaction_type: str
+    transaction_hash: str
+    timestamp: int
+
+
+class HelperEgressStrategyChangedRequest(BaseModel):
+    req_id: str
+    uid: str
+    strategy: str  # as in HelperUpdateUserStrategyRequest
+
+
 class CdpSendGetSmartAddressRequest(BaseModel):
     req_id: str
     owner_address: str
@@ -1,6 +1,151 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 import asyncio
+from typing import Awaitable, Callable, TypeVar
 from nats.aio.client import Client
+from nats.aio.msg import Msg
+from nats.aio.subscription import Subscription
+from nats.errors import TimeoutError as NatsTimeoutError
+from nats.js.api import ConsumerConfig, RetentionPolicy
+from nats.js.client import JetStreamContext
+from nats.js.errors import BadRequestError, NotFoundError
+from pydantic import BaseModel
+
+from .conf import NatsConfig
+from .const import SUBJECTS_PROCESSED_HELPER
+from .error import NATSError
+from .logger import logger
+from .stats import work_queue_message_counter
+
+
+AckT = TypeVar("AckT", bound=BaseModel)
+ResultT = TypeVar("ResultT", bound=BaseModel)
+
+
+class WorkQueueSubscription:
+    """
+    Pull consumer of a JetStream work queue, handing up to `max_in_flight` messages at a time to a callback.
+
+    A message is acknowledged when the callback returns and negatively acknowledged with the `backoff` delay
+    of its delivery attempt when the callback raises, or terminated once it was delivered `max_deliver` times.
+    While the callback runs, the message is kept in progress so slow handlers are not redelivered after
+    `ack_wait`.
+
+    A callback which hands the message over to later work returns an awaitable instead: the message stops
+    counting against `max_in_flight` and is kept in progress until the awaitable is done, then acknowledged, or
+    negatively acknowledged when it raises. Messages whose work is lost with the process are redelivered.
+    """
+
+    def __init__(self, subject: str, psub: JetStreamContext.PullSubscription,
+                 cb: Callable[[Msg], Awaitable[Awaitable[None] | None]],
+                 max_in_flight: int, ack_wait: float, max_deliver: int, backoff: list[float]):
+        self.subject = subject
+        self.psub = psub
+        self.cb = cb
+        self.max_in_flight = max_in_flight
+        self.ack_wait = ack_wait
+        self.max_deliver = max_deliver
+        self.backoff = backoff or [0.0]
+        self.handling: set[asyncio.Task] = set()
+        self.handed_off: set[asyncio.Task] = set()
+        self.changed = asyncio.Condition()
+        self.task: asyncio.Task | None = None
+
+    def start(self):
+        self.task = asyncio.create_task(self._fetch())
+
+    async def _fetch(self):
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.handling) < self.max_in_flight)
+            try:
+                msgs = await self.psub.fetch(self.max_in_flight - len(self.handling), timeout=self.ack_wait)
+            except NatsTimeoutError:
+                continue
+            except Exception as e:
+                logger.error(f"[WorkQueueSubscription - _fetch] Fetching {self.subject} failed: {e}")
+                await asyncio.sleep(self.backoff[0] or 1.0)
+                continue
+            for msg in msgs:
+                task = asyncio.create_task(self._handle(msg))
+                self.handling.add(task)
+
+    async def _handle(self, msg: Msg):
+        keep_alive = asyncio.create_task(self._keep_alive(msg))
+        try:
+            work = await self.cb(msg)
+            if work is not None:
+                task = asyncio.create_task(self._ack_when_done(msg, work, keep_alive))
+                self.handed_off.add(task)
+                task.add_done_callback(self.handed_off.discard)
+                keep_alive = None
+                return
+            await self._ack(msg)
+        except Exception as e:
+            await self._nak(msg, e)
+        finally:
+            if keep_alive is not None:
+                keep_alive.cancel()
+            async with self.changed:
+                self.handling.discard(asyncio.current_task())
+                self.changed.notify_all()
+
+    async def _ack_when_done(self, msg: Msg, work: Awaitable[None], keep_alive: asyncio.Task):
+        try:
+            await work
+            await self._ack(msg)
+        except Exception as e:
+            await self._nak(msg, e)
+        finally:
+            keep_alive.cancel()
+
+    async def _ack(self, msg: Msg):
+        await msg.ack()
+        work_queue_message_counter.labels(self.subject, "ack").inc()
+
+    async def _nak(self, msg: Msg, e: Exception):
+        attempt = msg.metadata.num_delivered or 1
+        delay = self.backoff[min(attempt, len(self.backoff)) - 1]
+        try:
+            if attempt >= self.max_deliver:
+                logger.error(f"[WorkQueueSubscription - _nak] {self.subject} message failed {attempt} times, "
+                             f"giving up: {e}")
+                work_queue_message_counter.labels(self.subject, "term").inc()
+                await msg.term()
+            else:
+                logger.warning(f"[WorkQueueSubscription - _nak] {self.subject} message failed, redelivering "
+                               f"in {delay}s: {e}")
+                work_queue_message_counter.labels(self.subject, "nak").inc()
+                await msg.nak(delay=delay)
+        except Exception as nak_error:
+            logger.error(f"[WorkQueueSubscription - _nak] Could not nak {self.subject} message: {nak_error}")
+
+    async def _keep_alive(self, msg: Msg):
+        while True:
+            await asyncio.sleep(self.ack_wait / 2)
+            try:
+                await msg.in_progress()
+            except Exception as e:
+                logger.warning(f"[WorkQueueSubscription - _keep_alive] {self.subject} in progress failed: {e}")
+
+    async def unsubscribe(self, timeout: float | None = None):
+        """
+        Stop fetching and wait up to `timeout` seconds for the messages in flight, handed over ones included.
+        Messages still in flight afterwards are redelivered by the server, the durable consumer is kept.
+        """
+        if self.task:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+        if self.handling:
+            _, running = await asyncio.wait(set(self.handling), timeout=timeout)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        if self.handed_off:
+            _, running = await asyncio.wait(set(self.handed_off), timeout=timeout)
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+        await self.psub.unsubscribe()
 
 
 @dataclass
@@ -8,6 +153,11 @@ class NatsConnection:
     uri: str
     timeout: int
     client: Client | None = None
+    # reply subject -> future waiting for the asynchronous result of `call`
+    _pending: dict[str, asyncio.Future] = field(default_factory=dict, repr=False)
+    # reply prefix -> wildcard subscription shared by every in-flight `call`
+    _reply_subs: dict[str, Subscription] = field(default_factory=dict, repr=False)
+    _reply_lock: asyncio.Lock = field(default_factory=asyncio.Lock, repr=False)
 
     async def connect(self):
         self.client = Client()
@@ -15,10 +165,137 @@ class NatsConnection:
 
     async def disconnect(self):
         if self.client:
+            for sub in self._reply_subs.values():
+                try:
+                    await sub.unsubscribe()
+                except Exception:
+                    pass
+            self._reply_subs.clear()
+            for future in self._pending.values():
+                if not future.done():
+                    future.set_exception(NATSError("nats connection closed"))
+            self._pending.clear()
             await self.client.drain()
             await self.client.close()
             self.client = None
 
+    async def subscribe_work_queue(self, subject: str, durable: str,
+                                   cb: Callable[[Msg], Awaitable[Awaitable[None] | None]],
+                                   settings: NatsConfig) -> Subscription | WorkQueueSubscription:
+        """
+        Subscribe to a subject whose messages must each be handled by one process of a service.
+
+        With JetStream enabled, the subject is captured by the work queue stream `settings.jetstream_stream` and
+        consumed by the durable pull consumer `durable`, shared by every replica. Messages published while no
+        replica runs are kept. Otherwise it is a core NATS subscription in the queue group `durable`.
+
+        Both subscriptions are stopped with `unsubscribe()`.
+        """
+        if not settings.jetstream_enabled:
+            return await self.client.subscribe(subject, queue=durable, cb=cb)
+
+        js = self.client.jetstream()
+        await self._ensure_work_queue_stream(js, settings.jetstream_stream, subject)
+        psub = await js.pull_subscribe(
+            subject,
+            durable=durable,
+            stream=settings.jetstream_stream,
+            config=ConsumerConfig(
+                ack_wait=settings.jetstream_ack_wait,
+                max_deliver=settings.jetstream_max_deliver,
+                max_ack_pending=settings.jetstream_max_ack_pending))
+        sub = WorkQueueSubscription(subject, psub, cb,
+                                    max_in_flight=settings.jetstream_max_in_flight,
+                                    ack_wait=settings.jetstream_ack_wait,
+                                    max_deliver=settings.jetstream_max_deliver,
+                                    backoff=settings.jetstream_backoff)
+        sub.start()
+        return sub
+
+    @staticmethod
+    async def _ensure_work_queue_stream(js: JetStreamContext, stream: str, subject: str):
+        # services add their subjects to the shared stream, retried once when another one created it meanwhile
+        for _ in range(2):
+            try:
+                info = await js.stream_info(stream)
+                if subject not in info.config.subjects:
+                    info.config.subjects.append(subject)
+                    await js.update_stream(info.config)
+                return
+            except NotFoundError:
+                try:
+                    await js.add_stream(name=stream, subjects=[subject], retention=RetentionPolicy.WORK_QUEUE)
+                    return
+                except BadRequestError:
+                    continue
+        raise NATSError(f"could not add {subject} to stream {stream}")
+
+    async def call(
+        self,
+        subject: str,
+        request: BaseModel,
+        ack_model: type[AckT],
+        result_model: type[ResultT],
+        *,
+        reply_prefix: str = SUBJECTS_PROCESSED_HELPER,
+        ack_timeout: float | None = None,
+        timeout: float | None = None,
+    ) -> ResultT:
+        """
+        Send a request which is acknowledged synchronously and answered later on `<reply_prefix>.<req_id>`.
+
+        All calls sharing a reply prefix are served by a single wildcard subscription, replies are routed to
+        the waiting caller by their subject.
+
+        Args:
+            subject: Subject the request is sent to.
+            request: Request message, must carry a `req_id`.
+            ack_model: Model of the synchronous acknowledgement, its `error` field is checked.
+            result_model: Model of the asynchronous result.
+            reply_prefix: Prefix of the subject the result is published on.
+            ack_timeout: Seconds to wait for the acknowledgement, defaults to the connection timeout.
+            timeout: Seconds to wait for the result once acknowledged.
+
+        Raises:
+            NATSError: If the acknowledgement carries an error or the connection is closed meanwhile.
+            asyncio.TimeoutError: If the result does not arrive before the deadline.
+        """
+        if self.client is None:
+            raise NATSError("nats connection is not established")
+        await self._ensure_reply_subscription(reply_prefix)
+
+        reply_subject = f"{reply_prefix}.{request.req_id}"
+        future = asyncio.get_running_loop().create_future()
+        # register before sending, the result may be published before the acknowledgement arrives
+        self._pending[reply_subject] = future
+        try:
+            response = await self.client.request(
+                subject=subject,
+                payload=request.model_dump_json().encode("utf-8"),
+                timeout=ack_timeout or self.timeout
+            )
+            ack = ack_model.model_validate_json(response.data)
+            if getattr(ack, "error", None):
+                raise NATSError(f"Error in response: {ack.error}")
+
+            data = await asyncio.wait_for(future, timeout=timeout)
+            return result_model.model_validate_json(data)
+        finally:
+            self._pending.pop(reply_subject, None)
+
+    async def _ensure_reply_subscription(self, reply_prefix: str):
+        if reply_prefix in self._reply_subs:
+            return
+        async with self._reply_lock:
+            if reply_prefix not in self._reply_subs:
+                self._reply_subs[reply_prefix] = await self.client.subscribe(
+                    f"{reply_prefix}.*", cb=self._route_reply)
+
+    async def _route_reply(self, msg: Msg):
+        future = self._pending.pop(msg.subject, None)
+        if future is not None and not future.done():
+            future.set_result(msg.data)
+
 
 nats_conn: NatsConnection | None = None
 nats_lock = asyncio.Lock()
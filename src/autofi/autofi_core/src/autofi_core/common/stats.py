@@ -1,7 +1,47 @@
-from prometheus_client import Counter, Summary
+from prometheus_client import Counter, Gauge, Summary
 
 db_error_counter = Counter('aegis_db_saving_error', 'Db function error occurs')
 third_party_error_counter = Counter('aegis_third_party_error', 'Third party error occurs',
                                     ['service_name'])
 request_time = Summary('aegis_request_processing_seconds', 'Time spent processing a request',
                        ['service_name', 'method_name'])
+operator_fast_path_counter = Counter('aegis_operator_fast_path_users', 'Users handled by each operator decision path',
+                                     ['path'])
+prompt_tokens_summary = Summary('aegis_prompt_tokens', 'Estimated tokens of the records rendered into prompts',
+                                ['section', 'prompt_format'])
+cache_request_counter = Counter('aegis_cache_requests', 'Cache lookups by result', ['cache_name', 'result'])
+cache_get_time = Summary('aegis_cache_get_seconds', 'Time spent getting a cached value, loads included',
+                         ['cache_name', 'result'])
+dispatch_queue_depth_gauge = Gauge('aegis_dispatch_queue_depth', 'Items queued in a dispatcher', ['dispatcher'])
+dispatch_in_flight_gauge = Gauge('aegis_dispatch_in_flight', 'Items being handled by dispatcher workers', ['dispatcher'])
+dispatch_wait_time = Summary('aegis_dispatch_wait_seconds', 'Time items wait in their key queue before handling',
+                             ['dispatcher'])
+user_operation_coalesce_counter = Counter('aegis_cdp_coalesce_requests',
+                                         'User operation requests sent coalesced or one by one', ['result'])
+user_operation_pending_gauge = Gauge('aegis_cdp_pending_user_operations', 'Submitted user operations not settled yet')
+user_operation_confirmation_time = Summary('aegis_cdp_user_operation_confirmation_seconds',
+                                           'Time from submitting a user operation to its settlement', ['status'])
+user_operation_duplicate_counter = Counter('aegis_cdp_duplicate_requests',
+                                          'Duplicate user operation requests suppressed', ['state'])
+work_queue_message_counter = Counter('aegis_work_queue_messages',
+                                     'Work queue messages acknowledged, negatively acknowledged or terminated',
+                                     ['subject', 'result'])
+agent_shard_counter = Counter('aegis_agent_shards', 'Shards of sharded runs completed, failed or lost', ['result'])
+lock_acquire_counter = Counter('aegis_lock_acquisitions', 'Lock acquisitions by result, lost when they expired held',
+                               ['lock', 'result'])
+lock_held_time = Summary('aegis_lock_held_seconds', 'Time locks are held', ['lock'])
+user_scheduling_counter = Counter('aegis_user_scheduling',
+                                  'Users scheduled by immediate triggers or events, and users run or deferred',
+                                  ['scheduler', 'result'])
+recommendation_reuse_counter = Counter('aegis_recommendation_reuse',
+                                       'Investment expert selections reused from the store or made again', ['result'])
+checkpoint_runs_removed_counter = Counter('aegis_checkpoint_runs_removed',
+                                         'Runs whose checkpoints were removed by compaction', ['kind'])
+checkpoint_time = Summary('aegis_checkpoint_seconds', 'Time spent loading and saving checkpoints', ['operation'])
+checkpoint_writes_batch_summary = Summary('aegis_checkpoint_writes_batch', 'Checkpoint writes saved by one bulk write')
+artifact_counter = Counter('aegis_artifact', 'Texts moved to the artifact store, and references not found', ['result'])
+mcp_tool_call_time = Summary('aegis_mcp_tool_call_seconds',
+                             'Time of pooled and in-process tool calls by phase: spawn, transport and handler',
+                             ['server', 'tool', 'phase'])
+mcp_session_start_time = Summary('aegis_mcp_session_start_seconds', 'Time to start a pooled MCP helper', ['server'])
+mcp_session_restart_counter = Counter('aegis_mcp_session_restarts', 'Pooled MCP helpers restarted', ['server'])
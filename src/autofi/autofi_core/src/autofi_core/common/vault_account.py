@@ -1,7 +1,7 @@
 from eth_account.signers.base import BaseAccount
-from .vault_client import VaultGrpcClient
+from .vault_client import VaultGrpcClient, AsyncVaultGrpcClient
 from eth_account.datastructures import SignedMessage, SignedTransaction
-from eth_account.messages import SignableMessage
+from eth_account.messages import SignableMessage, _hash_eip191_message
 from eth_typing import ChecksumAddress
 from eth_utils import to_checksum_address
 from eth_keys.datatypes import Signature
@@ -37,21 +37,7 @@ class VaultAccount(BaseAccount):
             self.evm_address = self.address
         hash_bytes = HexBytes(message_hash)
         sig_bytes = self.conn.sign_data(self.path, self.evm_address, hash_bytes)
-        r = int.from_bytes(sig_bytes[0:32], byteorder="big")
-        s = int.from_bytes(sig_bytes[32:64], byteorder="big")
-        v_raw = sig_bytes[64]
-        if v_raw in (0, 1):
-            v = v_raw + 27
-        else:
-            v = v_raw
-        fixed_signature_bytes = sig_bytes[:64] + bytes([v])
-        return SignedMessage(
-            message_hash=HexBytes(message_hash),
-            signature=HexBytes(fixed_signature_bytes),
-            r=r,
-            s=s,
-            v=v
-        )
+        return to_signed_message(message_hash, sig_bytes)
 
     def sign_transaction(self, transaction: dict) -> SignedTransaction:
         """
@@ -60,3 +46,54 @@ class VaultAccount(BaseAccount):
         :return:
         """
         raise NotImplementedError("Subclasses must implement this method.")
+
+
+class AsyncVaultAccount(VaultAccount):
+    """
+    A vault account signing through `AsyncVaultGrpcClient`.
+
+    The address must be known before the account is used, either given or resolved by `construct`, since
+    `address` is a property and cannot wait on the vault. Its signing methods are coroutines, to be awaited
+    where `BaseAccount` would return a signature.
+    """
+
+    def __init__(self, conn: AsyncVaultGrpcClient, path: str, address: str):
+        super().__init__(conn, path, address)
+
+    @staticmethod
+    async def construct(conn: AsyncVaultGrpcClient, path: str, address: str = None) -> "AsyncVaultAccount":
+        if address is None:
+            address = await conn.get_address(path)
+        return AsyncVaultAccount(conn, path, address)
+
+    @property
+    def address(self) -> ChecksumAddress:
+        return to_checksum_address(self.evm_address)
+
+    async def unsafe_sign_hash(self, message_hash: bytes) -> SignedMessage:
+        sig_bytes = await self.conn.sign_data(self.path, self.evm_address, HexBytes(message_hash))
+        return to_signed_message(message_hash, sig_bytes)
+
+    async def sign_message(self, signable_message: SignableMessage) -> SignedMessage:
+        return await self.unsafe_sign_hash(_hash_eip191_message(signable_message))
+
+    def sign_transaction(self, transaction: dict) -> SignedTransaction:
+        raise NotImplementedError("AsyncVaultAccount cannot sign transactions, use a VaultAccount.")
+
+
+def to_signed_message(message_hash: bytes, sig_bytes: bytes) -> SignedMessage:
+    r = int.from_bytes(sig_bytes[0:32], byteorder="big")
+    s = int.from_bytes(sig_bytes[32:64], byteorder="big")
+    v_raw = sig_bytes[64]
+    if v_raw in (0, 1):
+        v = v_raw + 27
+    else:
+        v = v_raw
+    fixed_signature_bytes = sig_bytes[:64] + bytes([v])
+    return SignedMessage(
+        message_hash=HexBytes(message_hash),
+        signature=HexBytes(fixed_signature_bytes),
+        r=r,
+        s=s,
+        v=v
+    )
@@ -1,9 +1,28 @@
 from __future__ import annotations
 
+import asyncio
+import itertools
 import grpc
 from autofi_core.grpc_api.gateway import (VaultServiceStub, GetAddressRequest, GetAddressReply,
                                                           SignDataRequest, SignDataReply)
 from .const import CA_CERT_PATH, CLIENT_KEY_PATH, CLIENT_CERT_PATH
+from .logger import logger
+from .stats import request_time, third_party_error_counter
+
+
+def load_channel_credentials() -> grpc.ChannelCredentials:
+    with open(CA_CERT_PATH, 'rb') as f:
+        trusted_cert = f.read()
+    with open(CLIENT_CERT_PATH, 'rb') as f:
+        client_cert = f.read()
+    with open(CLIENT_KEY_PATH, 'rb') as f:
+        client_key = f.read()
+
+    return grpc.ssl_channel_credentials(
+        root_certificates=trusted_cert,
+        private_key=client_key,
+        certificate_chain=client_cert,
+    )
 
 
 class VaultGrpcClient:
@@ -13,20 +32,7 @@ class VaultGrpcClient:
     @staticmethod
     def construct(grpc_server: str) -> VaultGrpcClient:
         client = VaultGrpcClient()
-        with open(CA_CERT_PATH, 'rb') as f:
-            trusted_cert = f.read()
-        with open(CLIENT_CERT_PATH, 'rb') as f:
-            client_cert = f.read()
-        with open(CLIENT_KEY_PATH, 'rb') as f:
-            client_key = f.read()
-
-        credentials = grpc.ssl_channel_credentials(
-            root_certificates=trusted_cert,
-            private_key=client_key,
-            certificate_chain=client_cert,
-        )
-
-        client.channel = grpc.secure_channel(grpc_server, credentials)
+        client.channel = grpc.secure_channel(grpc_server, load_channel_credentials())
         client.stub = VaultServiceStub(client.channel)
         return client
 
@@ -37,3 +43,55 @@ class VaultGrpcClient:
     def sign_data(self, path: str, address: str, data: bytes) -> bytes:
         resp: SignDataReply = self.stub.SignData(SignDataRequest(path=path, address=address, hash=data))
         return resp.signature
+
+
+class AsyncVaultGrpcClient:
+    """
+    Vault client on grpc.aio, so signing does not block the event loop.
+
+    Calls are spread round robin over `pool_size` channels, each call has a deadline of `timeout` seconds and
+    calls failing with UNAVAILABLE are retried up to `retries` times with exponential backoff.
+    """
+
+    def __init__(self, channels: list[grpc.aio.Channel], timeout: float, retries: int, backoff: float):
+        self.channels = channels
+        self.stubs = [VaultServiceStub(channel) for channel in channels]
+        self.next_stub = itertools.cycle(self.stubs)
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+
+    @staticmethod
+    def construct(grpc_server: str, pool_size: int = 4, timeout: float = 5.0, retries: int = 3,
+                  backoff: float = 0.2, credentials: grpc.ChannelCredentials | None = None) -> AsyncVaultGrpcClient:
+        credentials = credentials or load_channel_credentials()
+        # a local subchannel pool per channel, otherwise grpc shares one connection between the pooled channels
+        channels = [grpc.aio.secure_channel(grpc_server, credentials, options=[("grpc.use_local_subchannel_pool", 1)])
+                    for _ in range(max(pool_size, 1))]
+        return AsyncVaultGrpcClient(channels, timeout, retries, backoff)
+
+    async def _call(self, method: str, request):
+        for attempt in range(self.retries + 1):
+            stub = next(self.next_stub)
+            try:
+                with request_time.labels("vault", method).time():
+                    return await getattr(stub, method)(request, timeout=self.timeout)
+            except grpc.aio.AioRpcError as e:
+                if e.code() != grpc.StatusCode.UNAVAILABLE or attempt == self.retries:
+                    third_party_error_counter.labels(service_name="vault").inc()
+                    raise
+                delay = self.backoff * 2 ** attempt
+                logger.warning(f"[AsyncVaultGrpcClient - _call] {method} unavailable, retrying in {delay}s: "
+                               f"{e.details()}")
+                await asyncio.sleep(delay)
+
+    async def get_address(self, path: str) -> str:
+        resp: GetAddressReply = await self._call("GetAddress", GetAddressRequest(path=path))
+        return resp.address
+
+    async def sign_data(self, path: str, address: str, data: bytes) -> bytes:
+        resp: SignDataReply = await self._call("SignData", SignDataRequest(path=path, address=address, hash=data))
+        return resp.signature
+
+    async def close(self):
+        await asyncio.gather(*(channel.close() for channel in self.channels))
@@ -0,0 +1,155 @@
+"""
+Signing throughput of the vault clients, and how long they block the event loop, against a stub vault.
+
+Serves a stub `VaultServiceServicer` on localhost from a child process, answering each SignData after
+`--latency` seconds, then signs `--signatures` hashes
+
+- sync: with `VaultAccount` on `VaultGrpcClient`, one call at a time in the event loop, as before the async client
+- async: with `AsyncVaultAccount` on `AsyncVaultGrpcClient`, `--concurrency` calls at a time over `--pool-size`
+  channels, as CdpSender does
+
+while a ticker measures the event loop lag.
+
+    python benchmarks/vault_signing.py --signatures 2000 --concurrency 64 --pool-size 4 --latency 0.005
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import grpc
+
+from autofi_core.common.vault_account import VaultAccount, AsyncVaultAccount
+from autofi_core.common.vault_client import VaultGrpcClient, AsyncVaultGrpcClient
+from autofi_core.grpc_api.gateway import VaultServiceStub, GetAddressReply, SignDataReply
+from autofi_core.grpc_api.gateway.gateway_pb2_grpc import VaultServiceServicer, add_VaultServiceServicer_to_server
+
+
+ADDRESS = "0x" + "11" * 20
+PATH = "m/44'/60'/0'/0/0"
+
+
+class StubVaultServicer(VaultServiceServicer):
+    """Answers with a fixed address and a well formed signature, after the given latency."""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def GetAddress(self, request, context):
+        return GetAddressReply(address=ADDRESS)
+
+    def SignData(self, request, context):
+        if self.latency:
+            time.sleep(self.latency)
+        return SignDataReply(signature=os.urandom(64) + bytes([1]))
+
+
+class LoopLag:
+    """Largest delay of a ticker scheduled every `interval` seconds, the time the event loop was blocked."""
+
+    def __init__(self, interval: float = 0.001):
+        self.interval = interval
+        self.max_lag = 0.0
+        self.task: asyncio.Task | None = None
+
+    async def _tick(self):
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.max_lag = max(self.max_lag, time.perf_counter() - start - self.interval)
+
+    def __enter__(self):
+        self.task = asyncio.create_task(self._tick())
+        return self
+
+    def __exit__(self, *exc):
+        self.task.cancel()
+
+
+async def bench_sync(target: str, signatures: int) -> tuple[float, float]:
+    client = VaultGrpcClient()
+    client.channel = grpc.insecure_channel(target)
+    client.stub = VaultServiceStub(client.channel)
+    account = VaultAccount(client, PATH)
+    try:
+        with LoopLag() as lag:
+            # let the ticker start before the loop is blocked
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            for _ in range(signatures):
+                account.unsafe_sign_hash(os.urandom(32))
+                # the loop only runs its other tasks between the calls
+                await asyncio.sleep(0)
+            elapsed = time.perf_counter() - start
+        return signatures / elapsed, lag.max_lag
+    finally:
+        client.channel.close()
+
+
+async def bench_async(target: str, signatures: int, concurrency: int, pool_size: int) -> tuple[float, float]:
+    channels = [grpc.aio.insecure_channel(target, options=[("grpc.use_local_subchannel_pool", 1)])
+                for _ in range(pool_size)]
+    client = AsyncVaultGrpcClient(channels, timeout=5.0, retries=3, backoff=0.2)
+    account = await AsyncVaultAccount.construct(client, PATH)
+    # connect every channel before timing
+    await asyncio.gather(*(account.unsafe_sign_hash(os.urandom(32)) for _ in range(pool_size)))
+    remaining = signatures
+
+    async def sign():
+        nonlocal remaining
+        while remaining > 0:
+            remaining -= 1
+            await account.unsafe_sign_hash(os.urandom(32))
+
+    try:
+        with LoopLag() as lag:
+            await asyncio.sleep(0.01)
+            start = time.perf_counter()
+            await asyncio.gather(*(sign() for _ in range(concurrency)))
+            elapsed = time.perf_counter() - start
+        return signatures / elapsed, lag.max_lag
+    finally:
+        await client.close()
+
+
+def serve(latency: float, workers: int, ports: multiprocessing.Queue):
+    server = grpc.server(ThreadPoolExecutor(max_workers=max(workers, 1) + 4))
+    add_VaultServiceServicer_to_server(StubVaultServicer(latency), server)
+    ports.put(server.add_insecure_port("127.0.0.1:0"))
+    server.start()
+    server.wait_for_termination()
+
+
+async def run(args):
+    results = {
+        "sync": await bench_sync(args.target, args.signatures),
+        "async": await bench_async(args.target, args.signatures, args.concurrency, args.pool_size),
+    }
+    print(f"{'client':>8} {'signatures/s':>14} {'max loop lag (ms)':>18}")
+    for client, (throughput, lag) in results.items():
+        print(f"{client:>8} {throughput:>14.0f} {lag * 1000:>18.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--signatures", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--latency", type=float, default=0.005, help="seconds the stub vault takes to sign")
+    args = parser.parse_args()
+
+    # served from another process, which neither the sync client nor the GIL blocks
+    ports = multiprocessing.Queue()
+    server = multiprocessing.Process(target=serve, args=(args.latency, args.concurrency, ports), daemon=True)
+    server.start()
+    args.target = f"127.0.0.1:{ports.get(timeout=30)}"
+    try:
+        asyncio.run(run(args))
+    finally:
+        server.terminate()
+
+
+if __name__ == "__main__":
+    main()
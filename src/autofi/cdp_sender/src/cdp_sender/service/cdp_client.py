@@ -1,19 +1,24 @@
 from __future__ import annotations
 
-from cdp import CdpClient
+from cdp import CdpClient, EvmSmartAccount
 from cdp.evm_call_types import EncodedCall
+from cdp.openapi_client.models.evm_call import EvmCall
+from cdp.openapi_client.models.prepare_user_operation_request import PrepareUserOperationRequest
+from cdp.openapi_client.models.send_user_operation_request import SendUserOperationRequest
+from cdp.utils import ensure_awaitable
 from nats.errors import Error as NatsError
 from web3 import Web3
 from decimal import Decimal
 import asyncio
+import time
+import uuid
 from typing import Callable, TypeVar, Awaitable
 
 from autofi_core import (
     get_nats_connection,
     close_nats_connection,
     NatsConnection,
-    VaultAccount,
-    VaultGrpcClient,
+    AsyncVaultGrpcClient,
     SUBJECTS_PROCESSED,
     SUBJECTS_CDP_SENDER_INGRESS_GET_SMART_ADDRESS,
     SUBJECTS_CDP_SENDER_INGRESS_SEND_USER_OPERATION,
@@ -27,6 +32,12 @@ from autofi_core import (
     get_cdp_chain_id_network,
     config
 )
+from autofi_core.common.nats import WorkQueueSubscription
+from autofi_core.common.stats import user_operation_coalesce_counter, user_operation_duplicate_counter
+from .dispatcher import KeyedDispatcher
+from .idempotency import RequestLedger, REQUEST_COMPLETE
+from .receipts import PendingUserOperation, ReceiptTracker
+from .resolution import SmartAccountResolver
 
 
 T = TypeVar("T")
@@ -73,13 +84,20 @@ class CdpSender:
       - Subscribes to a specific NATS subject to receive `CdpSendUserOperationRequest` messages.
       - Validates chain ID, user operation parameters, and account information.
       - Interacts with blockchain and account services via `cdp_client` and `vault_client`.
-      - Sends asynchronous responses with processing results back to NATS.
+      - Tracks submitted user operations and sends their results back to NATS once they are settled.
 
     Attributes:
         initialized (bool): Whether the sender has been initialized.
         cdp_client (CdpClient | None): Instance of the CDP client.
         nats_conn (NatsConnection | None): Instance of the NATS connection.
-        vault_client (VaultGrpcClient | None): Instance of the Vault gRPC client.
+        vault_client (AsyncVaultGrpcClient | None): Instance of the async Vault gRPC client.
+        dispatcher (KeyedDispatcher | None): Runs user operations, in order per smart account.
+        resolver (SmartAccountResolver | None): Caches smart account resolutions.
+        tracker (ReceiptTracker | None): Tracks submitted user operations until they are settled.
+        ledger (RequestLedger | None): Records request states, so duplicate deliveries are sent once.
+        no_coalesce (set[str]): Requests to send one by one after coalescing them failed.
+        handoffs (dict[str, asyncio.Future]): Requests received and not yet submitted and tracked, or answered,
+            their messages are acknowledged once they are.
 
     Example:
         sender = await CdpSender.construct()
@@ -93,6 +111,13 @@ class CdpSender:
         self.cdp_client = None
         self.nats_conn = None
         self.vault_client = None
+        self.dispatcher = None
+        self.resolver = None
+        self.tracker = None
+        self.ledger = None
+        self.no_coalesce: set[str] = set()
+        self.handoffs: dict[str, asyncio.Future] = {}
+        self.user_operation_sub = None
 
     @classmethod
     async def construct(cls) -> CdpSender:
@@ -109,7 +134,46 @@ class CdpSender:
         sender = cls()
         sender.cdp_client = CdpClient()
         sender.nats_conn = await get_nats_connection(config.nats.url, config.nats.timeout)
-        sender.vault_client = VaultGrpcClient.construct(config.vault.url)
+        sender.vault_client = AsyncVaultGrpcClient.construct(
+            config.vault.url,
+            pool_size=config.vault.pool_size,
+            timeout=config.vault.timeout,
+            retries=config.vault.retries)
+        sender.resolver = SmartAccountResolver(
+            sender.cdp_client,
+            sender.vault_client,
+            ttl=config.cdp.resolution_cache_ttl,
+            max_entries=config.cdp.resolution_cache_size)
+        if config.cdp.resolution_snapshot_path:
+            sender.resolver.warm_up(config.cdp.resolution_snapshot_path)
+        sender.dispatcher = KeyedDispatcher(
+            "cdp_user_operation",
+            sender.process_user_operations,
+            workers=config.cdp.dispatch_workers,
+            max_pending=config.cdp.dispatch_max_pending,
+            max_batch=config.cdp.coalesce_max_requests,
+            window=config.cdp.coalesce_window)
+        owner = str(uuid.uuid4())
+        sender.ledger = RequestLedger(
+            owner=owner,
+            ttl=config.cdp.idempotency_ttl,
+            in_progress_ttl=config.cdp.idempotency_in_progress_ttl,
+            receipt_timeout=config.cdp.receipt_timeout)
+        sender.tracker = ReceiptTracker(
+            sender.cdp_client,
+            sender.on_user_operation_settled,
+            # smart accounts with an operation taken over stay parked until it is settled
+            on_adopted=lambda op: sender.dispatcher.park(op.smart_address),
+            on_lost=lambda op: sender.dispatcher.resume(op.smart_address),
+            owner=owner,
+            owner_ttl=config.cdp.receipt_owner_ttl,
+            poll_interval=config.cdp.receipt_poll_interval,
+            concurrency=config.cdp.receipt_poll_concurrency,
+            timeout=config.cdp.receipt_timeout,
+            req_id_ttl=config.cdp.receipt_req_id_ttl)
+        await sender.tracker.load()
+        sender.dispatcher.start()
+        sender.tracker.start()
         logger.debug("[CdpSender - construct] CdpSender constructed")
         sender.initialized = True
         return sender
@@ -137,26 +201,25 @@ class CdpSender:
                         )
                         await msg.respond(resp.model_dump_json().encode("utf-8"))
                         return
-                    agent_account = VaultAccount(
-                        conn=self.vault_client,
-                        path=request.owner_path,
-                        address=request.owner_address)
                     last_index = int(request.owner_path.strip().split("/")[-1])
-                    account = await self.cdp_client.evm.get_or_create_smart_account(
-                        owner=agent_account,
+                    smart_address = await self.resolver.get_or_create_smart_address(
+                        owner_path=request.owner_path,
+                        owner_address=request.owner_address,
                         name=f"aegis-autofi-dev-{last_index}")
                     resp = CdpSendGetSmartAddressResponse(
                         req_id=req_id,
                         error=None,
-                        smart_address=account.address
+                        smart_address=smart_address
                     )
                     await msg.respond(resp.model_dump_json().encode("utf-8"))
                     logger.debug(f"[CdpSender - get_smart_account] Responded to agent address {address} with "
-                                 f"smart account {account.address} for req {req_id}")
+                                 f"smart account {smart_address} for req {req_id}")
 
                 except Exception as e:
                     logger.error(f"[CdpSender - get_smart_account] Error parsing request: {e}")
                     if req_id is not None:
+                        await self.resolver.invalidate(owner_path=request.owner_path,
+                                                       owner_address=request.owner_address)
                         resp = CdpSendGetSmartAddressResponse(
                             req_id=req_id,
                             error=str(e),
@@ -164,96 +227,272 @@ class CdpSender:
                         await msg.respond(resp.model_dump_json().encode("utf-8"))
 
         async def send_user_operation(msg):
-            with request_time.labels("cdp_sender", "send_user_operation").time():
-                logger.debug(f"[CdpSender - listen] Received message on subject {msg.subject}: {msg.data[:500]}")
-                req_id = None
-                try:
-                    request = CdpSendUserOperationRequest.model_validate_json(msg.data)
-                    req_id = request.req_id
-
-                    network = get_cdp_chain_id_network(str(request.chain_id))
-                    if not network:
-                        logger.error(f"[CdpSender - listen] Unsupported chain_id {request.chain_id} in "
-                                     f"request {req_id}")
-                        await self.response_to_nats(req_id, "Invalid chain_id", None)
-                        return
-
-                    if not request.user_operation_calls:
-                        logger.warning("[CdpSender - listen] No user operation calls provided in the request.")
-                        await self.response_to_nats(req_id, "No user operation calls provided", None)
-                        return
-
-                    calls = []
-                    for c in request.user_operation_calls:
-                        value = 0
-                        try:
-                            value = Decimal(c.value) if c.value not in (None, "") else 0
-                        except Exception:
-                            value = 0
-                        call = EncodedCall(
-                            to=c.to,
-                            data=c.data,
-                            value=Web3.to_wei(value, "wei"))
-                        calls.append(call)
-
-                    account = VaultAccount(
-                        conn=self.vault_client,
-                        path=request.owner_path,
-                        address=request.owner_address)
-                    smart_account = await self.cdp_client.evm.get_smart_account(
-                        address=request.smart_address,
-                        owner=account)
-                    logger.debug(f"[CdpSender - listen] Get cdp smart account {request.smart_address} for "
-                                 f"req {req_id}")
-
-                    async def user_op_flow():
-                        logger.debug(f"[CdpSender - listen] Sending user operation for req {req_id}, "
-                                     f"smart account {smart_account}, calls: {calls}, "
-                                     f"network: {network}")
-
-                        user_operation = await self.cdp_client.evm.send_user_operation(
-                            smart_account=smart_account,
-                            calls=calls,
-                            network=network,
-                            paymaster_url=config.cdp.paymaster_url)
-                        logger.debug(f"[CdpSender - listen] User operation {user_operation.user_op_hash} sent for "
-                                     f"req {req_id}")
-
-                        user_operation = await self.cdp_client.evm.wait_for_user_operation(
-                            smart_account_address=smart_account.address,
-                            user_op_hash=user_operation.user_op_hash,
-                        )
-                        if user_operation.status == "complete":
-                            logger.info(f"[CdpSender - listen] User operation {user_operation.user_op_hash} "
-                                        f"completed for req {req_id}")
-                            tx_hash = user_operation.transaction_hash
-                            logger.info(f"[CdpSender - listen] User operation transaction hash: {tx_hash}")
-                            await self.response_to_nats(req_id, None, tx_hash)
-                        else:
-                            logger.error(f"[CdpSender - listen] User operation {user_operation.user_op_hash} "
-                                         f"failed for req {req_id}")
-                            await self.response_to_nats(req_id, f"User operation failed: {user_operation.status}", None)
-
-                    # Retry user_op_flow up to 3 times
-                    await retry_async(user_op_flow, retries=3, delay=1.0, exceptions=(Exception,))
+            logger.debug(f"[CdpSender - listen] Received message on subject {msg.subject}: {msg.data[:500]}")
+            try:
+                request = CdpSendUserOperationRequest.model_validate_json(msg.data)
+            except Exception as e:
+                logger.error(f"[CdpSender - listen] Error parsing request {msg.subject}: {e}")
+                return
+            claimed, state, response = await self.ledger.claim(request.req_id)
+            if not claimed:
+                # a redelivered request is answered from its recorded response, never sent again
+                logger.warning(f"[CdpSender - listen] Duplicate request {request.req_id} ({state}) suppressed")
+                user_operation_duplicate_counter.labels(state).inc()
+                if state == REQUEST_COMPLETE and response is not None:
+                    await self.publish_response(response)
+                elif state != REQUEST_COMPLETE and config.nats.jetstream_enabled:
+                    # kept until the earlier delivery is answered, or taken over if its replica is gone
+                    raise RuntimeError(f"request {request.req_id} is in progress")
+                return
+            handed_off = asyncio.get_running_loop().create_future()
+            self.handoffs[request.req_id] = handed_off
+            # user operations of a smart account are sent in order to avoid nonce conflicts
+            try:
+                await self.dispatcher.submit(request.smart_address, request)
+            except Exception:
+                # not handed off, a redelivery of the request must not be taken for a duplicate
+                self.handoffs.pop(request.req_id, None)
+                await self.ledger.release(request.req_id)
+                raise
+            # acknowledged once submitted and tracked, or answered, not while it is only queued in this process
+            return handed_off
 
-                except Exception as e:
-                    logger.error(f"[CdpSender - listen] Error processing request {msg.subject}: {e}")
-                    third_party_error_counter.labels(service_name="cdp").inc()
-                    if req_id is not None:
-                        await self.response_to_nats(req_id, str(e), None)
-        await self.nats_conn.client.subscribe(
+        self.user_operation_sub = await self.nats_conn.subscribe_work_queue(
             SUBJECTS_CDP_SENDER_INGRESS_SEND_USER_OPERATION,
-            cb=send_user_operation)
+            durable="cdp_sender",
+            cb=send_user_operation,
+            settings=config.nats)
         logger.debug(f"[CdpSender - listen] Listening for messages on NATS subject "
                      f"{SUBJECTS_CDP_SENDER_INGRESS_SEND_USER_OPERATION}")
 
+        # requests answered synchronously stay on core NATS, replicas share them in a queue group
         await self.nats_conn.client.subscribe(
             SUBJECTS_CDP_SENDER_INGRESS_GET_SMART_ADDRESS,
+            queue="cdp_sender",
             cb=get_smart_account)
         logger.debug(f"[CdpSender - listen] Listening for messages on NATS subject "
                      f"{SUBJECTS_CDP_SENDER_INGRESS_GET_SMART_ADDRESS}")
 
+    async def process_user_operations(self, requests: list[CdpSendUserOperationRequest]):
+        """
+        Submit one user operation for the requests queued for a smart account. Consecutive requests of the
+        same chain are coalesced into it when coalescing is enabled, the others are put back at the front of
+        the queue, since the smart account stays parked until the operation is settled.
+        """
+        first = requests[0]
+        batch = [first]
+        # they may have been queued behind a parked operation for a while
+        await self.ledger.refresh([request.req_id for request in requests])
+        if first.req_id in self.no_coalesce:
+            self.no_coalesce.discard(first.req_id)
+        else:
+            for request in requests[1:]:
+                if request.chain_id != first.chain_id or request.req_id in self.no_coalesce:
+                    break
+                batch.append(request)
+        if len(batch) < len(requests):
+            self.dispatcher.requeue_front(first.smart_address, requests[len(batch):])
+
+        if len(batch) == 1:
+            await self.process_user_operation(first)
+        else:
+            await self.process_coalesced_user_operations(batch)
+
+    @staticmethod
+    def to_encoded_calls(request: CdpSendUserOperationRequest) -> list[EncodedCall]:
+        calls = []
+        for c in request.user_operation_calls:
+            value = 0
+            try:
+                value = Decimal(c.value) if c.value not in (None, "") else 0
+            except Exception:
+                value = 0
+            call = EncodedCall(
+                to=c.to,
+                data=c.data,
+                value=Web3.to_wei(value, "wei"))
+            calls.append(call)
+        return calls
+
+    async def submit_user_operation(self, smart_account: EvmSmartAccount, calls: list[EncodedCall],
+                                    network: str) -> str:
+        """
+        Prepare, sign and send a user operation, as `cdp_client.evm.send_user_operation` does, returning its hash.
+
+        Only the steps before sending are retried in full, they submit nothing. Sending is retried with the same
+        signed operation, which the bundler accepts once at most. When sending still fails, the operation is
+        taken as submitted unless CDP reports it as only prepared, since the failed send may have reached the
+        bundler; the tracker then settles it.
+        """
+        api = self.cdp_client.evm.api_clients.evm_smart_accounts
+        address = smart_account.address
+        prepare_request = PrepareUserOperationRequest(
+            network=network,
+            calls=[EvmCall(to=str(c.to), data=c.data or "0x", value=str(c.value or 0)) for c in calls],
+            paymaster_url=config.cdp.paymaster_url)
+
+        async def prepare_and_sign() -> tuple[str, str]:
+            prepared = await api.prepare_user_operation(address, prepare_request)
+            signed = await ensure_awaitable(smart_account.owners[0].unsafe_sign_hash, prepared.user_op_hash)
+            return prepared.user_op_hash, "0x" + signed.signature.hex()
+
+        user_op_hash, signature = await retry_async(prepare_and_sign, retries=3, delay=1.0)
+        send_request = SendUserOperationRequest(signature=signature)
+        try:
+            await retry_async(lambda: api.send_user_operation(address, user_op_hash, send_request),
+                              retries=3, delay=1.0)
+        except Exception as e:
+            try:
+                user_operation = await self.cdp_client.evm.get_user_operation(address, user_op_hash)
+                # a prepared operation which was never sent is "pending"
+                submitted = user_operation.status != "pending"
+            except Exception:
+                submitted = True
+            if not submitted:
+                raise
+            logger.warning(f"[CdpSender - submit_user_operation] Sending user operation {user_op_hash} failed, "
+                           f"tracking it since it may have been submitted: {e}")
+        return user_op_hash
+
+    async def track_user_operation(self, user_op_hash: str, requests: list[CdpSendUserOperationRequest]):
+        """
+        Park the smart account until the receipt tracker settles the submitted user operation. The message of a
+        single request is acknowledged now, those of coalesced requests once they are answered.
+        """
+        smart_address = requests[0].smart_address
+        # parked before tracking, the operation may settle as soon as it is tracked
+        self.dispatcher.park(smart_address)
+        await self.tracker.track(PendingUserOperation(
+            user_op_hash=user_op_hash,
+            smart_address=smart_address,
+            requests=requests,
+            submitted_at=time.time()))
+        # claimed until the operation settles, within the receipt timeout
+        await self.ledger.refresh([request.req_id for request in requests])
+        # the requests of a coalesced operation are sent again one by one if it fails, their messages stay
+        # unacknowledged until they are answered, so they are redelivered if this replica is gone by then
+        if len(requests) == 1:
+            self.hand_off(requests[0].req_id)
+
+    def hand_off(self, req_id: str):
+        """Let the message of a request be acknowledged, its operation is tracked or it was answered."""
+        handed_off = self.handoffs.pop(req_id, None)
+        if handed_off is not None and not handed_off.done():
+            handed_off.set_result(None)
+
+    async def process_user_operation(self, request: CdpSendUserOperationRequest):
+        with request_time.labels("cdp_sender", "send_user_operation").time():
+            req_id = request.req_id
+            try:
+                network = get_cdp_chain_id_network(str(request.chain_id))
+                if not network:
+                    logger.error(f"[CdpSender - process_user_operation] Unsupported chain_id {request.chain_id} "
+                                 f"in request {req_id}")
+                    await self.response_to_nats(req_id, "Invalid chain_id", None)
+                    return
+
+                if not request.user_operation_calls:
+                    logger.warning("[CdpSender - process_user_operation] No user operation calls provided in the "
+                                   "request.")
+                    await self.response_to_nats(req_id, "No user operation calls provided", None)
+                    return
+
+                calls = self.to_encoded_calls(request)
+                smart_account = await self.resolver.get_smart_account(
+                    smart_address=request.smart_address,
+                    owner_path=request.owner_path,
+                    owner_address=request.owner_address)
+                logger.debug(f"[CdpSender - process_user_operation] Get cdp smart account {request.smart_address} "
+                             f"for req {req_id}")
+
+                logger.debug(f"[CdpSender - process_user_operation] Sending user operation for req {req_id}, "
+                             f"smart account {smart_account}, calls: {calls}, "
+                             f"network: {network}")
+                # the receipt is awaited by the tracker
+                user_op_hash = await self.submit_user_operation(smart_account, calls, network)
+                logger.debug(f"[CdpSender - process_user_operation] User operation "
+                             f"{user_op_hash} sent for req {req_id}")
+                await self.track_user_operation(user_op_hash, [request])
+
+            except Exception as e:
+                logger.error(f"[CdpSender - process_user_operation] Error processing request {req_id}: {e}")
+                third_party_error_counter.labels(service_name="cdp").inc()
+                # resolve the smart account again for the next operation, in case the cached one is stale
+                await self.resolver.invalidate(smart_address=request.smart_address)
+                await self.response_to_nats(req_id, str(e), None)
+
+    async def process_coalesced_user_operations(self, requests: list[CdpSendUserOperationRequest]):
+        """
+        Send the calls of several requests of one smart account and chain as a single user operation.
+
+        The requests are requeued to be sent one by one instead when they cannot be merged or when the merged
+        operation cannot be sent. Settling the merged operation is handled by `on_user_operation_settled`.
+        """
+        req_ids = [r.req_id for r in requests]
+        first = requests[0]
+        network = get_cdp_chain_id_network(str(first.chain_id))
+        if (not network
+                or any(not r.user_operation_calls for r in requests)
+                or any(r.owner_path != first.owner_path or r.owner_address != first.owner_address for r in requests)):
+            self.process_individually(requests)
+            return
+
+        with request_time.labels("cdp_sender", "send_coalesced_user_operation").time():
+            try:
+                calls = [call for r in requests for call in self.to_encoded_calls(r)]
+                smart_account = await self.resolver.get_smart_account(
+                    smart_address=first.smart_address,
+                    owner_path=first.owner_path,
+                    owner_address=first.owner_address)
+                user_op_hash = await self.submit_user_operation(smart_account, calls, network)
+            except Exception as e:
+                logger.warning(f"[CdpSender - process_coalesced_user_operations] Sending reqs {req_ids} as one "
+                               f"user operation failed, sending them one by one: {e}")
+                self.process_individually(requests)
+                return
+            logger.debug(f"[CdpSender - process_coalesced_user_operations] User operation "
+                         f"{user_op_hash} sent for reqs {req_ids}")
+            await self.track_user_operation(user_op_hash, requests)
+
+    def process_individually(self, requests: list[CdpSendUserOperationRequest]):
+        """Put the requests back at the front of the smart account queue, to be sent one by one."""
+        user_operation_coalesce_counter.labels("individual").inc(len(requests))
+        self.no_coalesce.update(r.req_id for r in requests)
+        self.dispatcher.requeue_front(requests[0].smart_address, requests)
+
+    async def on_user_operation_settled(self, op: PendingUserOperation, status: str, tx_hash: str | None):
+        """
+        Answer the requests of a settled user operation and resume its smart account.
+
+        A coalesced operation which ended failed or dropped left no effect on chain, its requests are sent one
+        by one instead. A timed out operation may still land, so the timeout is reported to every request.
+        """
+        req_ids = [r.req_id for r in op.requests]
+        try:
+            if status == "complete":
+                logger.info(f"[CdpSender - on_user_operation_settled] User operation {op.user_op_hash} completed "
+                            f"for reqs {req_ids}, transaction hash: {tx_hash}")
+                if len(op.requests) > 1:
+                    user_operation_coalesce_counter.labels("coalesced").inc(len(op.requests))
+                for req_id in req_ids:
+                    await self.response_to_nats(req_id, None, tx_hash)
+                return
+
+            if len(op.requests) > 1 and status != "timeout":
+                logger.warning(f"[CdpSender - on_user_operation_settled] User operation {op.user_op_hash} of reqs "
+                               f"{req_ids} ended {status}, sending them one by one")
+                self.process_individually(op.requests)
+                return
+
+            logger.error(f"[CdpSender - on_user_operation_settled] User operation {op.user_op_hash} of reqs "
+                         f"{req_ids} ended {status}")
+            third_party_error_counter.labels(service_name="cdp").inc()
+            await self.resolver.invalidate(smart_address=op.smart_address)
+            for req_id in req_ids:
+                await self.response_to_nats(req_id, f"User operation failed: {status}", None)
+        finally:
+            await self.dispatcher.resume(op.smart_address)
+
     async def response_to_nats(self, req_id: str, error: str | None, tx_hash: str | None = None):
         if error:
             logger.warning(f"[CdpSender - response_to_nats] Failed when processing request {req_id}: {error}")
@@ -262,14 +501,19 @@ class CdpSender:
             error=error,
             transaction_hash=tx_hash
         )
-        subject = f"{SUBJECTS_PROCESSED}.{req_id}"
+        await self.ledger.complete(response)
+        self.hand_off(req_id)
+        await self.publish_response(response)
+
+    async def publish_response(self, response: CdpSendUserOperationResponse):
+        subject = f"{SUBJECTS_PROCESSED}.{response.req_id}"
         try:
             await self.nats_conn.client.publish(
                 subject=subject,
                 payload=response.model_dump_json().encode("utf-8")
             )
         except NatsError as e:
-            logger.error(f"[CdpSender - response_to_nats] {e}")
+            logger.error(f"[CdpSender - publish_response] {e}")
             third_party_error_counter.labels(service_name="nats").inc()
 
     async def close(self):
@@ -277,8 +521,22 @@ class CdpSender:
             logger.warning("[CdpSender - close] CdpSender is not initialized, nothing to close.")
             return
         try:
+            # stop taking user operations, then let the queued ones finish and publish their results
+            if isinstance(self.user_operation_sub, WorkQueueSubscription):
+                await self.user_operation_sub.unsubscribe(timeout=config.nats.async_response_timeout)
+            elif self.user_operation_sub:
+                await self.user_operation_sub.unsubscribe()
+            # parked smart accounts wait for their receipts, the ones still pending are taken over by another replica
+            await self.dispatcher.close(timeout=config.nats.async_response_timeout)
+            # never sent, their messages were not acknowledged and are redelivered to another replica
+            for request in self.dispatcher.take_queued():
+                await self.ledger.release(request.req_id)
+            await self.tracker.close()
+            if config.cdp.resolution_snapshot_path:
+                self.resolver.save_snapshot(config.cdp.resolution_snapshot_path)
             await close_nats_connection()
             await self.cdp_client.close()
+            await self.vault_client.close()
         except Exception as e:
             logger.error(f"[CdpSender - close] Error closing CdpSender: {e}")
 
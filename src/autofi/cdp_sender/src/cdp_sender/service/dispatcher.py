@@ -0,0 +1,161 @@
+import asyncio
+import time
+from collections import deque
+from typing import Awaitable, Callable, Generic, TypeVar
+
+from autofi_core import logger
+from autofi_core.common.stats import (dispatch_queue_depth_gauge, dispatch_in_flight_gauge,
+                                      dispatch_wait_time)
+
+
+T = TypeVar("T")
+
+
+class KeyedDispatcher(Generic[T]):
+    """
+    Runs submitted items on a bounded pool of workers, in FIFO order per key and concurrently across keys.
+
+    A key is owned by at most one worker at a time. After each batch the worker puts the key back at the end
+    of the ready queue if it still has items, so a busy key cannot starve the others.
+
+    With `max_batch` above 1, a worker waits `window` seconds after taking the first item of a key and hands
+    the handler up to `max_batch` items of that key at once, in order, so they can be coalesced.
+
+    A key can be parked, e.g. while an operation it submitted is unconfirmed: its items stay queued without
+    holding a worker until it is resumed as many times as it was parked.
+
+    `submit` waits while `max_pending` items are queued or running, pushing back on the NATS subscription
+    instead of buffering without bound.
+    """
+
+    def __init__(self, name: str, handler: Callable[[list[T]], Awaitable[None]], workers: int, max_pending: int,
+                 max_batch: int = 1, window: float = 0.0):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.max_pending = max_pending
+        self.max_batch = max(max_batch, 1)
+        self.window = window
+        self.queues: dict[str, deque[tuple[float, T]]] = {}
+        self.ready: asyncio.Queue[str] = asyncio.Queue()
+        self.active: set[str] = set()
+        self.parked: dict[str, int] = {}
+        self.outstanding = 0
+        self.changed = asyncio.Condition()
+        self.tasks: list[asyncio.Task] = []
+        self.in_flight = 0
+        self.closed = False
+
+    def start(self):
+        self.tasks = [asyncio.create_task(self._work()) for _ in range(self.workers)]
+
+    def depth(self) -> int:
+        return sum(len(q) for q in self.queues.values())
+
+    async def submit(self, key: str, item: T):
+        if self.closed:
+            raise RuntimeError(f"dispatcher {self.name} is closed")
+        async with self.changed:
+            await self.changed.wait_for(lambda: self.outstanding < self.max_pending)
+            self.outstanding += 1
+        self._enqueue(key, [item], front=False)
+
+    def requeue_front(self, key: str, items: list[T]):
+        """Put items back at the front of the key's queue, in order, e.g. to retry them differently."""
+        self.outstanding += len(items)
+        self._enqueue(key, items, front=True)
+
+    def _enqueue(self, key: str, items: list[T], front: bool):
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+            # a key becomes ready when its first item arrives, afterwards the owning worker requeues it
+            if key not in self.parked:
+                self.ready.put_nowait(key)
+        now = time.monotonic()
+        if front:
+            queue.extendleft((now, item) for item in reversed(items))
+        else:
+            queue.extend((now, item) for item in items)
+        dispatch_queue_depth_gauge.labels(self.name).inc(len(items))
+
+    def take_queued(self) -> list[T]:
+        """Remove and return the items not handed to a worker yet, e.g. when they are left to another process."""
+        items = []
+        for key, queue in list(self.queues.items()):
+            dispatch_queue_depth_gauge.labels(self.name).dec(len(queue))
+            items.extend(item for _, item in queue)
+            queue.clear()
+            if key not in self.active:
+                del self.queues[key]
+        self.outstanding -= len(items)
+        return items
+
+    def park(self, key: str):
+        self.parked[key] = self.parked.get(key, 0) + 1
+
+    async def resume(self, key: str):
+        async with self.changed:
+            count = self.parked.get(key, 0) - 1
+            if count > 0:
+                self.parked[key] = count
+                return
+            self.parked.pop(key, None)
+            self.changed.notify_all()
+        # a worker owning the key requeues it itself when its batch is done
+        if key in self.active:
+            return
+        queue = self.queues.get(key)
+        if queue:
+            self.ready.put_nowait(key)
+        elif queue is not None:
+            del self.queues[key]
+
+    async def _work(self):
+        while True:
+            key = await self.ready.get()
+            self.active.add(key)
+            queue = self.queues[key]
+            if self.max_batch > 1 and self.window > 0 and len(queue) < self.max_batch:
+                # the key stays owned by this worker, later items of the key queue up behind the first one
+                await asyncio.sleep(self.window)
+            batch = []
+            now = time.monotonic()
+            while queue and len(batch) < self.max_batch:
+                submitted_at, item = queue.popleft()
+                dispatch_wait_time.labels(self.name).observe(now - submitted_at)
+                batch.append(item)
+            dispatch_queue_depth_gauge.labels(self.name).dec(len(batch))
+            self.in_flight += len(batch)
+            dispatch_in_flight_gauge.labels(self.name).inc(len(batch))
+            try:
+                await self.handler(batch)
+            except Exception as e:
+                logger.error(f"[KeyedDispatcher - _work] {self.name} handler failed for key {key}: {e}")
+            finally:
+                self.in_flight -= len(batch)
+                dispatch_in_flight_gauge.labels(self.name).dec(len(batch))
+                self.active.discard(key)
+                # a parked key keeps its queue, even empty, so new items do not make it ready
+                if key not in self.parked:
+                    if queue:
+                        self.ready.put_nowait(key)
+                    else:
+                        del self.queues[key]
+                async with self.changed:
+                    self.outstanding -= len(batch)
+                    self.changed.notify_all()
+
+    async def close(self, timeout: float | None = None):
+        """Stop accepting items and wait up to `timeout` seconds for the queued and parked ones to finish."""
+        self.closed = True
+        try:
+            async with self.changed:
+                await asyncio.wait_for(
+                    self.changed.wait_for(lambda: self.outstanding == 0 and not self.parked), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"[KeyedDispatcher - close] {self.name} closed with {self.depth()} queued, "
+                           f"{self.in_flight} running and {len(self.parked)} parked keys")
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
@@ -0,0 +1,128 @@
+import json
+
+from autofi_core import CdpSendUserOperationResponse, get_redis_connection, logger, third_party_error_counter
+from .receipts import TRACKER_HEARTBEAT_KEY, PENDING_USER_OPERATIONS_KEY, USER_OPERATION_BY_REQ_ID_KEY
+
+
+REQUEST_STATE_KEY = "aegis_cdp:request:{req_id}"
+REQUEST_IN_PROGRESS = "in_progress"
+REQUEST_COMPLETE = "complete"
+
+TAKE_OVER_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    redis.call("set", KEYS[1], ARGV[2], "EX", ARGV[3])
+    return 1
+else
+    return 0
+end
+"""
+
+REFRESH_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("expire", KEYS[1], ARGV[2])
+else
+    return 0
+end
+"""
+
+
+class RequestLedger:
+    """
+    Records the state of user operation requests by `req_id`, so a request delivered twice is sent once.
+
+    A request is claimed with `SET NX` when it is first received and kept in progress for `in_progress_ttl`
+    seconds, renewed by `refresh` when it is dispatched and when its operation is tracked, then its final
+    response is kept for `ttl` seconds so duplicates can be answered from it. A tracked operation settles within
+    the receipt timeout, which `in_progress_ttl` must exceed.
+    Redis errors are logged and the request is processed, as without the ledger.
+
+    A claim records its `owner`, the replica whose receipt tracker heartbeat shows it alive. The claim of a
+    replica which is gone is taken over by a redelivery of the request, which it would have lost otherwise,
+    unless the request has an operation still pending, which the tracker of another replica adopts and settles.
+    """
+
+    def __init__(self, owner: str, ttl: int, in_progress_ttl: int, receipt_timeout: int):
+        if in_progress_ttl <= receipt_timeout:
+            raise ValueError(f"Invalid idempotency_in_progress_ttl: {in_progress_ttl}s does not exceed "
+                             f"receipt_timeout {receipt_timeout}s, requests would be sent again while tracked.")
+        self.owner = owner
+        self.ttl = ttl
+        self.in_progress_ttl = in_progress_ttl
+
+    def _claim(self) -> str:
+        return json.dumps({"state": REQUEST_IN_PROGRESS, "owner": self.owner})
+
+    async def claim(self, req_id: str) -> tuple[bool, str | None, CdpSendUserOperationResponse | None]:
+        """
+        Claim a request for processing.
+
+        Returns:
+            Whether the request was claimed, else the state of the earlier delivery and its response once
+            complete.
+        """
+        key = REQUEST_STATE_KEY.format(req_id=req_id)
+        claim = self._claim()
+        try:
+            redis = await get_redis_connection()
+            claimed = await redis.redis_client.set(key, claim, nx=True, ex=self.in_progress_ttl)
+            if claimed:
+                return True, None, None
+            data = await redis.redis_client.get(key)
+            if data is None:
+                # expired in between, the earlier delivery is given up on
+                return await self.claim(req_id)
+            record = json.loads(data)
+            owner = record.get("owner")
+            if record["state"] == REQUEST_IN_PROGRESS and owner and owner != self.owner \
+                    and not await redis.redis_client.exists(TRACKER_HEARTBEAT_KEY.format(owner=owner)) \
+                    and not await self._has_pending_operation(redis.redis_client, req_id):
+                if await redis.redis_client.eval(TAKE_OVER_SCRIPT, 1, key, data, claim, self.in_progress_ttl) == 1:
+                    logger.warning(f"[RequestLedger - claim] Took request {req_id} over from replica {owner}")
+                    return True, None, None
+                return await self.claim(req_id)
+        except Exception as e:
+            third_party_error_counter.labels(service_name="redis").inc()
+            logger.error(f"[RequestLedger - claim] Could not claim request {req_id}: {e}")
+            return True, None, None
+
+        response = record.get("response")
+        return (False, record["state"],
+                CdpSendUserOperationResponse.model_validate(response) if response is not None else None)
+
+    @staticmethod
+    async def _has_pending_operation(redis_client, req_id: str) -> bool:
+        user_op_hash = await redis_client.get(USER_OPERATION_BY_REQ_ID_KEY.format(req_id=req_id))
+        return user_op_hash is not None and bool(await redis_client.hexists(PENDING_USER_OPERATIONS_KEY, user_op_hash))
+
+    async def refresh(self, req_ids: list[str]):
+        """Keep the requests claimed by this replica in progress for another `in_progress_ttl` seconds."""
+        try:
+            redis = await get_redis_connection()
+            async with redis.redis_client.pipeline(transaction=False) as pipe:
+                for req_id in req_ids:
+                    pipe.eval(REFRESH_SCRIPT, 1, REQUEST_STATE_KEY.format(req_id=req_id), self._claim(),
+                              self.in_progress_ttl)
+                await pipe.execute()
+        except Exception as e:
+            third_party_error_counter.labels(service_name="redis").inc()
+            logger.error(f"[RequestLedger - refresh] Could not refresh requests {req_ids}: {e}")
+
+    async def release(self, req_id: str):
+        """Forget a claimed request which was not processed, so its redelivery is processed."""
+        try:
+            redis = await get_redis_connection()
+            await redis.redis_client.delete(REQUEST_STATE_KEY.format(req_id=req_id))
+        except Exception as e:
+            third_party_error_counter.labels(service_name="redis").inc()
+            logger.error(f"[RequestLedger - release] Could not release request {req_id}: {e}")
+
+    async def complete(self, response: CdpSendUserOperationResponse):
+        key = REQUEST_STATE_KEY.format(req_id=response.req_id)
+        try:
+            redis = await get_redis_connection()
+            await redis.redis_client.set(
+                key, json.dumps({"state": REQUEST_COMPLETE, "response": response.model_dump(mode="json")}),
+                ex=self.ttl)
+        except Exception as e:
+            third_party_error_counter.labels(service_name="redis").inc()
+            logger.error(f"[RequestLedger - complete] Could not record response of request {response.req_id}: {e}")
@@ -0,0 +1,215 @@
+import asyncio
+import time
+from typing import Awaitable, Callable
+
+from cdp import CdpClient
+from pydantic import BaseModel
+
+from autofi_core import CdpSendUserOperationRequest, get_redis_connection, logger, third_party_error_counter
+from autofi_core.common.stats import user_operation_pending_gauge, user_operation_confirmation_time
+
+
+PENDING_USER_OPERATIONS_KEY = "aegis_cdp:pending_user_operations"
+PENDING_USER_OPERATION_OWNERS_KEY = "aegis_cdp:pending_user_operation_owners"
+TRACKER_HEARTBEAT_KEY = "aegis_cdp:receipt_tracker:{owner}"
+USER_OPERATION_BY_REQ_ID_KEY = "aegis_cdp:user_operation:{req_id}"
+USER_OPERATION_SETTLED_STATUSES = ("complete", "failed", "dropped")
+
+# takes a pending operation over if it is still pending and still owned by the given owner, "" for none
+ADOPT_SCRIPT = """
+if redis.call("hexists", KEYS[1], ARGV[1]) == 0 then
+    return 0
+end
+if (redis.call("hget", KEYS[2], ARGV[1]) or "") ~= ARGV[2] then
+    return 0
+end
+redis.call("hset", KEYS[2], ARGV[1], ARGV[3])
+return 1
+"""
+
+
+def _text(value: bytes | str) -> str:
+    return value.decode("utf-8") if isinstance(value, bytes) else value
+
+
+class PendingUserOperation(BaseModel):
+    user_op_hash: str
+    smart_address: str
+    requests: list[CdpSendUserOperationRequest]
+    submitted_at: float
+
+
+class ReceiptTracker:
+    """
+    Tracks submitted user operations until they are confirmed, so submitting does not wait for confirmation.
+
+    Pending operations are kept in a Redis hash shared by the replicas, each owned by the replica tracking it.
+    Every `poll_interval` seconds the statuses of the operations this replica owns are checked, up to
+    `concurrency` at a time, and `on_settled` is called with each operation which completed, failed, was dropped
+    or timed out. Removing the operation from the hash claims its settlement, so it is settled once.
+
+    A replica refreshes its heartbeat every poll and the operations of a replica whose heartbeat is older than
+    `owner_ttl` seconds are taken over by another one, on start and every `owner_ttl` seconds, so a restart or a
+    dead replica does not lose them. `on_adopted` is called with each operation taken over, `on_lost` with each
+    operation settled elsewhere while this replica still tracked it.
+    """
+
+    def __init__(self, cdp_client: CdpClient,
+                 on_settled: Callable[[PendingUserOperation, str, str | None], Awaitable[None]],
+                 on_adopted: Callable[[PendingUserOperation], None],
+                 on_lost: Callable[[PendingUserOperation], Awaitable[None]],
+                 owner: str, owner_ttl: int, poll_interval: float, concurrency: int, timeout: float,
+                 req_id_ttl: int):
+        self.cdp_client = cdp_client
+        self.on_settled = on_settled
+        self.on_adopted = on_adopted
+        self.on_lost = on_lost
+        self.owner = owner
+        self.owner_ttl = owner_ttl
+        self.poll_interval = poll_interval
+        self.concurrency = asyncio.Semaphore(concurrency)
+        self.timeout = timeout
+        self.req_id_ttl = req_id_ttl
+        self.pending: dict[str, PendingUserOperation] = {}
+        self.wake_up = asyncio.Event()
+        self.task: asyncio.Task | None = None
+        self.owner_task: asyncio.Task | None = None
+
+    async def load(self) -> list[PendingUserOperation]:
+        """Take over the operations left pending by a previous run or by replicas which are gone."""
+        redis = await get_redis_connection()
+        await self._heartbeat(redis.redis_client)
+        adopted = await self._adopt(redis.redis_client)
+        logger.info(f"[ReceiptTracker - load] Took over {len(adopted)} pending user operations")
+        return adopted
+
+    async def _heartbeat(self, redis_client):
+        await redis_client.set(TRACKER_HEARTBEAT_KEY.format(owner=self.owner), "1", ex=self.owner_ttl)
+
+    async def _adopt(self, redis_client) -> list[PendingUserOperation]:
+        records = await redis_client.hgetall(PENDING_USER_OPERATIONS_KEY)
+        owners = {_text(user_op_hash): _text(owner)
+                  for user_op_hash, owner in (await redis_client.hgetall(PENDING_USER_OPERATION_OWNERS_KEY)).items()}
+        alive: dict[str, bool] = {self.owner: True}
+        adopted = []
+        for user_op_hash, data in records.items():
+            user_op_hash = _text(user_op_hash)
+            if user_op_hash in self.pending:
+                continue
+            owner = owners.get(user_op_hash) or ""
+            if owner and owner not in alive:
+                alive[owner] = await redis_client.exists(TRACKER_HEARTBEAT_KEY.format(owner=owner)) == 1
+            if owner and alive[owner]:
+                continue
+            if await redis_client.eval(ADOPT_SCRIPT, 2, PENDING_USER_OPERATIONS_KEY,
+                                       PENDING_USER_OPERATION_OWNERS_KEY, user_op_hash, owner, self.owner) != 1:
+                continue
+            op = PendingUserOperation.model_validate_json(data)
+            self.pending[op.user_op_hash] = op
+            self.on_adopted(op)
+            adopted.append(op)
+        user_operation_pending_gauge.set(len(self.pending))
+        return adopted
+
+    def start(self):
+        self.task = asyncio.create_task(self._poll())
+        self.owner_task = asyncio.create_task(self._own())
+
+    async def track(self, op: PendingUserOperation):
+        self.pending[op.user_op_hash] = op
+        user_operation_pending_gauge.set(len(self.pending))
+        try:
+            redis = await get_redis_connection()
+            async with redis.redis_client.pipeline(transaction=False) as pipe:
+                pipe.hset(PENDING_USER_OPERATIONS_KEY, op.user_op_hash, op.model_dump_json())
+                pipe.hset(PENDING_USER_OPERATION_OWNERS_KEY, op.user_op_hash, self.owner)
+                for request in op.requests:
+                    pipe.set(USER_OPERATION_BY_REQ_ID_KEY.format(req_id=request.req_id), op.user_op_hash,
+                             ex=self.req_id_ttl)
+                await pipe.execute()
+        except Exception as e:
+            third_party_error_counter.labels(service_name="redis").inc()
+            logger.error(f"[ReceiptTracker - track] Could not persist user operation {op.user_op_hash}: {e}")
+        self.wake_up.set()
+
+    async def _own(self):
+        # apart from the polls, which may take longer than `owner_ttl` with many operations pending
+        adopted_at = time.monotonic()
+        while True:
+            await asyncio.sleep(self.owner_ttl / 3)
+            try:
+                redis = await get_redis_connection()
+                await self._heartbeat(redis.redis_client)
+                if time.monotonic() - adopted_at >= self.owner_ttl:
+                    adopted_at = time.monotonic()
+                    if await self._adopt(redis.redis_client):
+                        logger.warning("[ReceiptTracker - _own] Took over user operations of replicas which are gone")
+                        self.wake_up.set()
+            except Exception as e:
+                third_party_error_counter.labels(service_name="redis").inc()
+                logger.error(f"[ReceiptTracker - _own] Could not refresh the owned user operations: {e}")
+
+    async def _poll(self):
+        while True:
+            try:
+                await asyncio.wait_for(self.wake_up.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake_up.clear()
+            if self.pending:
+                await asyncio.gather(*(self._check(op) for op in list(self.pending.values())))
+
+    async def _check(self, op: PendingUserOperation):
+        async with self.concurrency:
+            try:
+                user_operation = await self.cdp_client.evm.get_user_operation(op.smart_address, op.user_op_hash)
+            except Exception as e:
+                third_party_error_counter.labels(service_name="cdp").inc()
+                logger.warning(f"[ReceiptTracker - _check] Could not get user operation {op.user_op_hash}: {e}")
+                user_operation = None
+
+        if user_operation is not None and user_operation.status in USER_OPERATION_SETTLED_STATUSES:
+            await self._settle(op, user_operation.status, user_operation.transaction_hash)
+        elif time.time() - op.submitted_at > self.timeout:
+            await self._settle(op, "timeout", None)
+
+    async def _settle(self, op: PendingUserOperation, status: str, tx_hash: str | None):
+        if self.pending.pop(op.user_op_hash, None) is None:
+            return
+        user_operation_pending_gauge.set(len(self.pending))
+        try:
+            redis = await get_redis_connection()
+            async with redis.redis_client.pipeline(transaction=True) as pipe:
+                pipe.hdel(PENDING_USER_OPERATIONS_KEY, op.user_op_hash)
+                pipe.hdel(PENDING_USER_OPERATION_OWNERS_KEY, op.user_op_hash)
+                removed, _ = await pipe.execute()
+        except Exception as e:
+            third_party_error_counter.labels(service_name="redis").inc()
+            logger.error(f"[ReceiptTracker - _settle] Could not remove user operation {op.user_op_hash}: {e}")
+            removed = 1
+        if removed != 1:
+            # settled by the replica which took it over
+            logger.warning(f"[ReceiptTracker - _settle] User operation {op.user_op_hash} already settled elsewhere")
+            await self.on_lost(op)
+            return
+        user_operation_confirmation_time.labels(status).observe(time.time() - op.submitted_at)
+        try:
+            await self.on_settled(op, status, tx_hash)
+        except Exception as e:
+            logger.error(f"[ReceiptTracker - _settle] Error settling user operation {op.user_op_hash}: {e}")
+
+    async def close(self):
+        for task in (self.task, self.owner_task):
+            if task:
+                task.cancel()
+                try:
+                    await task
+                except asyncio.CancelledError:
+                    pass
+        try:
+            # the operations still pending are taken over without waiting for the heartbeat to expire
+            redis = await get_redis_connection()
+            await redis.redis_client.delete(TRACKER_HEARTBEAT_KEY.format(owner=self.owner))
+        except Exception as e:
+            third_party_error_counter.labels(service_name="redis").inc()
+            logger.error(f"[ReceiptTracker - close] Could not remove the heartbeat: {e}")
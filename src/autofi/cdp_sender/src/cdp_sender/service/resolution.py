@@ -0,0 +1,106 @@
+import json
+import time
+
+from cdp import CdpClient, EvmSmartAccount
+
+from autofi_core import AsyncVaultAccount, AsyncVaultGrpcClient, logger
+from autofi_core.common.cache import TieredCache
+
+
+class SmartAccountResolver:
+    """
+    Resolves owner paths and smart addresses to CDP smart account handles, caching the results.
+
+    The owner path -> owner address -> smart address mapping never changes once the smart account is created,
+    so the records are kept in a `TieredCache` for `ttl` seconds, the handles being rebuilt from the records
+    without calling CDP. Entries are invalidated when an operation using them fails.
+
+    A snapshot file, a JSON list of smart account records, can be loaded at startup to warm the in-process tier.
+    """
+
+    def __init__(self, cdp_client: CdpClient, vault_client: AsyncVaultGrpcClient, ttl: int, max_entries: int):
+        self.cdp_client = cdp_client
+        self.vault_client = vault_client
+        self.ttl = ttl
+        self.smart_accounts: TieredCache[EvmSmartAccount] = TieredCache(
+            "cdp_smart_account", encode=self.encode, decode=self.decode, max_entries=max_entries)
+        self.smart_addresses: TieredCache[str] = TieredCache(
+            "cdp_smart_address", encode=lambda address: address, decode=lambda address: address,
+            max_entries=max_entries)
+
+    @staticmethod
+    def encode(account: EvmSmartAccount) -> str:
+        owner = account.owners[0]
+        return json.dumps({
+            "address": account.address,
+            "name": account.name,
+            "policies": account.policies,
+            "owner_path": owner.path,
+            "owner_address": owner.evm_address,
+        })
+
+    def decode(self, data: str) -> EvmSmartAccount:
+        record = json.loads(data)
+        owner = AsyncVaultAccount(self.vault_client, record["owner_path"], record["owner_address"])
+        return EvmSmartAccount(record["address"], owner, record["name"], record["policies"],
+                               self.cdp_client.evm.api_clients)
+
+    def expires_at(self) -> float:
+        return time.time() + self.ttl
+
+    @staticmethod
+    def owner_key(owner_path: str, owner_address: str) -> str:
+        return f"{owner_path}:{owner_address.lower()}"
+
+    def warm_up(self, snapshot_path: str):
+        try:
+            with open(snapshot_path, "r") as f:
+                records = json.load(f)
+        except FileNotFoundError:
+            logger.warning(f"[SmartAccountResolver - warm_up] Snapshot {snapshot_path} not found")
+            return
+        expires_at = self.expires_at()
+        for record in records:
+            account = self.decode(json.dumps(record))
+            self.smart_accounts.put_local(account.address.lower(), account, expires_at)
+            self.smart_addresses.put_local(self.owner_key(record["owner_path"], record["owner_address"]),
+                                           account.address, expires_at)
+        logger.info(f"[SmartAccountResolver - warm_up] Loaded {len(records)} smart accounts from {snapshot_path}")
+
+    def save_snapshot(self, snapshot_path: str):
+        """Write the smart accounts of the in-process tier in the format read by `warm_up`."""
+        records = [json.loads(self.encode(account)) for _, account in self.smart_accounts.entries.values()]
+        with open(snapshot_path, "w") as f:
+            json.dump(records, f)
+        logger.info(f"[SmartAccountResolver - save_snapshot] Saved {len(records)} smart accounts to {snapshot_path}")
+
+    async def get_smart_account(self, smart_address: str, owner_path: str, owner_address: str) -> EvmSmartAccount:
+        key = smart_address.lower()
+
+        async def load() -> EvmSmartAccount:
+            owner = await AsyncVaultAccount.construct(self.vault_client, owner_path, owner_address)
+            return await self.cdp_client.evm.get_smart_account(address=smart_address, owner=owner)
+
+        account = await self.smart_accounts.get_or_load(key, load, self.expires_at())
+        if account.owners[0].path != owner_path or account.owners[0].address.lower() != owner_address.lower():
+            logger.warning(f"[SmartAccountResolver - get_smart_account] Owner of {smart_address} changed, reloading")
+            await self.smart_accounts.invalidate(key)
+            account = await self.smart_accounts.get_or_load(key, load, self.expires_at())
+        return account
+
+    async def get_or_create_smart_address(self, owner_path: str, owner_address: str, name: str) -> str:
+        async def load() -> str:
+            owner = await AsyncVaultAccount.construct(self.vault_client, owner_path, owner_address)
+            account = await self.cdp_client.evm.get_or_create_smart_account(owner=owner, name=name)
+            await self.smart_accounts.put(account.address.lower(), account, self.expires_at())
+            return account.address
+
+        return await self.smart_addresses.get_or_load(
+            self.owner_key(owner_path, owner_address), load, self.expires_at())
+
+    async def invalidate(self, smart_address: str | None = None, owner_path: str | None = None,
+                         owner_address: str | None = None):
+        if smart_address:
+            await self.smart_accounts.invalidate(smart_address.lower())
+        if owner_path and owner_address:
+            await self.smart_addresses.invalidate(self.owner_key(owner_path, owner_address))